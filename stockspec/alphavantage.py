@@ -1,20 +1,25 @@
+import io
 import csv
+import queue
 import logging
+import threading
 import requests
-from itertools import cycle
-from random import randrange
-from time import sleep
+from collections import Counter
+from itertools import chain
+from time import sleep, monotonic
 from urllib.parse import urlencode
-from typing import List, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
-import pytz
 from django.conf import settings
-from django.utils import timezone
-from django.utils.dateparse import parse_datetime, parse_date
+from django.db import connection
 
 from stockspec.exceptions import APIRateLimited
-from stockspec.portfolio.models import Ticker, StockPrice
+from stockspec.ingestion.cache import ResponseCache, is_throttled
+from stockspec.ingestion.models import CompanyInfoTask, IngestionRun
+from stockspec.ingestion.keys import KeyManager
+from stockspec.ingestion.sink import PriceSink
+from stockspec.portfolio.models import Ticker
 
 logger = logging.getLogger(__name__)
 
@@ -22,196 +27,331 @@ logger = logging.getLogger(__name__)
 class AlphaVantage:
     """A simple interface to the AlphaVantage api."""
 
-    API_URL = "https://www.alphavantage.co/query?"
     REQUEST_TIMEOUT = 5  # in seconds
     MAX_RETRIES = 3
-
-    def __init__(self, api_key_pool: List[str]):
+    STREAM_CHUNK_SIZE = 64 * 1024  # in bytes
+    # symbols that fail are retried with an exponential backoff
+    MAX_ATTEMPTS = 5
+    BACKOFF_BASE = 15  # in seconds
+    BACKOFF_MAX = 300  # in seconds
+
+    def __init__(
+        self,
+        api_key_pool: List[str],
+        quotas: Dict[str, int] = None,
+        api_url: str = None,
+        cache: ResponseCache = None,
+        backfill: bool = False,
+    ):
+        self.api_url = api_url or settings.ALPHAVANTAGE_API_URL
+        # write every fetched row missing from the db, see PriceSink
+        self.backfill = backfill
+        # on-disk responses, see AV_CACHE_DIR and AV_CACHE_MODE
+        self.cache = cache or ResponseCache.from_settings()
         self.api_key_pool = api_key_pool
-        self.keygen = cycle(api_key_pool)
+
+        # requests go to the healthiest keys, within their quota (per minute)
+        self.keys = KeyManager(
+            api_key_pool,
+            quotas or settings.ALPHAVANTAGE_KEY_QUOTAS,
+            settings.ALPHAVANTAGE_RATE_LIMIT,
+        )
 
         self.session = requests.Session()
-        # setup adaptor with retries
-        adapter = requests.adapters.HTTPAdapter(max_retries=self.MAX_RETRIES)
+        # setup adaptor with retries, one connection per worker at least
+        adapter = requests.adapters.HTTPAdapter(
+            max_retries=self.MAX_RETRIES,
+            pool_maxsize=max(10, len(api_key_pool)),
+        )
         self.session.mount("http://", adapter)
         self.session.mount("https://", adapter)
 
     def parse(self, content):
         """Decode and parse CSV content from request"""
-        decoded = content.decode("utf-8")
-        return csv.DictReader(decoded.splitlines(), delimiter=",")
-
-    def insert_prices(self, symbol: str, prices: List):
-        """Insert new prices in the db"""
-
-        # get or create ticker and get company info if new
-        ticker, created = Ticker.objects.get_or_create(symbol=symbol)
-        if created:
-            self.get_company_info(ticker)
-
-        # build list of price instances
-        objs = []
-        latest_date = (
-            StockPrice.objects.filter(ticker=symbol)
-            .order_by("-date")
-            .values_list("date", flat=True)
-            .first()
+        decoded = io.StringIO(content.decode("utf-8"), newline="")
+        return csv.DictReader(decoded, delimiter=",")
+
+    def parse_stream(self, symbol: str, res: requests.Response):
+        """Lazily parse CSV rows while the response is being read"""
+        res.encoding = res.encoding or "utf-8"
+        lines = res.iter_lines(
+            chunk_size=self.STREAM_CHUNK_SIZE, decode_unicode=True
+        )
+        first = next(lines, "")
+        if first.startswith("{"):
+            # a (small) JSON payload instead of CSV
+            content = "\n".join(chain([first], lines)).encode("utf-8")
+            self.check_payload(symbol, content)
+            return iter(())
+
+        second = next((line for line in lines if line), "")
+        self.check_payload(symbol, f"{first}\n{second}".encode("utf-8"))
+        return csv.DictReader(chain([first, second], lines), delimiter=",")
+
+    def check_payload(self, symbol: str, content: bytes):
+        """Raise if AlphaVantage answered with its rate limit note, or
+        with an empty body which throttled keys sometimes get. A CSV with
+        only its header is a symbol without prices (delisted...).
+        """
+        if is_throttled(content):
+            raise APIRateLimited(symbol)
+
+    def price_sink(self, run: IngestionRun = None) -> PriceSink:
+        """A sink writing prices in batches.
+        New tickers are queued to get their company info separately, and
+        symbols are checkpointed in the run's journal once written. The
+        statistics of a run's tickers are refreshed when it finishes.
+        """
+        return PriceSink(
+            on_new_tickers=CompanyInfoTask.enqueue,
+            on_flush=run.checkpoint if run is not None else None,
+            backfill=self.backfill,
+            refresh_stats=run is None,
         )
 
-        for row in prices:
-            # no need to continue if the data is malformed
-            if row.get("close") is None:
-                raise APIRateLimited(symbol)
-
-            # filter duplicates
-            date = parse_date(row.get("timestamp"))
-            if latest_date is not None and date <= latest_date:
-                continue
-
-            objs.append(
-                StockPrice(
-                    ticker=ticker,
-                    close_price=row.get("close"),
-                    volume=row.get("volume"),
-                    date=date,
-                )
-            )
-
-        # insert all prices
-        StockPrice.objects.bulk_create(objs)
-        # we dont want to update a ticker unless we inserted some rows
-        if len(objs) > 0:
-            # get last 2 rows and update last_price and performance
-            start, end = StockPrice.get_series(symbol, 2)
-            ticker.last_price = end.close_price
-            ticker.delta = end.close_price - start.close_price
-            ticker.percentage_change = ticker.delta / start.close_price
-            ticker.last_updated = timezone.now()
-            ticker.save()
+    def insert_prices(self, symbol: str, prices: Iterable):
+        """Insert new prices in the db.
+        Prices are consumed lazily and written in batches, so they can be
+        streamed from the response.
+        """
+        with self.price_sink() as sink:
+            sink.add(symbol, prices)
 
         # number of actually inserted prices
-        return len(objs)
-
-    def fetch(self, **params):
-        """encode url and make request"""
+        return sink.inserted[symbol]
+
+    def fetch(
+        self, stream: bool = False, **params
+    ) -> Tuple[Optional[requests.Response], Optional[str]]:
+        """encode url and make request.
+        Responses are served from the cache when possible, otherwise the
+        request waits for a token from the best key (or the given apikey).
+        Returns the response, None on failure, and the key used.
+        """
 
-        symbol = params.get("symbol")
         params["datatype"] = "csv"
-        encoded_params = urlencode(params)
-        url = f"{self.API_URL}{encoded_params}"
+        if self.cache is not None:
+            res = self.cache.get(params)
+            if res is not None or self.cache.replay:
+                return res, None
+
+        apikey = self.keys.acquire(params.get("apikey"))
+        params["apikey"] = apikey
+        url = f"{self.api_url}{urlencode(params)}"
         res = None
+        started = monotonic()
 
         try:
-            res = self.session.get(url, timeout=self.REQUEST_TIMEOUT)
+            res = self.session.get(
+                url, timeout=self.REQUEST_TIMEOUT, stream=stream
+            )
             res.raise_for_status()
         except requests.exceptions.Timeout:
             logger.error(f"Timeout fetching {url}")
         except requests.exceptions.HTTPError as ex:
             status_code = ex.response.status_code
             logger.error(f"Received code {status_code} while fetching {url}")
+            res = None
         except Exception as e:
             logger.exception("Unknown error", stack_info=True)
-
-        return res
-
-    def fetch_symbol(self, symbol: str) -> Tuple[int, int]:
-        """Fetch prices for a symbol.
-        At the moment we fetch the last 100 daily close prices.
+        self.keys.record(apikey, monotonic() - started, ok=res is not None)
+
+        if res is not None and self.cache is not None:
+            res = self.cache.put(params, res)
+        return res, apikey
+
+    def fetch_symbol(
+        self,
+        symbol: str,
+        apikey: str = None,
+        outputsize: str = "compact",
+        sink: PriceSink = None,
+    ) -> int:
+        """Fetch prices for a symbol and returns the number of rows.
+        compact returns the last 100 daily close prices, full the whole
+        history (20+ years).
+        Prices are written to the sink, or straight away without one.
         """
 
         logger.info(f"Fetching {symbol}")
         function = "TIME_SERIES_DAILY_ADJUSTED"
         # make request
-        res = self.fetch(
-            apikey=next(self.keygen), function=function, symbol=symbol,
+        res, apikey = self.fetch(
+            stream=True,
+            apikey=apikey,
+            function=function,
+            symbol=symbol,
+            outputsize=outputsize,
         )
-        reader = self.parse(res.content)  # parse CSV
-        res.close()  # avoid running out of request pools
-        rows = list(reader)
-
-        total_rows = len(rows)
-        total_inserted = 0
-        if total_rows > 0:
-            total_inserted = self.insert_prices(symbol, rows)
-        else:
-            logger.info(f"Could not find any prices for symbol: {symbol}")
-
-        return total_rows, total_inserted
+        if res is None:
+            raise Exception(f"{symbol}: request failed")
 
-    def import_symbols(self, symbols: List[str]):
+        own_sink = sink is None
+        sink = sink or self.price_sink()
+        try:
+            rows = self.parse_stream(symbol, res)  # parse CSV lazily
+            total_rows = sink.add(symbol, rows)
+        except APIRateLimited:
+            self.keys.rate_limited(apikey)
+            raise
+        finally:
+            res.close()  # avoid running out of request pools
+
+        if own_sink:
+            sink.close()
+        if total_rows == 0:
+            logger.info(f"Could not find any prices for symbol: {symbol}")
+        return total_rows
+
+    def import_symbols(
+        self,
+        symbols: List[str],
+        outputsizes: Dict[str, str] = None,
+        run: IngestionRun = None,
+    ) -> Counter:
         """
-        A non threaded method that imports news symbols into the system.
-        It executes requests every couple of seconds to avoid being
-        rate limited by the api.
+        A threaded method that imports new symbols into the system.
+        There is one worker per api key, every request goes to the key
+        with the most remaining budget (see KeyManager) so that healthy
+        keys are kept busy without going over their quota.
+        Symbols that fail are put back in the queue with a backoff
+        instead of walking the whole list again.
+        outputsizes maps symbols to the outputsize to request (compact
+        by default). The outcome of every symbol is journaled in run.
         """
 
-        symbols_left = symbols[:]  # clone list
-        while len(symbols_left[:]) != 0:
-            logger.info(f"Attempting to fetch {len(symbols_left)} symbols...")
-            for i, symbol in enumerate(symbols_left):
+        # (ready_at, attempt, symbol), ordered by ready time
+        jobs = queue.PriorityQueue()
+        for symbol in symbols:
+            jobs.put((0, 0, symbol))
+
+        done = threading.Event()
+        stats = Counter()
+        # prices of all symbols are written in shared batches
+        with self.price_sink(run) as sink:
+            with ThreadPoolExecutor(
+                max_workers=len(self.api_key_pool)
+            ) as pool:
+                futures = [
+                    pool.submit(
+                        self.import_worker,
+                        jobs,
+                        done,
+                        outputsizes or {},
+                        sink,
+                        run,
+                    )
+                    for _ in self.api_key_pool
+                ]
                 try:
-                    total, inserted = self.fetch_symbol(symbol)
-                except Exception as ex:
-                    logger.error(f"{symbol} generated an exception:\n{ex}")
-                else:
-                    logger.info(f"{symbol}: found {total}, inserted {inserted}")
-                if i != 0 and i % len(self.api_key_pool) == 0:
-                    sleep(10)
-                else:
-                    symbols_left.remove(symbol)
-                    sleep(5)
+                    # wait for every symbol to succeed or run out of attempts
+                    jobs.join()
+                finally:
+                    done.set()
 
-    def get_company_info(self, ticker: Ticker):
-        """Get company info from symbol"""
+                for future in as_completed(futures):
+                    stats.update(future.result())
 
-        function = "OVERVIEW"
-        symbol = ticker.symbol
+        stats["inserted"] = sink.total_inserted
 
-        def fetch():
-            return self.fetch(
-                apikey=next(self.keygen), function=function, symbol=symbol
-            )
+        self.keys.log_stats()
+        logger.info(
+            f"Imported {stats['symbols']} symbols, inserted "
+            f"{stats['inserted']} prices, {stats['failed']} failed"
+        )
+        return stats
+
+    def backoff(self, attempt: int) -> float:
+        """Time to wait before a symbol's next attempt"""
+        return min(self.BACKOFF_BASE * 2 ** (attempt - 1), self.BACKOFF_MAX)
+
+    def import_worker(
+        self,
+        jobs: queue.PriorityQueue,
+        done: threading.Event,
+        outputsizes: Dict[str, str],
+        sink: PriceSink,
+        run: IngestionRun = None,
+    ) -> Counter:
+        """Fetch symbols from the queue until done"""
+
+        stats = Counter()
+        try:
+            while not done.is_set():
+                try:
+                    ready_at, attempt, symbol = jobs.get(timeout=0.5)
+                except queue.Empty:
+                    continue
 
-        success = False
-        company = None
-        # sleep before request to avoid lock
-        sleep(randrange(0, 30, 15))
-        res = fetch()
-
-        while not success:
-            try:
-                company = res.json()
-                # avoid getting rate limited
-                if company.get("Note") is not None:
-                    sleep_time = 60  # randrange(30, 90, 15)
-                    logger.info(
-                        f"{symbol}: Got rate limited, retrying in {sleep_time:.2f}s"
-                    )
-                    sleep(sleep_time)
+                # symbol is backing off, give it back and wait a little
+                wait = ready_at - monotonic()
+                if wait > 0:
+                    jobs.put((ready_at, attempt, symbol))
+                    jobs.task_done()
+                    sleep(min(wait, 0.5))
                     continue
-            except ValueError as ex:
-                logger.exception(
-                    f"Could not parse JSON when getting company info for {symbol}"
-                )
-                break
-            except Exception as ex:
-                logger.exception(
-                    f"{symbol}: exception trying to fetch company info:\n{ex}"
-                )
-                break
-            else:
-                success = True
-
-        if company is not None:
-            ticker.company = company.get("Name")
-            ticker.description = company.get("Description")
-            ticker.exchange = company.get("Exchange")
-            ticker.country = company.get("Country")
-            ticker.sector = company.get("Sector")
-            ticker.industry = company.get("Industry")
-            beta = company.get("Beta")
-            if beta == "None":
-                beta = None
-            ticker.beta = beta
-            ticker.save()
 
+                try:
+                    total = self.fetch_symbol(
+                        symbol,
+                        outputsize=outputsizes.get(symbol, "compact"),
+                        sink=sink,
+                    )
+                except Exception as ex:
+                    attempt += 1
+                    if attempt < self.MAX_ATTEMPTS:
+                        backoff = self.backoff(attempt)
+                        logger.warning(
+                            f"{symbol} generated an exception, retrying "
+                            f"in {backoff}s:\n{ex}"
+                        )
+                        jobs.put((monotonic() + backoff, attempt, symbol))
+                    else:
+                        logger.error(f"{symbol} generated an exception:\n{ex}")
+                        stats["failed"] += 1
+                        if run is not None:
+                            run.fail(symbol, str(ex))
+                else:
+                    logger.info(f"{symbol}: found {total}")
+                    stats["symbols"] += 1
+                finally:
+                    jobs.task_done()
+        finally:
+            # each thread has its own db connection
+            connection.close()
+
+        return stats
+
+    def get_company_info(self, ticker: Ticker, apikey: str = None):
+        """Get company info from symbol.
+        This makes a single request, rate limits are left to the caller
+        (see CompanyInfoWorker).
+        """
+
+        symbol = ticker.symbol
+        res, apikey = self.fetch(
+            apikey=apikey,
+            function="OVERVIEW",
+            symbol=symbol,
+        )
+        if res is None:
+            raise Exception(f"{symbol}: request failed")
+
+        company = res.json()  # raises ValueError if not JSON
+        if company.get("Note") is not None:
+            self.keys.rate_limited(apikey)
+            raise APIRateLimited(symbol)
+        if company.get("Error Message") is not None:
+            raise ValueError(f"{symbol}: {company.get('Error Message')}")
+
+        ticker.company = company.get("Name")
+        ticker.description = company.get("Description")
+        ticker.exchange = company.get("Exchange")
+        ticker.country = company.get("Country")
+        ticker.sector = company.get("Sector")
+        ticker.industry = company.get("Industry")
+        beta = company.get("Beta")
+        if beta == "None":
+            beta = None
+        ticker.beta = beta
+        ticker.save()
@@ -7,7 +7,10 @@ from stockspec.bet.views import BetsViewSet
 from stockspec.portfolio.views import (
     PortfolioList,
     TickerList,
+    TickerChanges,
     TopTickersList,
+    TrendingTickersList,
+    TickerRiskDetail,
     PriceSeries,
 )
 
@@ -20,7 +23,10 @@ urlpatterns = [
     # portfolio
     path("portfolios/", PortfolioList.as_view()),
     path("tickers", TickerList.as_view()),
+    path("tickers/changes", TickerChanges.as_view()),
     path("tickers/top", TopTickersList.as_view()),
+    path("tickers/trending", TrendingTickersList.as_view()),
+    path("tickers/<str:symbol>/risk", TickerRiskDetail.as_view()),
     # series
     path("series/<str:symbol>", PriceSeries.as_view()),
     # bets
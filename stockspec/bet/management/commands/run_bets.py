@@ -1,53 +1,40 @@
-from collections import namedtuple
+import argparse
 
-from django.utils import timezone
-from django.db.models import Count
 from django.core.management.base import BaseCommand
 
-from stockspec.bet.models import Bet
+from stockspec.bet.settlement import Settlement
 
 
 class Command(BaseCommand):
     """Run bets to find who won/lost"""
 
-    def handle(self, *args, **kwargs):
-        now = timezone.now()
-        bets = (
-            Bet.ongoing()
-            .prefetch_related(
-                "portfolios", "portfolios__tickers", "portfolios__user"
-            )
-            .filter(end_time__isnull=False, end_time__lte=now)
+    def add_arguments(self, parser: argparse.ArgumentParser):
+        parser.add_argument(
+            "-w",
+            "--workers",
+            type=int,
+            default=1,
+            help="Settle chunks of bets in that many processes",
         )
-
-        PortfolioPerf = namedtuple(
-            "PortfolioPerf", ["portfolio", "performance"]
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=Settlement.CHUNK_SIZE,
+            help="Bets settled per bulk update",
         )
 
-        for bet in bets:
-            start_date = bet.start_time
-            end_date = bet.end_time
-            returns = [
-                PortfolioPerf(
-                    portfolio, portfolio.return_for_period(start_date, end_date)
-                )
-                for portfolio in bet.portfolios.all()
-            ]
-
-            winningperformance = max(
-                returns, key=(lambda portfolioperf: portfolioperf.performance)
-            )
-
-            if winningperformance is not None:
-                bet.winner = winningperformance.portfolio.user
-                print(
-                    " / ".join(
-                        [
-                            "%.4f" % portfolioperf.performance
-                            for portfolioperf in returns
-                        ]
-                    )
-                )
-                print(winningperformance.portfolio.user.username + " wins")
+    def handle(self, *args, **kwargs):
+        settlement = Settlement(
+            workers=kwargs.get("workers"), chunk_size=kwargs.get("chunk_size")
+        )
+        stats = settlement.run()
 
-            bet.save()
+        elapsed = stats["claim_time"] + stats["settle_time"]
+        rate = stats["settled"] / elapsed if elapsed > 0 else 0
+        self.stdout.write(
+            f"Claimed {stats['claimed']} bets in {stats['claim_time']:.2f}s"
+        )
+        self.stdout.write(
+            f"Settled {stats['settled']} bets, skipped {stats['skipped']} "
+            f"in {stats['settle_time']:.2f}s ({rate:.0f} bets/s)"
+        )
@@ -0,0 +1,35 @@
+import argparse
+
+from django.core.management.base import BaseCommand
+
+from stockspec.bet.scheduler import SettlementScheduler
+from stockspec.bet.settlement import Settlement
+
+
+class Command(BaseCommand):
+    """Settle bets as soon as their closing prices are in, forever"""
+
+    def add_arguments(self, parser: argparse.ArgumentParser):
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=SettlementScheduler.POLL_INTERVAL,
+            help="Seconds between looks for new bets and prices",
+        )
+        parser.add_argument(
+            "-w",
+            "--workers",
+            type=int,
+            default=1,
+            help="Settle chunks of bets in that many processes",
+        )
+
+    def handle(self, *args, **kwargs):
+        scheduler = SettlementScheduler(
+            Settlement(workers=kwargs.get("workers")),
+            poll_interval=kwargs.get("poll_interval"),
+        )
+        try:
+            scheduler.run()
+        except KeyboardInterrupt:
+            print("Exiting...")
@@ -0,0 +1,23 @@
+# Generated by Django 3.1.2 on 2026-10-17 18:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bet', '0006_auto_20201115_1600'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bet',
+            name='settling_by',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='bet',
+            name='settling_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
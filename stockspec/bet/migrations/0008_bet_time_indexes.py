@@ -0,0 +1,23 @@
+# Generated by Django 3.1.2 on 2026-10-17 18:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bet', '0007_bet_settling_claim'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bet',
+            name='end_time',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='bet',
+            name='start_time',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.1.2 on 2026-10-17 20:01
+
+from django.db import migrations, models
+
+
+def backfill_state(apps, schema_editor):
+    """Settled with a winner, running once started, awaiting otherwise"""
+    Bet = apps.get_model('bet', 'Bet')
+    Bet.objects.filter(winner__isnull=False).update(state='settled')
+    Bet.objects.filter(winner__isnull=True, end_time__isnull=False).update(
+        state='running'
+    )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bet', '0008_bet_time_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bet',
+            name='state',
+            field=models.CharField(choices=[('awaiting', 'Awaiting'), ('running', 'Running'), ('settled', 'Settled')], default='awaiting', max_length=8),
+        ),
+        migrations.RunPython(backfill_state, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='bet',
+            index=models.Index(fields=['state', '-created_at'], name='bet_state'),
+        ),
+    ]
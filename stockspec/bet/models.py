@@ -1,6 +1,6 @@
 from django.utils import timezone
 from django.db import models
-from django.db.models import Q, Count, Subquery
+from django.db.models import Subquery
 
 from stockspec.users.models import User
 from stockspec.portfolio.models import Portfolio
@@ -10,6 +10,10 @@ class Bet(models.Model):
     class Meta:
         db_table = "bet"
         ordering = ["-created_at"]
+        indexes = [
+            # lists of bets in a state, newest first
+            models.Index(fields=["state", "-created_at"], name="bet_state"),
+        ]
 
     # for now 5, 10, 15
     FIVE = 5
@@ -22,6 +26,16 @@ class Bet(models.Model):
     ONEWEEK = "1W"
     DURATION_CHOICES = [(ONEDAY, "1 day"), (ONEWEEK, "1 week")]
 
+    # awaiting an opponent, running once joined, settled with a winner
+    AWAITING = "awaiting"
+    RUNNING = "running"
+    SETTLED = "settled"
+    STATE_CHOICES = [
+        (AWAITING, "Awaiting"),
+        (RUNNING, "Running"),
+        (SETTLED, "Settled"),
+    ]
+
     portfolios = models.ManyToManyField(Portfolio)
 
     # keep it simple, use an int
@@ -30,13 +44,24 @@ class Bet(models.Model):
         max_length=2, choices=DURATION_CHOICES, default=ONEDAY
     )
 
+    # kept by the create and join serializers and the settlement, so
+    # lists don't count portfolios
+    state = models.CharField(
+        max_length=8, choices=STATE_CHOICES, default=AWAITING
+    )
+
     # default is null
     winner = models.ForeignKey(
         User, default=None, blank=True, null=True, on_delete=models.SET_NULL
     )
 
-    start_time = models.DateTimeField(null=True, blank=True)
-    end_time = models.DateTimeField(null=True, blank=True)
+    # indexed for the settlement scheduler
+    start_time = models.DateTimeField(null=True, blank=True, db_index=True)
+    end_time = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    # claimed by a settlement run, see stockspec.bet.settlement
+    settling_by = models.CharField(max_length=100, null=True, blank=True)
+    settling_expires_at = models.DateTimeField(null=True, blank=True)
 
     updated_at = models.DateTimeField(auto_now=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True, blank=True)
@@ -53,28 +78,24 @@ class Bet(models.Model):
     @staticmethod
     def ongoing():
         """Bets not finished yet"""
-        return (
-            Bet.objects.all()
-            .annotate(portfolio_count=Count("portfolios"))
-            .filter(
-                Q(portfolio_count=2)
-                & (Q(winner__isnull=True) | Q(end_time__gte=timezone.now()))
-            )
+        return Bet.objects.filter(state=Bet.RUNNING)
+
+    @staticmethod
+    def due(now=None):
+        """Started bets that ended and have no winner yet"""
+        return Bet.objects.filter(
+            state=Bet.RUNNING, end_time__lte=now or timezone.now()
         )
 
     @staticmethod
     def awaiting():
         """Bets awaiting an opponent"""
-        return (
-            Bet.objects.all()
-            .annotate(portfolio_count=Count("portfolios"))
-            .filter(portfolio_count__lt=2)
-        )
+        return Bet.objects.filter(state=Bet.AWAITING)
 
     @staticmethod
     def not_finished():
-        return Bet.objects.filter(winner__isnull=True)
+        return Bet.objects.filter(state__in=[Bet.AWAITING, Bet.RUNNING])
 
     @staticmethod
     def finished():
-        return Bet.objects.filter(winner__isnull=False)
+        return Bet.objects.filter(state=Bet.SETTLED)
@@ -0,0 +1,182 @@
+import heapq
+import logging
+from collections import Counter
+from datetime import date, datetime, timedelta
+from time import sleep
+from typing import Dict, List, Set, Tuple
+
+from django.db.models import Max
+from django.utils import timezone
+
+from stockspec.bet.models import Bet
+from stockspec.bet.settlement import (
+    Settlement,
+    closing_sessions,
+    has_closes,
+    latest_closes,
+)
+from stockspec.portfolio.models import StockPrice
+
+logger = logging.getLogger(__name__)
+
+
+class SettlementScheduler:
+    """Settle bets as soon as their closing prices are ingested.
+
+    Unsettled bets are kept in a min-heap of end times, loaded once from
+    the end_time index. Bets started since are picked up from the
+    start_time index. Once a bet ended it waits, for every ticker it
+    holds, for the close of the governing session of its end time on the
+    ticker's calendar, and is settled right after. Prices are only
+    looked at again when new ones were inserted. Bets a run didn't
+    settle (missing prices, claimed by another run) are tried again
+    after a growing delay.
+    """
+
+    POLL_INTERVAL = 5  # in seconds
+    # bets started in that window may commit late, look at them again
+    START_OVERLAP = timedelta(minutes=1)
+    # delay before trying an unsettled bet again, doubled every time
+    RETRY_DELAY = timedelta(minutes=1)
+    MAX_RETRY_DELAY = timedelta(hours=1)
+
+    def __init__(
+        self, settlement: Settlement = None, poll_interval: float = None
+    ):
+        self.settlement = settlement or Settlement()
+        self.poll_interval = poll_interval or self.POLL_INTERVAL
+
+        # (end time, start time, bet id)
+        self.heap: List[Tuple[datetime, datetime, int]] = []
+        self.scheduled: Set[int] = set()
+        # bets done with, until the start_time overlap is past them
+        self.finished: Dict[int, datetime] = {}
+        self.watermark = None  # latest start time seen
+        # ended bets waiting for prices: bet id -> (deadline, start time)
+        self.waiting: Dict[int, Tuple[datetime, datetime]] = {}
+        # session each ticker of a waiting bet needs a close for
+        self.sessions: Dict[int, Dict[str, date]] = {}
+        # bets a run didn't settle: bet id -> (next try, delay)
+        self.retries: Dict[int, Tuple[datetime, timedelta]] = {}
+        self.last_price_id = None
+
+    def schedule(self, bets):
+        """Add (pk, start time, end time) rows not scheduled yet"""
+        for pk, start_time, end_time in bets:
+            if self.watermark is None or start_time > self.watermark:
+                self.watermark = start_time
+            if pk not in self.scheduled and pk not in self.finished:
+                self.scheduled.add(pk)
+                heapq.heappush(self.heap, (end_time, start_time, pk))
+
+    def started(self):
+        return Bet.ongoing().values_list("pk", "start_time", "end_time")
+
+    def load(self):
+        """Schedule every started bet without winner"""
+        self.schedule(self.started().order_by("end_time"))
+        if self.watermark is None:
+            self.watermark = timezone.now()
+        logger.info(f"Scheduled {len(self.scheduled)} bets")
+
+    def poll(self):
+        """Schedule bets started since the last poll"""
+        if self.watermark is None:
+            return self.load()
+        since = self.watermark - self.START_OVERLAP
+        self.finished = {
+            pk: start for pk, start in self.finished.items() if start >= since
+        }
+        self.schedule(self.started().filter(start_time__gte=since))
+
+    def pop_ended(self, now: datetime):
+        """Move the bets that ended to the waiting ones"""
+        ended = {}
+        while len(self.heap) > 0 and self.heap[0][0] <= now:
+            end_time, start_time, pk = heapq.heappop(self.heap)
+            deadline = end_time + self.settlement.grace
+            self.waiting[pk] = (deadline, start_time)
+            ended[pk] = end_time
+
+        if len(ended) > 0:
+            self.sessions.update(closing_sessions(ended))
+            # something to check even if no price was inserted
+            self.last_price_id = None
+
+    def ready(self, now: datetime) -> List[int]:
+        """Waiting bets whose tickers all have a price for the closing
+        session, whose grace period is over or whose retry is due. Bets
+        waiting for a retry are held back until then.
+        """
+        if len(self.waiting) == 0:
+            return []
+
+        held = {pk for pk, (at, _) in self.retries.items() if at > now}
+        due = set(self.retries) - held
+        last_price_id = StockPrice.objects.aggregate(last=Max("pk"))["last"]
+        expired = {
+            pk for pk, (deadline, _) in self.waiting.items() if deadline <= now
+        }
+        if last_price_id == self.last_price_id:
+            return sorted((expired | due) - held)
+        self.last_price_id = last_price_id
+
+        latest = latest_closes(
+            s for pk in self.waiting for s in self.sessions.get(pk, ())
+        )
+        ready = expired | due
+        for pk in self.waiting:
+            if has_closes(self.sessions.get(pk, {}), latest):
+                ready.add(pk)
+        return sorted(ready - held)
+
+    def settle(self, bet_ids: List[int], now: datetime) -> Counter:
+        """Settle bets, those still running afterwards are tried again
+        later, the others are done with
+        """
+        stats = self.settlement.run(now, bet_ids)
+        running = set(
+            Bet.ongoing().filter(pk__in=bet_ids).values_list("pk", flat=True)
+        )
+        for pk in bet_ids:
+            if pk in running:
+                _, delay = self.retries.get(pk, (None, self.RETRY_DELAY / 2))
+                delay = min(delay * 2, self.MAX_RETRY_DELAY)
+                self.retries[pk] = (now + delay, delay)
+                continue
+            _, start_time = self.waiting.pop(pk)
+            self.retries.pop(pk, None)
+            self.sessions.pop(pk, None)
+            self.scheduled.discard(pk)
+            self.finished[pk] = start_time
+        return stats
+
+    def run_once(self, now: datetime = None) -> Counter:
+        now = now or timezone.now()
+        self.poll()
+        self.pop_ended(now)
+        ready = self.ready(now)
+        if len(ready) == 0:
+            return Counter()
+
+        stats = self.settle(ready, now)
+        logger.info(
+            f"Settled {stats['settled']} bets, skipped {stats['skipped']}, "
+            f"{len(self.waiting)} waiting for prices"
+        )
+        return stats
+
+    def wait_time(self, now: datetime = None) -> float:
+        """Seconds until the next bet ends, at most the poll interval"""
+        if len(self.heap) == 0:
+            return self.poll_interval
+        now = now or timezone.now()
+        delay = (self.heap[0][0] - now).total_seconds()
+        return min(max(delay, 0), self.poll_interval)
+
+    def run(self):
+        """Settle bets forever"""
+        self.load()
+        while True:
+            self.run_once()
+            sleep(self.wait_time())
@@ -1,20 +1,53 @@
 from datetime import timedelta
 
+from django.db import transaction
 from django.utils import timezone
 from rest_framework import serializers
 
 from stockspec.exceptions import SerializerRequestMissing
 from stockspec.bet.models import Bet
 from stockspec.portfolio.models import Portfolio, Ticker
+from stockspec.portfolio.performance import portfolio_returns
 from stockspec.portfolio.serializers import PortfolioSerialier
 from stockspec.users.serializers import BaseUserSerializer
 
 
+def bet_periods(bets):
+    """(portfolio, start, end) of every portfolio of started bets"""
+    return [
+        (portfolio, bet.start_time, bet.end_time)
+        for bet in bets
+        if bet.start_time and bet.end_time
+        for portfolio in bet.portfolios.all()
+    ]
+
+
+def bet_returns(bets):
+    """Performance of every portfolio of bets, from their prefetched
+    tickers (see BetsViewSet.get_queryset)
+    """
+    periods = bet_periods(bets)
+    holdings = {
+        portfolio.pk: portfolio.tickers.all() for portfolio, _, _ in periods
+    }
+    return portfolio_returns(periods, holdings)
+
+
+class BetListSerializer(serializers.ListSerializer):
+    """Compute the performance of every portfolio of the page at once"""
+
+    def to_representation(self, data):
+        bets = data.all() if hasattr(data, "all") else data
+        self.context["performances"] = bet_returns(bets)
+        return super().to_representation(bets)
+
+
 class BetSerializer(serializers.ModelSerializer):
     winner = BaseUserSerializer(read_only=True)
     portfolios = serializers.SerializerMethodField()
 
     class Meta:
+        list_serializer_class = BetListSerializer
         model = Bet
         fields = [
             "id",
@@ -47,27 +80,32 @@ class BetSerializer(serializers.ModelSerializer):
             raise SerializerRequestMissing
 
         user = request.user
-        portfolio_count = obj.portfolios.count()
+        # prefetched, counted and read without queries
+        portfolios = obj.portfolios.all()
+        portfolio_count = len(portfolios)
         is_awaiting = portfolio_count == 1
         is_full = portfolio_count == 2
         with_tickers = False
 
         # is it the current and only user in the bet?
-        if is_awaiting and obj.portfolios.first().user == user:
+        if is_awaiting and portfolios[0].user_id == user.id:
             with_tickers = True
         # the bet has already started?
         elif all([is_full, bool(obj.start_time), bool(obj.end_time)]):
             with_tickers = True
 
+        performances = self.context.get("performances")
+        if performances is None:
+            performances = bet_returns([obj])
+
         context = {
             **self.context,
+            "performances": performances,
             "with_tickers": with_tickers,
             "start_date": obj.start_time,
             "end_date": obj.end_time,
         }
-        return PortfolioSerialier(
-            obj.portfolios.all(), context=context, many=True
-        ).data
+        return PortfolioSerialier(portfolios, context=context, many=True).data
 
 
 def validate_tickers(tickers):
@@ -105,7 +143,9 @@ class CreateBetSerializer(serializers.ModelSerializer):
         # get portfolio and create bet with it
         portfolio = Portfolio.get_or_create_from_tickers(user, tickers)
         ModelClass = self.Meta.model
-        instance = ModelClass.objects.create(**validated_data)
+        instance = ModelClass.objects.create(
+            state=Bet.AWAITING, **validated_data
+        )
         instance.portfolios.set([portfolio])
         return instance
 
@@ -129,9 +169,6 @@ class JoinBetSerializer(serializers.ModelSerializer):
 
         user = request.user
         tickers = validated_data.pop("tickers")
-        # get and set portfolio
-        portfolio = Portfolio.get_or_create_from_tickers(user, tickers)
-        instance.portfolios.add(portfolio)
 
         # now we need to start bet (start_time, end_time)
         deltas = {
@@ -140,9 +177,23 @@ class JoinBetSerializer(serializers.ModelSerializer):
         }
 
         now = timezone.now()
+        instance.state = Bet.RUNNING
         instance.start_time = now
         # beware, we assume data in database is consistent, options are: 1D/1W
         instance.end_time = now + deltas[instance.duration]
-        instance.save()
+        with transaction.atomic():
+            # only the first opponent moves the bet out of awaiting
+            waiting = Bet.awaiting().filter(pk=instance.pk)
+            started = waiting.update(
+                state=instance.state,
+                start_time=instance.start_time,
+                end_time=instance.end_time,
+                updated_at=now,
+            )
+            if started == 0:
+                raise serializers.ValidationError("This bet already started")
+            # get portfolio, only once the bet is ours to join
+            portfolio = Portfolio.get_or_create_from_tickers(user, tickers)
+            instance.portfolios.add(portfolio)
 
         return instance
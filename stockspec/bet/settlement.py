@@ -0,0 +1,256 @@
+import logging
+import os
+import socket
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from itertools import repeat
+from time import perf_counter
+from typing import Dict, Iterable, List
+from uuid import uuid4
+
+import django
+from django.db import connection, connections, transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from stockspec.bet.models import Bet
+from stockspec.portfolio.models import Portfolio, StockPrice
+from stockspec.portfolio.performance import period_key, portfolio_returns
+from stockspec.tradingcalendar import calendar_for
+
+logger = logging.getLogger(__name__)
+
+
+def closing_sessions(ends: Dict[int, datetime]) -> Dict[int, Dict[str, date]]:
+    """Session each ticker of bets needs a close for, the governing
+    session of the bet's end time on the ticker's calendar (see
+    portfolio_returns)
+    """
+    through = Bet.portfolios.through.objects.filter(
+        bet_id__in=ends, portfolio__tickers__isnull=False
+    ).values_list(
+        "bet_id",
+        "portfolio__tickers",
+        "portfolio__tickers__exchange",
+        "portfolio__tickers__timezone",
+    )
+    sessions = {}
+    for pk, symbol, exchange, tz in through:
+        calendar = calendar_for(exchange, tz)
+        sessions.setdefault(pk, {})[symbol] = calendar.session_at(ends[pk])
+    return sessions
+
+
+def latest_closes(symbols: Iterable[str]) -> Dict[str, date]:
+    """Date of the latest close of tickers"""
+    return dict(
+        StockPrice.objects.filter(ticker_id__in=set(symbols))
+        .values("ticker_id")
+        .annotate(last=Max("date"))
+        .values_list("ticker_id", "last")
+    )
+
+
+def has_closes(sessions: Dict[str, date], latest: Dict[str, date]) -> bool:
+    """Whether every ticker has a close for its session"""
+    return all(
+        latest.get(symbol) is not None and latest[symbol] >= session
+        for symbol, session in sessions.items()
+    )
+
+
+def settle_chunk(owner: str, bet_ids: List[int]) -> Counter:
+    """Find the winners of bets claimed by owner and write them in a
+    single statement. Bets with missing prices are left without winner.
+    Module level so it can run in a process pool.
+    """
+    periods = {
+        pk: (start, end)
+        for pk, start, end in Bet.objects.filter(
+            pk__in=bet_ids, settling_by=owner
+        ).values_list("pk", "start_time", "end_time")
+    }
+    # plain rows rather than prefetched models, in the order of
+    # bet.portfolios.all() so ties are broken the same way
+    sides = defaultdict(list)
+    through = (
+        Bet.portfolios.through.objects.filter(bet_id__in=periods)
+        .order_by("-portfolio__updated_at", "portfolio__name")
+        .values_list("bet_id", "portfolio_id", "portfolio__user_id")
+    )
+    for bet_id, portfolio_id, user_id in through:
+        sides[bet_id].append(Portfolio(pk=portfolio_id, user_id=user_id))
+
+    # performance of every portfolio of the chunk, computed at once
+    performances = portfolio_returns(
+        (portfolio, *periods[bet_id])
+        for bet_id, portfolios in sides.items()
+        for portfolio in portfolios
+    )
+
+    stats = Counter()
+    winners = []
+    for bet_id, (start, end) in periods.items():
+        returns = [
+            (performances.get(period_key(portfolio, start, end)), portfolio)
+            for portfolio in sides[bet_id]
+        ]
+        if any(performance is None for performance, _ in returns):
+            logger.warning(f"Bet #{bet_id}: missing prices, skipping")
+            stats["skipped"] += 1
+            continue
+
+        _, winner = max(returns, key=lambda perf: perf[0])
+        winners.append((winner.user_id, bet_id))
+        logger.debug(f"Bet #{bet_id}: user #{winner.user_id} wins")
+
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    with transaction.atomic(), connection.cursor() as cursor:
+        # bulk_update builds a CASE per row, far too slow at this scale.
+        # only bets still claimed by owner, another run may have taken
+        # over if the claim expired
+        cursor.executemany(
+            """
+            UPDATE bet SET winner_id = %s, state = %s, updated_at = %s
+            WHERE id = %s AND settling_by = %s AND state = %s
+            """,
+            [
+                (user_id, Bet.SETTLED, now, pk, owner, Bet.RUNNING)
+                for user_id, pk in winners
+            ],
+        )
+        stats["settled"] += max(cursor.rowcount, 0) if winners else 0
+        Bet.objects.filter(pk__in=bet_ids, settling_by=owner).update(
+            settling_by=None, settling_expires_at=None
+        )
+    return stats
+
+
+class Settlement:
+    """Settle due bets in chunks.
+
+    Due bets are only settled once every ticker they hold has the close
+    of the session that settles them, or once their grace period is
+    over, the others are left running. They are claimed with guarded
+    statements so overlapping runs never settle the same bet, the claim
+    expires in case a run crashes. Claimed bets are split in chunks,
+    settled in a process pool when there is more than one worker.
+    """
+
+    CHUNK_SIZE = 500  # bets per bulk update
+    CLAIM_DURATION = timedelta(minutes=10)
+    # settle with the prices at hand when a close never comes
+    GRACE = timedelta(days=1)
+
+    def __init__(
+        self,
+        workers: int = 1,
+        chunk_size: int = None,
+        claim_duration: timedelta = None,
+        grace: timedelta = None,
+    ):
+        self.workers = workers
+        self.chunk_size = chunk_size or self.CHUNK_SIZE
+        self.claim_duration = claim_duration or self.CLAIM_DURATION
+        self.grace = grace or self.GRACE
+        host = socket.gethostname()
+        self.owner = f"{host}:{os.getpid()}:{uuid4().hex[:8]}"
+
+    def __str__(self):
+        return self.owner
+
+    def claimable(self, now):
+        """Due bets no other run holds a live claim on"""
+        return Bet.objects.filter(
+            Q(settling_expires_at__isnull=True)
+            | Q(settling_expires_at__lte=now),
+            state=Bet.RUNNING,
+        )
+
+    def ready(self, now, bet_ids: List[int] = None) -> List[int]:
+        """Due and claimable bets (of bet_ids) whose closing prices are
+        in or whose grace period is over
+        """
+        due = self.claimable(now).filter(end_time__lte=now)
+        if bet_ids is not None:
+            due = due.filter(pk__in=bet_ids)
+        ends = dict(due.values_list("pk", "end_time"))
+        sessions = closing_sessions(ends)
+        latest = latest_closes(s for bet in sessions.values() for s in bet)
+        ready = [
+            pk
+            for pk, end_time in ends.items()
+            if end_time + self.grace <= now
+            or has_closes(sessions.get(pk, {}), latest)
+        ]
+        if len(ready) < len(ends):
+            logger.info(
+                f"{self}: {len(ends) - len(ready)} bets wait for prices"
+            )
+        return sorted(ready)
+
+    def claim(self, now=None, bet_ids: List[int] = None) -> List[int]:
+        """Claim every due bet ready to settle (or the ready ones of
+        bet_ids), returns the ids claimed
+        """
+        now = now or timezone.now()
+        ready = self.ready(now, bet_ids)
+        for i in range(0, len(ready), self.chunk_size):
+            # only bets no other run claimed since
+            self.claimable(now).filter(
+                pk__in=ready[i : i + self.chunk_size]
+            ).update(
+                settling_by=self.owner,
+                settling_expires_at=now + self.claim_duration,
+            )
+        return list(
+            Bet.objects.filter(settling_by=self.owner, state=Bet.RUNNING)
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        )
+
+    def release(self) -> int:
+        """Give back the bets that were not settled"""
+        return Bet.objects.filter(settling_by=self.owner).update(
+            settling_by=None, settling_expires_at=None
+        )
+
+    def settle(self, bet_ids: List[int]) -> Counter:
+        chunks = [
+            bet_ids[i : i + self.chunk_size]
+            for i in range(0, len(bet_ids), self.chunk_size)
+        ]
+        stats = Counter()
+        if self.workers > 1 and len(chunks) > 1:
+            # connections can't be shared with child processes
+            connections.close_all()
+            with ProcessPoolExecutor(
+                self.workers, initializer=django.setup
+            ) as pool:
+                for result in pool.map(
+                    settle_chunk, repeat(self.owner), chunks
+                ):
+                    stats.update(result)
+        else:
+            for chunk in chunks:
+                stats.update(settle_chunk(self.owner, chunk))
+        return stats
+
+    def run(self, now=None, bet_ids: List[int] = None) -> Counter:
+        """Claim and settle due bets, returns counts and timings"""
+        started = perf_counter()
+        try:
+            bet_ids = self.claim(now, bet_ids)
+            claimed = perf_counter()
+            stats = self.settle(bet_ids)
+        finally:
+            self.release()
+
+        stats["claimed"] = len(bet_ids)
+        stats["claim_time"] = claimed - started
+        stats["settle_time"] = perf_counter() - claimed
+        logger.info(
+            f"{self}: settled {stats['settled']} of {len(bet_ids)} bets"
+        )
+        return stats
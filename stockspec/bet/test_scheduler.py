@@ -0,0 +1,85 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.test import TestCase
+from django.utils import timezone
+
+from stockspec.bet.models import Bet
+from stockspec.bet.scheduler import SettlementScheduler
+from stockspec.portfolio.models import Portfolio, StockPrice, Ticker
+from stockspec.portfolio.returncache import get_return_cache
+from stockspec.users.models import User
+
+
+class SettlementSchedulerTests(TestCase):
+    """Bets that can't be settled yet are tried again, not forgotten"""
+
+    def setUp(self):
+        # returns of past periods are kept in process
+        get_return_cache().clear()
+        self.users = [
+            User.objects.create(username=f"user{i}", email=f"user{i}@x.io")
+            for i in range(2)
+        ]
+        self.tickers = [
+            Ticker.objects.create(symbol=f"T{i}") for i in range(2)
+        ]
+        self.now = timezone.now()
+        # T0 is listed after the bet started, its history comes later
+        self.add_prices(self.tickers[0], range(10))
+        self.add_prices(self.tickers[1], range(30))
+        portfolios = [
+            Portfolio.get_or_create_from_tickers(user, [ticker])
+            for user, ticker in zip(self.users, self.tickers)
+        ]
+        self.bet = Bet.objects.create(
+            state=Bet.RUNNING,
+            start_time=self.now - timedelta(days=20),
+            end_time=self.now - timedelta(days=2),
+        )
+        self.bet.portfolios.set(portfolios)
+
+    def add_prices(self, ticker: Ticker, days):
+        today = self.now.date()
+        StockPrice.objects.bulk_create(
+            StockPrice(
+                ticker=ticker,
+                date=today - timedelta(days=days),
+                close_price=Decimal(100 + days),
+                volume=1,
+            )
+            for days in days
+        )
+
+    def test_prices_arrive_late(self):
+        scheduler = SettlementScheduler()
+        scheduler.load()
+
+        # no start price for T0
+        stats = scheduler.run_once(self.now)
+        self.assertEqual(stats["skipped"], 1)
+        self.bet.refresh_from_db()
+        self.assertEqual(self.bet.state, Bet.RUNNING)
+        self.assertIn(self.bet.pk, scheduler.waiting)
+
+        # not before the retry delay
+        self.add_prices(self.tickers[0], range(10, 30))
+        later = self.now + scheduler.RETRY_DELAY / 2
+        self.assertEqual(scheduler.run_once(later), {})
+
+        stats = scheduler.run_once(self.now + scheduler.RETRY_DELAY)
+        self.assertEqual(stats["settled"], 1)
+        self.bet.refresh_from_db()
+        self.assertEqual(self.bet.state, Bet.SETTLED)
+        self.assertNotIn(self.bet.pk, scheduler.waiting)
+        self.assertIn(self.bet.pk, scheduler.finished)
+
+    def test_retry_delay_grows(self):
+        scheduler = SettlementScheduler()
+        scheduler.load()
+        now = self.now
+        for delay in (1, 2, 4):
+            scheduler.run_once(now)
+            at, _ = scheduler.retries[self.bet.pk]
+            self.assertEqual(at, now + scheduler.RETRY_DELAY * delay)
+            now = at
@@ -0,0 +1,139 @@
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from stockspec.bet.models import Bet
+from stockspec.bet.settlement import Settlement
+from stockspec.portfolio.models import Portfolio, StockPrice, Ticker
+from stockspec.portfolio.returncache import get_return_cache
+from stockspec.users.models import User
+
+# a monday and a friday close, NYSE closes at 21:00 UTC in november
+START = datetime(2020, 11, 16, 22, 0, tzinfo=timezone.utc)
+END = datetime(2020, 11, 20, 22, 0, tzinfo=timezone.utc)
+NOW = END + timedelta(minutes=5)
+
+
+class SettlementMixin:
+    def setUp(self):
+        # returns of past periods are kept in process
+        get_return_cache().clear()
+        self.users = [
+            User.objects.create(username=f"user{i}", email=f"user{i}@x.io")
+            for i in range(2)
+        ]
+        self.tickers = [
+            Ticker.objects.create(symbol=f"T{i}") for i in range(2)
+        ]
+        # the close of the last session is not in yet
+        self.add_prices(range(10, 20))
+        self.portfolios = [
+            Portfolio.get_or_create_from_tickers(user, [ticker])
+            for user, ticker in zip(self.users, self.tickers)
+        ]
+
+    def add_prices(self, days):
+        """T0 gains a dollar a day, T1 stays flat"""
+        StockPrice.objects.bulk_create(
+            StockPrice(
+                ticker=ticker,
+                date=date(2020, 11, day),
+                close_price=Decimal(100 + day * (i == 0)),
+                volume=1,
+            )
+            for i, ticker in enumerate(self.tickers)
+            for day in days
+        )
+
+    def create_bets(self, count: int):
+        bets = [
+            Bet.objects.create(
+                state=Bet.RUNNING, start_time=START, end_time=END
+            )
+            for _ in range(count)
+        ]
+        for bet in bets:
+            bet.portfolios.set(self.portfolios)
+        return bets
+
+    def assertSettled(self, bets):
+        for bet in bets:
+            bet.refresh_from_db()
+            self.assertEqual(bet.state, Bet.SETTLED)
+            self.assertEqual(bet.winner, self.users[0])
+            self.assertIsNone(bet.settling_by)
+
+
+class SettlementTests(SettlementMixin, TestCase):
+    def test_waits_for_closing_prices(self):
+        bets = self.create_bets(2)
+        stats = Settlement().run(NOW)
+        self.assertEqual(stats["claimed"], 0)
+        self.assertEqual(Bet.ongoing().count(), 2)
+
+        self.add_prices([20])
+        stats = Settlement().run(NOW)
+        self.assertEqual(stats["settled"], 2)
+        self.assertSettled(bets)
+
+    def test_settles_after_grace(self):
+        bets = self.create_bets(1)
+        stats = Settlement().run(END + Settlement.GRACE)
+        self.assertEqual(stats["settled"], 1)
+        self.assertSettled(bets)
+
+    def test_chunks(self):
+        bets = self.create_bets(5)
+        self.add_prices([20])
+        stats = Settlement(chunk_size=2).run(NOW)
+        self.assertEqual(stats["claimed"], 5)
+        self.assertEqual(stats["settled"], 5)
+        self.assertSettled(bets)
+
+    def test_overlapping_runs(self):
+        bets = self.create_bets(3)
+        self.add_prices([20])
+        first, second = Settlement(), Settlement()
+        claimed = first.claim(NOW)
+        self.assertEqual(len(claimed), 3)
+
+        # the bets are claimed by the first run
+        stats = second.run(NOW)
+        self.assertEqual(stats["claimed"], 0)
+        self.assertEqual(stats["settled"], 0)
+
+        self.assertEqual(first.settle(claimed)["settled"], 3)
+        first.release()
+        self.assertSettled(bets)
+
+    def test_expired_claim(self):
+        bets = self.create_bets(2)
+        self.add_prices([20])
+        crashed = Settlement()
+        claimed = crashed.claim(NOW)
+
+        # taken over once the claim expired
+        later = NOW + Settlement.CLAIM_DURATION
+        stats = Settlement().run(later)
+        self.assertEqual(stats["claimed"], 2)
+        self.assertEqual(stats["settled"], 2)
+        self.assertSettled(bets)
+
+        # the first run doesn't write over them
+        Bet.objects.update(winner=self.users[1])
+        self.assertEqual(crashed.settle(claimed)["settled"], 0)
+        self.assertEqual(Bet.objects.filter(winner=self.users[1]).count(), 2)
+
+
+class SettlementWorkersTests(SettlementMixin, TransactionTestCase):
+    """Chunks settled in a process pool, on committed data"""
+
+    def test_workers(self):
+        bets = self.create_bets(5)
+        self.add_prices([20])
+        stats = Settlement(workers=2, chunk_size=2).run(NOW)
+        self.assertEqual(stats["claimed"], 5)
+        self.assertEqual(stats["settled"], 5)
+        self.assertSettled(bets)
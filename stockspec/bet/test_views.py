@@ -0,0 +1,150 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.test import APIClient, APIRequestFactory
+
+from stockspec.bet.models import Bet
+from stockspec.bet.serializers import JoinBetSerializer
+from stockspec.portfolio.models import Portfolio, StockPrice, Ticker
+from stockspec.portfolio.returncache import get_return_cache
+from stockspec.users.models import User
+
+
+class BetListQueriesTests(TestCase):
+    """Bet lists are served in a fixed number of queries, whatever the
+    number of bets on the page
+    """
+
+    def setUp(self):
+        self.users = [
+            User.objects.create(username=f"user{i}", email=f"user{i}@x.io")
+            for i in range(2)
+        ]
+        self.tickers = [
+            Ticker.objects.create(symbol=f"T{i}") for i in range(6)
+        ]
+        today = timezone.now().date()
+        StockPrice.objects.bulk_create(
+            StockPrice(
+                ticker=ticker,
+                date=today - timedelta(days=days),
+                close_price=Decimal(100 + days + i),
+                volume=1,
+            )
+            for i, ticker in enumerate(self.tickers)
+            for days in range(30)
+        )
+        self.portfolios = [
+            Portfolio.get_or_create_from_tickers(user, self.tickers[i::2])
+            for i, user in enumerate(self.users)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+
+    def create_bets(self, count: int):
+        """count bets of each kind: awaiting, running and finished"""
+        now = timezone.now()
+        for _ in range(count):
+            awaiting = Bet.objects.create()
+            awaiting.portfolios.set(self.portfolios[:1])
+
+            running = Bet.objects.create(
+                state=Bet.RUNNING,
+                start_time=now - timedelta(days=3),
+                end_time=now + timedelta(days=4),
+            )
+            running.portfolios.set(self.portfolios)
+
+            finished = Bet.objects.create(
+                state=Bet.SETTLED,
+                start_time=now - timedelta(days=10),
+                end_time=now - timedelta(days=3),
+                winner=self.users[1],
+            )
+            finished.portfolios.set(self.portfolios)
+
+    def assertQueries(self, url: str, queries: int) -> int:
+        """Get a page in that many queries, returns its number of bets"""
+        # returns are cached, compute them again
+        get_return_cache().clear()
+        with self.assertNumQueries(queries):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(response.json()["results"])
+
+    def assertConstantQueries(self, url: str, queries: int):
+        """count, bets, portfolios with users, tickers with stats, prices"""
+        self.create_bets(1)
+        self.assertGreater(self.assertQueries(url, queries), 0)
+        self.create_bets(9)
+        self.assertEqual(self.assertQueries(url, queries), 10)
+
+    def test_bets(self):
+        self.assertConstantQueries("/api/bets/", 5)
+
+    def test_all_bets(self):
+        self.assertConstantQueries("/api/bets/all", 5)
+
+    def test_awaiting_bets(self):
+        # not started, no prices
+        self.assertConstantQueries("/api/bets/awaiting", 4)
+
+    def test_past_bets(self):
+        self.assertConstantQueries("/api/bets/past", 5)
+
+    def test_open_returns_cached(self):
+        # running bets, their returns are open
+        self.create_bets(3)
+        self.assertQueries("/api/bets/", 5)
+        with self.assertNumQueries(4):
+            self.client.get("/api/bets/")
+        # new prices drop them
+        get_return_cache().invalidate(t.symbol for t in self.tickers)
+        with self.assertNumQueries(5):
+            self.client.get("/api/bets/")
+
+
+class JoinBetTests(TestCase):
+    def setUp(self):
+        self.users = [
+            User.objects.create(username=f"user{i}", email=f"user{i}@x.io")
+            for i in range(3)
+        ]
+        self.tickers = [
+            Ticker.objects.create(symbol=f"T{i}") for i in range(6)
+        ]
+        self.bet = Bet.objects.create()
+        self.bet.portfolios.add(
+            Portfolio.get_or_create_from_tickers(
+                self.users[0], self.tickers[:3]
+            )
+        )
+
+    def join(self, user: User, bet: Bet) -> Bet:
+        request = APIRequestFactory().post("/")
+        request.user = user
+        serializer = JoinBetSerializer(
+            bet,
+            data={"tickers": [t.symbol for t in self.tickers[3:]]},
+            context={"request": request},
+        )
+        serializer.is_valid(raise_exception=True)
+        return serializer.save()
+
+    def test_join(self):
+        bet = self.join(self.users[1], self.bet)
+        self.assertEqual(bet.state, Bet.RUNNING)
+        self.assertEqual(bet.portfolios.count(), 2)
+
+    def test_join_started_bet(self):
+        # both opponents read the bet while it was awaiting
+        stale = Bet.objects.get(pk=self.bet.pk)
+        self.join(self.users[1], self.bet)
+        with self.assertRaises(serializers.ValidationError):
+            self.join(self.users[2], stale)
+        # the late opponent's portfolio was not created
+        self.assertFalse(Portfolio.objects.filter(user=self.users[2]).exists())
+        self.assertEqual(self.bet.portfolios.count(), 2)
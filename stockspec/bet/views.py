@@ -1,5 +1,7 @@
 import logging
 
+from django.db.models import Prefetch
+
 from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
@@ -13,6 +15,7 @@ from stockspec.bet.serializers import (
     CreateBetSerializer,
     JoinBetSerializer,
 )
+from stockspec.portfolio.models import Portfolio
 
 logger = logging.getLogger(__name__)
 
@@ -79,7 +82,7 @@ class BetsViewSet(ModelViewSet):
         """
 
         if self.action == "retrieve":
-            return Bet.objects.prefetch_related("portfolios").all()
+            return self.with_related(Bet.objects.all())
 
         # by default we return user's current bets
         user = self.request.user
@@ -88,16 +91,23 @@ class BetsViewSet(ModelViewSet):
             if self.all_bets
             else Bet.objects.filter(portfolios__user=user)
         )
-        # django please join
-        queryset.prefetch_related("portfolio")
-        queryset.select_related("portfolio__user")
 
         if self.awaiting:
-            return Bet.awaiting() & queryset
+            queryset = Bet.awaiting() & queryset
         elif self.previous:
-            return Bet.finished() & queryset
-
-        if self.all_bets:
-            return Bet.ongoing()
-        return Bet.not_finished() & queryset
-
+            queryset = Bet.finished() & queryset
+        elif self.all_bets:
+            queryset = Bet.ongoing()
+        else:
+            queryset = Bet.not_finished() & queryset
+        # a stable order for pages
+        return self.with_related(queryset.order_by("-created_at", "-pk"))
+
+    def with_related(self, queryset):
+        """Load what the serializer reads in a fixed number of queries:
+        winners with the bets, then portfolios with their users, tickers
+        and stats. Joined querysets drop prefetches, this comes last.
+        """
+        return queryset.select_related("winner").prefetch_related(
+            Prefetch("portfolios", queryset=Portfolio.listed())
+        )
@@ -0,0 +1 @@
+"""Tools used to ingest data from AlphaVantage into the system."""
@@ -0,0 +1,11 @@
+from django.contrib import admin
+
+from stockspec.ingestion.models import (
+    CompanyInfoTask,
+    IngestionEntry,
+    IngestionRun,
+)
+
+admin.site.register(CompanyInfoTask)
+admin.site.register(IngestionRun)
+admin.site.register(IngestionEntry)
@@ -0,0 +1,241 @@
+import asyncio
+import logging
+from collections import Counter
+from time import monotonic
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+import aiohttp
+from asgiref.sync import sync_to_async
+
+from stockspec.alphavantage import AlphaVantage
+from stockspec.exceptions import APIRateLimited
+from stockspec.ingestion.models import IngestionRun
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncAlphaVantage:
+    """An asyncio version of the AlphaVantage ingestion.
+
+    All requests go through a single pooled aiohttp session. Keys are
+    handed out by the client's KeyManager, each key has a semaphore
+    limiting the number of requests in flight on top of its token
+    bucket. Parsed prices are handed through a bounded queue to a single
+    writer, so the database only ever sees one writer and fetching slows
+    down when the writer falls behind. A symbol whose prices could not be
+    written is retried like one whose request failed.
+    """
+
+    CONCURRENCY_PER_KEY = 10
+    MAX_CONNECTIONS = 100
+    WRITE_QUEUE_SIZE = 100
+
+    def __init__(self, av: AlphaVantage, concurrency_per_key: int = None):
+        self.av = av
+        self.concurrency_per_key = (
+            concurrency_per_key or self.CONCURRENCY_PER_KEY
+        )
+        self.session = None
+        self.semaphores = {}
+
+    async def acquire_key(self, apikey: str = None) -> str:
+        """Wait for a key to be available, see KeyManager"""
+        while True:
+            key, wait = self.av.keys.try_acquire(apikey)
+            if key is not None:
+                return key
+            await asyncio.sleep(wait)
+
+    async def fetch(self, **params) -> Tuple[Optional[bytes], Optional[str]]:
+        """encode url and make request.
+        Returns the body, None on failure, and the key used.
+        """
+
+        params["datatype"] = "csv"
+        cache = self.av.cache
+        if cache is not None:
+            # disk reads and writes, off the event loop
+            res = await sync_to_async(cache.get, thread_sensitive=False)(
+                params
+            )
+            if res is not None:
+                return res.content, None
+            if cache.replay:
+                return None, None
+
+        apikey = await self.acquire_key(params.get("apikey"))
+        params["apikey"] = apikey
+        url = f"{self.av.api_url}{urlencode(params)}"
+        content = None
+
+        async with self.semaphores[apikey]:
+            started = monotonic()
+            try:
+                async with self.session.get(url) as res:
+                    res.raise_for_status()
+                    content = await res.read()
+            except asyncio.TimeoutError:
+                logger.error(f"Timeout fetching {url}")
+            except aiohttp.ClientResponseError as ex:
+                logger.error(f"Received code {ex.status} while fetching {url}")
+            except aiohttp.ClientError:
+                logger.exception("Unknown error", stack_info=True)
+            self.av.keys.record(
+                apikey, monotonic() - started, ok=content is not None
+            )
+
+        if content is not None and cache is not None:
+            await sync_to_async(cache.put_content, thread_sensitive=False)(
+                params, content
+            )
+        return content, apikey
+
+    async def fetch_symbol(self, symbol: str, outputsize: str = "compact"):
+        """Fetch a symbol, its rows are parsed lazily by the writer"""
+
+        logger.info(f"Fetching {symbol}")
+        content, apikey = await self.fetch(
+            function="TIME_SERIES_DAILY_ADJUSTED",
+            symbol=symbol,
+            outputsize=outputsize,
+        )
+        if content is None:
+            raise Exception(f"{symbol}: request failed")
+
+        try:
+            self.av.check_payload(symbol, content)
+        except APIRateLimited:
+            self.av.keys.rate_limited(apikey)
+            raise
+        return self.av.parse(content)
+
+    async def import_symbol(
+        self,
+        symbol: str,
+        outputsize: str,
+        writes: asyncio.Queue,
+        stats: Counter,
+        run: IngestionRun = None,
+    ):
+        """Fetch a symbol and queue its prices, retrying with a backoff
+        until they are written
+        """
+
+        attempt = 0
+        while True:
+            try:
+                rows = await self.fetch_symbol(symbol, outputsize)
+                written = asyncio.get_running_loop().create_future()
+                # blocks when the writer is behind
+                await writes.put((symbol, rows, written))
+                total = await written
+            except Exception as ex:
+                attempt += 1
+                if attempt >= self.av.MAX_ATTEMPTS:
+                    logger.error(f"{symbol} generated an exception:\n{ex}")
+                    stats["failed"] += 1
+                    if run is not None:
+                        await sync_to_async(run.fail, thread_sensitive=True)(
+                            symbol, str(ex)
+                        )
+                    return
+                backoff = self.av.backoff(attempt)
+                logger.warning(
+                    f"{symbol} generated an exception, retrying "
+                    f"in {backoff}s:\n{ex}"
+                )
+                await asyncio.sleep(backoff)
+            else:
+                logger.info(f"{symbol}: found {total}")
+                stats["symbols"] += 1
+                return
+
+    async def writer(
+        self, writes: asyncio.Queue, stats: Counter, run: IngestionRun = None
+    ):
+        """Single consumer writing prices to the database in batches, the
+        outcome of every symbol is handed back to its import_symbol
+        """
+
+        sink = self.av.price_sink(run)
+        add = sync_to_async(sink.add, thread_sensitive=True)
+        while True:
+            item = await writes.get()
+            if item is None:
+                break
+
+            symbol, rows, written = item
+            try:
+                written.set_result(await add(symbol, rows))
+            except Exception as ex:
+                written.set_exception(ex)
+
+        await sync_to_async(sink.close, thread_sensitive=True)()
+        stats["inserted"] = sink.total_inserted
+
+    async def import_symbols(
+        self,
+        symbols: List[str],
+        outputsizes: Dict[str, str] = None,
+        run: IngestionRun = None,
+    ) -> Counter:
+        """Import symbols with many requests in flight, the outcome of
+        every symbol is journaled in run.
+        """
+
+        stats = Counter()
+        outputsizes = outputsizes or {}
+        writes = asyncio.Queue(maxsize=self.WRITE_QUEUE_SIZE)
+        self.semaphores = {
+            key: asyncio.Semaphore(self.concurrency_per_key)
+            for key in self.av.api_key_pool
+        }
+        connector = aiohttp.TCPConnector(limit=self.MAX_CONNECTIONS)
+        # per socket operation: waiting for a pooled connection or reading
+        # a long full history is not a timeout
+        timeout = aiohttp.ClientTimeout(
+            total=None,
+            sock_connect=self.av.REQUEST_TIMEOUT,
+            sock_read=self.av.REQUEST_TIMEOUT,
+        )
+
+        async with aiohttp.ClientSession(
+            connector=connector, timeout=timeout
+        ) as session:
+            self.session = session
+            writer = asyncio.ensure_future(self.writer(writes, stats, run))
+            try:
+                await asyncio.gather(
+                    *(
+                        self.import_symbol(
+                            symbol,
+                            outputsizes.get(symbol, "compact"),
+                            writes,
+                            stats,
+                            run,
+                        )
+                        for symbol in symbols
+                    )
+                )
+            finally:
+                # let the writer flush what was already fetched
+                await writes.put(None)
+                await writer
+                self.session = None
+
+        self.av.keys.log_stats()
+        logger.info(
+            f"Imported {stats['symbols']} symbols, inserted "
+            f"{stats['inserted']} prices, {stats['failed']} failed"
+        )
+        return stats
+
+    def run(
+        self,
+        symbols: List[str],
+        outputsizes: Dict[str, str] = None,
+        run: IngestionRun = None,
+    ) -> Counter:
+        """Run the import from synchronous code"""
+        return asyncio.run(self.import_symbols(symbols, outputsizes, run))
@@ -0,0 +1,162 @@
+import io
+import json
+import logging
+import os
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+from urllib.parse import quote
+
+import pytz
+import requests
+from django.conf import settings
+from django.utils import timezone
+
+from stockspec.tradingcalendar import NYSE, TradingCalendar
+
+logger = logging.getLogger(__name__)
+
+
+def is_throttled(content: bytes) -> bool:
+    """Whether a body is AlphaVantage's rate limit note, or the empty body
+    throttled keys sometimes get
+    """
+    if not content.strip():
+        return True
+    # notes and errors are sent as JSON even when asking for CSV
+    if content[:1] != b"{":
+        return False
+    try:
+        payload = json.loads(content)
+    except ValueError:
+        return False
+    return isinstance(payload, dict) and payload.get("Note") is not None
+
+
+class ResponseCache:
+    """An on-disk store of AlphaVantage responses.
+
+    Responses are keyed by function, symbol and outputsize. Prices only
+    change once a day, so an entry stays fresh until the first session
+    close (plus PUBLISH_DELAY) after it was downloaded.
+
+    Modes:
+        cache: serve fresh entries, store successful responses
+        record: always download, store every response (rate limit notes
+            included) so bad payloads can be replayed
+        replay: only serve stored entries, whatever their age, and never
+            touch the network
+    """
+
+    CACHE = "cache"
+    RECORD = "record"
+    REPLAY = "replay"
+    MODES = (CACHE, RECORD, REPLAY)
+
+    # time AlphaVantage needs to publish the close
+    PUBLISH_DELAY = timedelta(hours=1)
+    CHUNK_SIZE = 64 * 1024  # in bytes
+
+    def __init__(
+        self,
+        root: str,
+        mode: str = CACHE,
+        calendar: TradingCalendar = NYSE,
+    ):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown cache mode: {mode}")
+        self.root = Path(root)
+        self.mode = mode
+        self.calendar = calendar
+
+    @classmethod
+    def from_settings(cls) -> Optional["ResponseCache"]:
+        if not settings.ALPHAVANTAGE_CACHE_DIR:
+            return None
+        return cls(
+            settings.ALPHAVANTAGE_CACHE_DIR, settings.ALPHAVANTAGE_CACHE_MODE
+        )
+
+    @property
+    def replay(self) -> bool:
+        return self.mode == self.REPLAY
+
+    def path(self, params: Dict) -> Path:
+        """Where a response is stored, the api key is not part of it"""
+        name = quote(params.get("symbol", ""), safe="")
+        if params.get("outputsize"):
+            name = f"{name}-{params['outputsize']}"
+        return self.root / params.get("function", "") / f"{name}.dat"
+
+    def expires_at(self, fetched_at: datetime) -> datetime:
+        """First session close, plus publish delay, after a download"""
+        close = self.calendar.next_close(fetched_at - self.PUBLISH_DELAY)
+        return close + self.PUBLISH_DELAY
+
+    def is_fresh(self, path: Path) -> bool:
+        fetched_at = datetime.fromtimestamp(path.stat().st_mtime, tz=pytz.utc)
+        return timezone.now() < self.expires_at(fetched_at)
+
+    def response(self, path: Path) -> requests.Response:
+        """Build a response streaming a stored body"""
+        res = requests.Response()
+        res.status_code = 200
+        res.encoding = "utf-8"
+        res.url = path.as_uri()
+        res.raw = open(path, "rb")
+        return res
+
+    def get(self, params: Dict) -> Optional[requests.Response]:
+        """A stored response, if there is a usable one"""
+        if self.mode == self.RECORD:
+            return None
+
+        path = self.path(params)
+        try:
+            if self.replay or self.is_fresh(path):
+                logger.debug(f"Cache hit {path}")
+                return self.response(path)
+        except FileNotFoundError:
+            pass
+
+        if self.replay:
+            logger.error(f"Nothing recorded for {path}")
+        return None
+
+    def write(self, params: Dict, chunks: Iterable[bytes]) -> Path:
+        """Atomically store a body"""
+        path = self.path(params)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        return path
+
+    def put(self, params: Dict, res: requests.Response) -> requests.Response:
+        """Store a (streamed) response on disk and serve it from there"""
+        path = self.write(params, res.iter_content(self.CHUNK_SIZE))
+        res.close()
+
+        with open(path, "rb") as f:
+            head = f.read(self.CHUNK_SIZE)
+        if self.mode == self.CACHE and is_throttled(head):
+            # serve it once but never cache a throttled response
+            path.unlink()
+            res = requests.Response()
+            res.status_code = 200
+            res.raw = io.BytesIO(head)
+            return res
+        return self.response(path)
+
+    def put_content(self, params: Dict, content: bytes):
+        """Store a response body already in memory"""
+        if self.mode == self.CACHE and is_throttled(content):
+            return
+        self.write(params, [content])
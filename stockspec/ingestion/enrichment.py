@@ -0,0 +1,94 @@
+import logging
+from collections import Counter
+from datetime import timedelta
+from time import sleep
+
+from django.db.models import Min
+from django.utils import timezone
+
+from stockspec.alphavantage import AlphaVantage
+from stockspec.exceptions import APIRateLimited
+from stockspec.ingestion.models import CompanyInfoTask
+
+logger = logging.getLogger(__name__)
+
+
+class CompanyInfoWorker:
+    """Drain the company info queue, one OVERVIEW request at a time.
+
+    Every request takes a token from its key's bucket. Rate limited tasks
+    are simply rescheduled, failed ones get the same backoff as prices
+    and are marked as failed after MAX_ATTEMPTS.
+    """
+
+    BATCH_SIZE = 50
+    POLL_INTERVAL = 30  # in seconds
+
+    def __init__(self, av: AlphaVantage):
+        self.av = av
+
+    def run(self, follow: bool = False) -> Counter:
+        """Process due tasks until the queue is empty, or forever"""
+
+        stats = Counter()
+        while True:
+            tasks = list(
+                CompanyInfoTask.due().select_related("ticker")[
+                    : self.BATCH_SIZE
+                ]
+            )
+            for task in tasks:
+                self.process(task, stats)
+            if len(tasks) > 0:
+                continue
+
+            # wait for the next task to be due
+            next_attempt_at = CompanyInfoTask.pending().aggregate(
+                next_attempt_at=Min("next_attempt_at")
+            )["next_attempt_at"]
+            if next_attempt_at is None and not follow:
+                break
+            wait = self.POLL_INTERVAL
+            if next_attempt_at is not None:
+                delay = (next_attempt_at - timezone.now()).total_seconds()
+                wait = min(max(delay, 0), wait)
+            sleep(wait)
+
+        logger.info(
+            f"Company info: {stats['done']} done, {stats['failed']} failed"
+        )
+        return stats
+
+    def process(self, task: CompanyInfoTask, stats: Counter):
+        try:
+            # waits for a token from the key's bucket
+            self.av.get_company_info(task.ticker)
+        except APIRateLimited as ex:
+            # not the task's fault, try again once the key recovers
+            stats["rate_limited"] += 1
+            task.last_error = str(ex)
+            task.next_attempt_at = timezone.now() + timedelta(
+                seconds=self.av.BACKOFF_BASE
+            )
+            task.save()
+        except Exception as ex:
+            task.attempts += 1
+            task.last_error = str(ex)
+            if task.attempts >= self.av.MAX_ATTEMPTS:
+                logger.error(f"{task.ticker_id}: could not get company info")
+                task.status = CompanyInfoTask.FAILED
+                stats["failed"] += 1
+            else:
+                backoff = self.av.backoff(task.attempts)
+                logger.warning(
+                    f"{task.ticker_id}: company info failed, retrying "
+                    f"in {backoff}s:\n{ex}"
+                )
+                task.next_attempt_at = timezone.now() + timedelta(
+                    seconds=backoff
+                )
+            task.save()
+        else:
+            logger.info(f"{task.ticker_id}: got company info")
+            task.delete()
+            stats["done"] += 1
@@ -0,0 +1,203 @@
+"""A local stand-in for the AlphaVantage api.
+
+It serves deterministic `TIME_SERIES_DAILY_ADJUSTED` CSV and `OVERVIEW`
+JSON responses and enforces a per-key quota with the same `"Note"`
+payload AlphaVantage sends when rate limiting, so that ingestion can be
+tested and benchmarked offline.
+"""
+import csv
+import io
+import json
+import random
+import threading
+from collections import defaultdict, deque
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import monotonic, sleep
+from urllib.parse import urlparse, parse_qs
+
+RATE_LIMIT_NOTE = (
+    "Thank you for using Alpha Vantage! Our standard API call frequency is "
+    "5 calls per minute and 500 calls per day. Please visit "
+    "https://www.alphavantage.co/premium/ if you would like to target a "
+    "higher API call frequency."
+)
+INVALID_CALL = (
+    "Invalid API call. Please retry or visit the documentation "
+    "(https://www.alphavantage.co/documentation/) for {function}."
+)
+CSV_HEADER = [
+    "timestamp",
+    "open",
+    "high",
+    "low",
+    "close",
+    "adjusted_close",
+    "volume",
+    "dividend_amount",
+    "split_coefficient",
+]
+
+COMPACT_SIZE = 100
+FULL_SIZE = 20 * 252  # about 20 years of sessions
+
+
+def daily_prices(symbol: str, size: int, end: date = None):
+    """Generate `size` deterministic daily rows for a symbol, newest first"""
+
+    rnd = random.Random(symbol)
+    end = end or date.today()
+
+    # walk back to collect weekdays only
+    days = []
+    day = end
+    while len(days) < size:
+        if day.weekday() < 5:
+            days.append(day)
+        day -= timedelta(days=1)
+
+    price = rnd.uniform(10, 500)
+    rows = []
+    for day in reversed(days):
+        price = max(1, price * (1 + rnd.gauss(0, 0.02)))
+        rows.append(
+            [
+                day.isoformat(),
+                f"{price * 0.99:.4f}",
+                f"{price * 1.01:.4f}",
+                f"{price * 0.98:.4f}",
+                f"{price:.4f}",
+                f"{price:.4f}",
+                str(rnd.randrange(10 ** 5, 10 ** 8)),
+                "0.0000",
+                "1.0",
+            ]
+        )
+    rows.reverse()
+    return rows
+
+
+def overview(symbol: str):
+    """Generate a deterministic company overview"""
+
+    rnd = random.Random(symbol)
+    return {
+        "Symbol": symbol,
+        "AssetType": "Common Stock",
+        "Name": f"{symbol} Inc",
+        "Description": f"{symbol} Inc is a fake company used for testing.",
+        "Exchange": rnd.choice(["NYSE", "NASDAQ"]),
+        "Currency": "USD",
+        "Country": "USA",
+        "Sector": rnd.choice(["Technology", "Healthcare", "Energy"]),
+        "Industry": "Testing",
+        "Beta": f"{rnd.uniform(0.2, 2):.4f}",
+    }
+
+
+class FakeAlphaVantageHandler(BaseHTTPRequestHandler):
+    """Answer the subset of the api used by stockspec"""
+
+    protocol_version = "HTTP/1.1"  # keep connections alive
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_body(self, body: bytes, content_type: str):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, data):
+        self.send_body(json.dumps(data).encode("utf-8"), "application/json")
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        function = params.get("function")
+        symbol = params.get("symbol")
+
+        if self.server.latency:
+            sleep(self.server.latency)
+
+        if not self.server.allow(params.get("apikey")):
+            return self.send_json({"Note": RATE_LIMIT_NOTE})
+
+        if symbol is None or symbol in self.server.unknown_symbols:
+            return self.send_json(
+                {"Error Message": INVALID_CALL.format(function=function)}
+            )
+
+        if function == "TIME_SERIES_DAILY_ADJUSTED":
+            size = COMPACT_SIZE
+            if params.get("outputsize") == "full":
+                size = self.server.full_size
+            out = io.StringIO()
+            writer = csv.writer(out, lineterminator="\r\n")
+            writer.writerow(CSV_HEADER)
+            writer.writerows(daily_prices(symbol, size, self.server.end_date))
+            return self.send_body(out.getvalue().encode("utf-8"), "text/csv")
+
+        if function == "OVERVIEW":
+            return self.send_json(overview(symbol))
+
+        error = INVALID_CALL.format(function=function)
+        self.send_json({"Error Message": error})
+
+
+class FakeAlphaVantageServer(ThreadingHTTPServer):
+    """A threaded http server limiting each key to `rate_limit` calls
+    per minute (no limit when None).
+
+    Usage:
+        server = FakeAlphaVantageServer(("127.0.0.1", 0), rate_limit=5)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        av = AlphaVantage(["key"], api_url=server.url)
+    """
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(
+        self,
+        server_address,
+        rate_limit: int = None,
+        latency: float = 0,
+        full_size: int = FULL_SIZE,
+        end_date: date = None,
+        unknown_symbols=(),
+        verbose=False,
+    ):
+        super().__init__(server_address, FakeAlphaVantageHandler)
+        self.rate_limit = rate_limit
+        self.latency = latency
+        self.full_size = full_size
+        self.end_date = end_date
+        self.unknown_symbols = set(unknown_symbols)
+        self.verbose = verbose
+
+        self.calls = defaultdict(deque)  # apikey -> call times
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/query?"
+
+    def allow(self, apikey: str) -> bool:
+        """Sliding window of one minute per key"""
+        if self.rate_limit is None:
+            return True
+
+        now = monotonic()
+        with self.lock:
+            calls = self.calls[apikey]
+            while calls and now - calls[0] >= 60:
+                calls.popleft()
+            if len(calls) >= self.rate_limit:
+                return False
+            calls.append(now)
+        return True
@@ -0,0 +1,143 @@
+import logging
+import threading
+from time import monotonic, sleep
+from typing import Dict, List, Optional, Tuple
+
+from stockspec.ingestion.ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+class KeyHealth:
+    """Outcome of the requests made with a single key"""
+
+    def __init__(self, key: str, bucket: TokenBucket):
+        self.key = key
+        self.bucket = bucket
+        self.requests = 0
+        self.errors = 0  # timeouts, http errors...
+        self.rate_limited = 0  # "Note" payloads and empty CSV
+        self.latency = None  # moving average, in seconds
+        self.strikes = 0  # rate limits in a row
+        self.benched_until = 0  # monotonic time
+
+    def __str__(self):
+        # never log a whole key
+        return f"...{self.key[-4:]}"
+
+    @property
+    def success_rate(self) -> float:
+        if self.requests == 0:
+            return 1
+        failed = self.errors + self.rate_limited
+        return (self.requests - failed) / self.requests
+
+    @property
+    def rate_limit_rate(self) -> float:
+        if self.requests == 0:
+            return 0
+        return self.rate_limited / self.requests
+
+    def is_benched(self, now: float) -> bool:
+        return self.benched_until > now
+
+
+class KeyManager:
+    """Hand out api keys based on their health and remaining budget.
+
+    Every key has a token bucket sized to its quota. A key returning the
+    rate limit note (or an empty CSV) is benched for COOLDOWN seconds,
+    doubled for every rate limit in a row, and no work is sent to it
+    until then. Other keys are picked by shortest wait for a token, then
+    by success rate and latency, so throughput degrades with the number
+    of healthy keys instead of stalling on exhausted ones.
+    """
+
+    COOLDOWN = 60  # in seconds
+    COOLDOWN_MAX = 15 * 60  # in seconds
+    LATENCY_SMOOTHING = 0.2
+
+    def __init__(self, keys: List[str], quotas: Dict[str, int], default: int):
+        self.health = {
+            key: KeyHealth(
+                key, TokenBucket.per_minute(quotas.get(key, default))
+            )
+            for key in keys
+        }
+        self.lock = threading.Lock()
+
+    def try_acquire(self, apikey: str = None) -> Tuple[Optional[str], float]:
+        """Take a token from the best available key, or from apikey.
+        Returns the key, or None and the time to wait before trying again.
+        """
+        now = monotonic()
+        with self.lock:
+            if apikey is not None:
+                candidates = [self.health[apikey]]
+            else:
+                candidates = list(self.health.values())
+
+            ready = [h for h in candidates if not h.is_benched(now)]
+            if len(ready) == 0:
+                return None, min(h.benched_until for h in candidates) - now
+
+            waits = {h.key: h.bucket.wait_time() for h in ready}
+            best = min(
+                ready,
+                key=lambda h: (waits[h.key], -h.success_rate, h.latency or 0),
+            )
+            wait = best.bucket.try_acquire()
+            if wait > 0:
+                return None, wait
+            best.requests += 1
+            return best.key, 0
+
+    def acquire(self, apikey: str = None) -> str:
+        """Block until a key can be used, returns it"""
+        while True:
+            key, wait = self.try_acquire(apikey)
+            if key is not None:
+                return key
+            sleep(wait)
+
+    def record(self, apikey: str, latency: float, ok: bool = True):
+        """Record the round trip of a request made with a key"""
+        with self.lock:
+            health = self.health[apikey]
+            if not ok:
+                health.errors += 1
+            if health.latency is None:
+                health.latency = latency
+            else:
+                health.latency += self.LATENCY_SMOOTHING * (
+                    latency - health.latency
+                )
+
+    def rate_limited(self, apikey: str):
+        """Bench a key after it was rate limited"""
+        if apikey is None:
+            return  # served from the cache
+
+        now = monotonic()
+        with self.lock:
+            health = self.health[apikey]
+            health.rate_limited += 1
+            # the key recovered since its last bench, start over
+            if now - health.benched_until > self.COOLDOWN_MAX:
+                health.strikes = 0
+            health.strikes += 1
+            cooldown = min(
+                self.COOLDOWN * 2 ** (health.strikes - 1), self.COOLDOWN_MAX
+            )
+            health.benched_until = now + cooldown
+        logger.warning(f"Key {health} rate limited, benched for {cooldown}s")
+
+    def log_stats(self):
+        for health in self.health.values():
+            latency = health.latency or 0
+            logger.info(
+                f"Key {health}: {health.requests} requests, "
+                f"{health.success_rate:.0%} ok, "
+                f"{health.rate_limit_rate:.0%} rate limited, "
+                f"{latency * 1000:.0f}ms"
+            )
@@ -0,0 +1,143 @@
+import logging
+import os
+import socket
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+from time import sleep
+from typing import Callable, Dict
+from uuid import uuid4
+
+from django.db import connection
+from django.db.models import Min, Q, Subquery
+from django.utils import timezone
+
+from stockspec.ingestion.models import IngestionEntry, IngestionRun
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseWorker:
+    """Share the symbols of a run between worker processes.
+
+    Every worker claims a batch of pending entries with an expiry, keeps
+    its lease alive from a heartbeat thread while fetching, and releases
+    the entries once they are done or failed. Entries of a crashed worker
+    become claimable again when their lease expires, so any host sharing
+    the database can pick them up.
+    """
+
+    BATCH_SIZE = 50  # symbols per claim
+    LEASE_DURATION = timedelta(minutes=5)
+    POLL_INTERVAL = 30  # in seconds
+
+    def __init__(
+        self,
+        run: IngestionRun,
+        batch_size: int = None,
+        lease_duration: timedelta = None,
+    ):
+        self.run = run
+        self.batch_size = batch_size or self.BATCH_SIZE
+        self.lease_duration = lease_duration or self.LEASE_DURATION
+        # unique per process, hosts may share a pid
+        host = socket.gethostname()
+        self.owner = f"{host}:{os.getpid()}:{uuid4().hex[:8]}"
+
+    def __str__(self):
+        return self.owner
+
+    def pending(self):
+        return self.run.entries.filter(status=IngestionEntry.PENDING)
+
+    def claimable(self, now):
+        """Pending entries nobody holds a live lease on"""
+        return self.pending().filter(
+            Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lte=now)
+        )
+
+    def claim(self) -> Dict[str, str]:
+        """Take a batch of entries, returns a dict of symbol -> outputsize"""
+        now = timezone.now()
+        batch = (
+            self.claimable(now).order_by("pk").values("pk")[: self.batch_size]
+        )
+        # a single statement, two workers can never get the same entry
+        self.claimable(now).filter(pk__in=Subquery(batch)).update(
+            owner=self.owner,
+            lease_expires_at=now + self.lease_duration,
+            updated_at=now,
+        )
+        return dict(
+            self.pending()
+            .filter(owner=self.owner)
+            .values_list("symbol", "outputsize")
+        )
+
+    def renew(self) -> int:
+        """Push back the expiry of the entries still held"""
+        now = timezone.now()
+        return (
+            self.pending()
+            .filter(owner=self.owner)
+            .update(lease_expires_at=now + self.lease_duration)
+        )
+
+    def release(self) -> int:
+        """Give back the entries that were not processed"""
+        return (
+            self.pending()
+            .filter(owner=self.owner)
+            .update(owner=None, lease_expires_at=None)
+        )
+
+    @contextmanager
+    def heartbeat(self):
+        """Renew the lease from a thread until the block exits"""
+        stop = threading.Event()
+
+        def beat():
+            try:
+                while not stop.wait(self.lease_duration.total_seconds() / 3):
+                    self.renew()
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def next_expiry(self):
+        """When the first lease held by another worker expires"""
+        leases = self.pending().aggregate(next_expiry=Min("lease_expires_at"))
+        return leases["next_expiry"]
+
+    def work(self, ingest: Callable[[Dict[str, str]], Counter]) -> Counter:
+        """Claim and ingest batches until no entry of the run is pending.
+        ingest is called with each batch, see AlphaVantage.import_symbols.
+        """
+
+        stats = Counter()
+        try:
+            with self.heartbeat():
+                while True:
+                    plan = self.claim()
+                    if len(plan) > 0:
+                        logger.info(f"{self}: claimed {len(plan)} symbols")
+                        stats.update(ingest(plan))
+                        continue
+
+                    next_expiry = self.next_expiry()
+                    if next_expiry is None:
+                        break
+                    # other workers are busy, wait in case one crashed
+                    delay = (next_expiry - timezone.now()).total_seconds()
+                    sleep(min(max(delay, 1), self.POLL_INTERVAL))
+        finally:
+            self.release()
+        return stats
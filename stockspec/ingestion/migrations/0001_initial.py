@@ -0,0 +1,33 @@
+# Generated by Django 3.1.2 on 2026-10-17 18:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('portfolio', '0004_auto_20201123_0858'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompanyInfoTask',
+            fields=[
+                ('ticker', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='company_info_task', serialize=False, to='portfolio.ticker')),
+                ('status', models.CharField(choices=[('pending', 'pending'), ('failed', 'failed')], default='pending', max_length=10)),
+                ('attempts', models.IntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'company_info_task',
+                'ordering': ['next_attempt_at'],
+            },
+        ),
+    ]
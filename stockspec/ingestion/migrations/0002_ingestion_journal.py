@@ -0,0 +1,53 @@
+# Generated by Django 3.1.2 on 2026-10-17 18:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingestion', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestionRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('command', models.CharField(db_index=True, max_length=50)),
+                ('status', models.CharField(choices=[('running', 'running'), ('interrupted', 'interrupted'), ('finished', 'finished')], default='running', max_length=15)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'ingestion_run',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='IngestionEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('symbol', models.CharField(max_length=20)),
+                ('outputsize', models.CharField(default='compact', max_length=10)),
+                ('status', models.CharField(choices=[('pending', 'pending'), ('done', 'done'), ('failed', 'failed')], default='pending', max_length=10)),
+                ('inserted', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='ingestion.ingestionrun')),
+            ],
+            options={
+                'db_table': 'ingestion_entry',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='ingestionentry',
+            index=models.Index(fields=['run', 'status'], name='ingestion_e_run_id_4527e2_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='ingestionentry',
+            unique_together={('run', 'symbol')},
+        ),
+    ]
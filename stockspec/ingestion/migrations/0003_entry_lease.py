@@ -0,0 +1,23 @@
+# Generated by Django 3.1.2 on 2026-10-17 18:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingestion', '0002_ingestion_journal'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestionentry',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='ingestionentry',
+            name='owner',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+    ]
@@ -0,0 +1,245 @@
+from typing import Dict, List
+
+from django.db import models, transaction
+from django.utils import timezone
+
+from stockspec.portfolio.models import Ticker
+
+
+class CompanyInfoTask(models.Model):
+    """A queue of tickers waiting for their company overview.
+    Tasks are deleted once the overview is saved.
+    """
+
+    class Meta:
+        db_table = "company_info_task"
+        ordering = ["next_attempt_at"]
+
+    PENDING = "pending"
+    FAILED = "failed"
+    STATUS_CHOICES = [(PENDING, "pending"), (FAILED, "failed")]
+
+    ticker = models.OneToOneField(
+        Ticker,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="company_info_task",
+    )
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=PENDING
+    )
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now, db_index=True)
+    last_error = models.TextField(null=True, blank=True)
+
+    updated_at = models.DateTimeField(auto_now=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.ticker_id}:{self.status}"
+
+    @classmethod
+    def enqueue(cls, tickers: List[Ticker]):
+        """Add tickers to the queue, ignoring the ones already in it"""
+        cls.objects.bulk_create(
+            [cls(ticker=ticker) for ticker in tickers], ignore_conflicts=True
+        )
+
+    @classmethod
+    def pending(cls):
+        return cls.objects.filter(status=cls.PENDING)
+
+    @classmethod
+    def due(cls, now=None):
+        """Pending tasks ready to be attempted"""
+        return cls.pending().filter(next_attempt_at__lte=now or timezone.now())
+
+
+class IngestionRun(models.Model):
+    """A run of an ingestion command (get_prices, fetch_tickers...).
+    Its entries journal the progress of every symbol, so an interrupted
+    run can be resumed and its failures retried.
+    """
+
+    class Meta:
+        db_table = "ingestion_run"
+        ordering = ["-created_at"]
+
+    RUNNING = "running"
+    INTERRUPTED = "interrupted"
+    FINISHED = "finished"
+    STATUS_CHOICES = [
+        (RUNNING, "running"),
+        (INTERRUPTED, "interrupted"),
+        (FINISHED, "finished"),
+    ]
+
+    command = models.CharField(max_length=50, db_index=True)
+    status = models.CharField(
+        max_length=15, choices=STATUS_CHOICES, default=RUNNING
+    )
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    updated_at = models.DateTimeField(auto_now=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.command}#{self.pk}:{self.status}"
+
+    @classmethod
+    def start(cls, command: str, plan: Dict[str, str]) -> "IngestionRun":
+        """Create a run with a pending entry per symbol of the plan"""
+        with transaction.atomic():
+            run = cls.objects.create(command=command)
+            IngestionEntry.objects.bulk_create(
+                [
+                    IngestionEntry(run=run, symbol=symbol, outputsize=size)
+                    for symbol, size in plan.items()
+                ],
+                batch_size=500,
+            )
+        return run
+
+    @classmethod
+    def last(cls, command: str, unfinished: bool = False):
+        """The latest run of a command"""
+        runs = cls.objects.filter(command=command)
+        if unfinished:
+            runs = runs.exclude(status=cls.FINISHED)
+        return runs.first()
+
+    def restart(
+        self, pending: bool = True, failed: bool = False
+    ) -> Dict[str, str]:
+        """Mark the run as running again and return the symbols left to
+        do and/or the ones that failed, as a dict of symbol -> outputsize.
+        """
+        statuses = []
+        if pending:
+            statuses.append(IngestionEntry.PENDING)
+        if failed:
+            statuses.append(IngestionEntry.FAILED)
+
+        with transaction.atomic():
+            plan = dict(
+                self.entries.filter(status__in=statuses).values_list(
+                    "symbol", "outputsize"
+                )
+            )
+            if failed:
+                self.entries.filter(status=IngestionEntry.FAILED).update(
+                    status=IngestionEntry.PENDING,
+                    error=None,
+                    updated_at=timezone.now(),
+                )
+            self.status = self.RUNNING
+            self.finished_at = None
+            self.save()
+        return plan
+
+    def checkpoint(self, inserted: Dict[str, int]):
+        """Mark symbols as done, called once their prices are written"""
+        now = timezone.now()
+        entries = list(self.entries.filter(symbol__in=list(inserted)))
+        for entry in entries:
+            entry.status = IngestionEntry.DONE
+            entry.inserted = inserted[entry.symbol]
+            entry.error = None
+            entry.owner = None
+            entry.lease_expires_at = None
+            entry.updated_at = now
+        IngestionEntry.objects.bulk_update(
+            entries,
+            [
+                "status",
+                "inserted",
+                "error",
+                "owner",
+                "lease_expires_at",
+                "updated_at",
+            ],
+        )
+
+    def fail(self, symbol: str, error: str):
+        self.entries.filter(symbol=symbol).update(
+            status=IngestionEntry.FAILED,
+            error=error,
+            owner=None,
+            lease_expires_at=None,
+            updated_at=timezone.now(),
+        )
+
+    def finish(self) -> bool:
+        """Mark the run as finished once none of its entries is pending.
+        A single statement, of the workers sharing a run only one
+        finishes it. Returns whether this call did.
+        """
+        now = timezone.now()
+        pending = IngestionEntry.objects.filter(
+            run=models.OuterRef("pk"), status=IngestionEntry.PENDING
+        )
+        finished = (
+            IngestionRun.objects.filter(pk=self.pk)
+            .exclude(status=self.FINISHED)
+            .exclude(models.Exists(pending))
+            .update(status=self.FINISHED, finished_at=now, updated_at=now)
+        )
+        if finished == 0:
+            return False
+        self.status = self.FINISHED
+        self.finished_at = now
+        return True
+
+    def updated_symbols(self) -> List[str]:
+        """Symbols the run inserted prices for"""
+        return list(
+            self.entries.filter(
+                status=IngestionEntry.DONE, inserted__gt=0
+            ).values_list("symbol", flat=True)
+        )
+
+    def interrupt(self):
+        self.status = self.INTERRUPTED
+        self.save()
+
+    def counts(self) -> Dict[str, int]:
+        """Number of entries per status"""
+        return dict(
+            self.entries.order_by()
+            .values_list("status")
+            .annotate(count=models.Count("pk"))
+        )
+
+
+class IngestionEntry(models.Model):
+    """The progress of a symbol in an ingestion run"""
+
+    class Meta:
+        db_table = "ingestion_entry"
+        unique_together = [["run", "symbol"]]
+        indexes = [models.Index(fields=["run", "status"])]
+
+    PENDING = "pending"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [(PENDING, "pending"), (DONE, "done"), (FAILED, "failed")]
+
+    run = models.ForeignKey(
+        IngestionRun, on_delete=models.CASCADE, related_name="entries"
+    )
+    # not a foreign key, tickers are created while ingesting
+    symbol = models.CharField(max_length=20)
+    outputsize = models.CharField(max_length=10, default="compact")
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=PENDING
+    )
+    inserted = models.IntegerField(default=0)
+    error = models.TextField(null=True, blank=True)
+    # worker holding the entry and until when, see LeaseWorker
+    owner = models.CharField(max_length=100, null=True, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.symbol}:{self.status}"
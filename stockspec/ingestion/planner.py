@@ -0,0 +1,62 @@
+import logging
+from datetime import datetime
+from typing import Dict, Iterable
+
+from django.db.models import Max
+
+from stockspec.portfolio.models import Ticker
+from stockspec.tradingcalendar import TradingCalendar, calendar_for
+
+logger = logging.getLogger(__name__)
+
+COMPACT = "compact"
+FULL = "full"
+COMPACT_SIZE = 100  # sessions returned with outputsize=compact
+
+
+def plan_fetches(
+    symbols: Iterable[str] = None,
+    now: datetime = None,
+    calendar: TradingCalendar = None,
+) -> Dict[str, str]:
+    """Decide which tickers need prices and how much history to request.
+
+    Returns a dict of symbol -> outputsize, leaving out tickers that
+    already have the last session's close, on the given calendar or the
+    ticker's own. The full history is only requested when the gap is too
+    big for a compact response.
+    Tickers without prices get a compact response, like they always did.
+    """
+
+    # latest stored date for every ticker, in a single query
+    queryset = Ticker.objects.all()
+    if symbols is not None:
+        queryset = queryset.filter(symbol__in=list(symbols))
+    latest_dates = queryset.annotate(latest_date=Max("prices__date"))
+
+    plan = {}
+    last_sessions = {}
+    for symbol, latest_date, exchange, tz in latest_dates.values_list(
+        "symbol", "latest_date", "exchange", "timezone"
+    ):
+        if latest_date is None:
+            plan[symbol] = COMPACT
+            continue
+
+        ticker_calendar = calendar or calendar_for(exchange, tz)
+        if ticker_calendar not in last_sessions:
+            last_sessions[ticker_calendar] = (
+                ticker_calendar.last_closed_session(now)
+            )
+        last_session = last_sessions[ticker_calendar]
+        gap = ticker_calendar.sessions_between(latest_date, last_session)
+        if gap == 0:
+            continue  # up to date
+        plan[symbol] = COMPACT if gap < COMPACT_SIZE else FULL
+
+    last_session = max(last_sessions.values(), default=None)
+    logger.info(
+        f"{len(plan)} tickers to fetch up to session {last_session} "
+        f"({sum(size == FULL for size in plan.values())} full)"
+    )
+    return plan
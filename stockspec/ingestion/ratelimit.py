@@ -0,0 +1,56 @@
+import threading
+from time import monotonic, sleep
+
+
+class TokenBucket:
+    """A thread safe token bucket.
+
+    Tokens are added at `rate` tokens per second up to `capacity`.
+    A capacity of 1 spaces requests evenly, which is what AlphaVantage
+    expects: a quota of 5 requests per minute means one every 12 seconds.
+    """
+
+    def __init__(self, rate: float, capacity: int = 1):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = monotonic()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def per_minute(cls, quota: int, capacity: int = 1):
+        """Create a bucket from a per-minute quota"""
+        return cls(quota / 60, capacity)
+
+    def _refill(self):
+        now = monotonic()
+        elapsed = now - self.updated_at
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated_at = now
+
+    def wait_time(self) -> float:
+        """Time to wait for the next token, without taking it"""
+        with self.lock:
+            self._refill()
+            return max(0, (1 - self.tokens) / self.rate)
+
+    def try_acquire(self) -> float:
+        """Take a token if one is available.
+        Returns 0 on success, otherwise the time to wait for the next token.
+        """
+        with self.lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        """Block until a token is available and take it"""
+        while True:
+            wait = self.try_acquire()
+            if wait == 0:
+                return
+            sleep(wait)
@@ -0,0 +1,312 @@
+import heapq
+import logging
+import threading
+import datetime
+from collections import Counter, defaultdict
+from decimal import Decimal
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from django.db import transaction
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from stockspec.exceptions import APIRateLimited
+from stockspec.portfolio.models import Ticker, StockPrice
+from stockspec.portfolio.pricestore import get_store
+from stockspec.portfolio.returncache import get_return_cache
+from stockspec.portfolio.stats import refresh_ticker_stats
+
+logger = logging.getLogger(__name__)
+
+
+class PriceSink:
+    """Collect parsed prices from many symbols and write them in batches.
+
+    Each flush is a single transaction which:
+        - fetches the latest stored date and close of every new symbol
+          with one query, and creates the missing tickers in bulk
+        - inserts the new prices with bulk_create, rows already stored
+          (by a concurrent writer, a retried chunk...) are ignored
+        - updates last_price, delta and percentage_change of every
+          touched ticker with one bulk_update
+        - calls on_flush with the symbols whose rows are now all written
+    Touched tickers are refreshed in the price store and their open
+    returns invalidated once committed. Their statistics are refreshed
+    when the sink is closed, unless the caller does it once for a whole
+    run (see APIBaseCommand.finish_run).
+    Memory is bounded by the batch size, a symbol's rows can be spread
+    over several flushes. A flush that fails is rolled back as a whole,
+    its rows are written again by the next one.
+    """
+
+    BATCH_SIZE = 5000  # rows per flush
+    # symbols per count query, SQLite limits the depth of expressions
+    COUNT_CHUNK_SIZE = 200
+
+    def __init__(
+        self,
+        batch_size: int = None,
+        on_new_tickers: Callable[[List[Ticker]], None] = None,
+        on_flush: Callable[[Dict[str, int]], None] = None,
+        backfill: bool = False,
+        refresh_stats: bool = True,
+    ):
+        self.batch_size = batch_size or self.BATCH_SIZE
+        # also write rows older than the latest stored one, filling gaps
+        self.backfill = backfill
+        self.refresh_stats = refresh_stats
+        # called in the flush's transaction with the tickers it created
+        self.on_new_tickers = on_new_tickers
+        # called in the flush's transaction with symbol -> inserted rows
+        self.on_flush = on_flush
+        self.lock = threading.RLock()
+
+        self.pending = defaultdict(list)  # symbol -> [(date, close, volume)]
+        self.size = 0
+        # latest (date, close) stored before the sink saw the symbol
+        self.baselines = {}
+        # (first, last) dates written by the sink for a symbol
+        self.written = {}
+        # two latest (date, close) of a symbol, used to update tickers
+        self.closes = {}
+        self.inserted = Counter()  # symbol -> inserted rows
+        # symbols fully added, written by the next flush
+        self.completed = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def total_inserted(self) -> int:
+        return sum(self.inserted.values())
+
+    def parse_row(self, symbol: str, row: Dict):
+        # no need to continue if the data is malformed
+        if row.get("close") is None:
+            raise APIRateLimited(symbol)
+        return (
+            parse_date(row.get("timestamp")),
+            Decimal(row.get("close")),
+            int(row.get("volume")),
+        )
+
+    def add(self, symbol: str, rows: Iterable[Dict]) -> int:
+        """Queue the rows of a symbol, flushing whenever the batch is full.
+        Returns the number of rows read.
+        """
+        count = 0
+        try:
+            for row in rows:
+                price = self.parse_row(symbol, row)
+                count += 1
+                with self.lock:
+                    self.pending[symbol].append(price)
+                    self.size += 1
+                    if self.size >= self.batch_size:
+                        self.flush()
+        except Exception:
+            # drop what was not written yet, the symbol can be retried
+            with self.lock:
+                self.size -= len(self.pending.pop(symbol, []))
+            raise
+        with self.lock:
+            self.completed.append(symbol)
+        return count
+
+    def flush(self) -> int:
+        """Write pending prices in a single transaction"""
+        with self.lock:
+            if self.size == 0 and len(self.completed) == 0:
+                return 0
+            pending = self.pending
+            completed = self.completed
+            size = self.size
+            state = self.state()
+            self.pending = defaultdict(list)
+            self.size = 0
+            self.completed = []
+
+            try:
+                with transaction.atomic():
+                    written = self.write(pending)
+                    if self.on_flush is not None and len(completed) > 0:
+                        self.on_flush(
+                            {
+                                symbol: self.inserted[symbol]
+                                for symbol in completed
+                            }
+                        )
+            except Exception:
+                # nothing was stored: forget what the write saw, and keep
+                # the batch for the next flush
+                self.restore(state)
+                self.pending = pending
+                self.size = size
+                self.completed = completed
+                raise
+            return written
+
+    def state(self) -> Tuple:
+        """What a write learns about the stored prices"""
+        return (
+            dict(self.baselines),
+            dict(self.written),
+            dict(self.closes),
+            Counter(self.inserted),
+        )
+
+    def restore(self, state: Tuple):
+        self.baselines, self.written, self.closes, self.inserted = state
+
+    def close(self):
+        """Write what is left and refresh the statistics of the tickers
+        that got new prices
+        """
+        self.flush()
+        symbols = [symbol for symbol, n in self.inserted.items() if n > 0]
+        if self.refresh_stats and len(symbols) > 0:
+            refresh_ticker_stats(symbols)
+
+    def load_baselines(self, symbols: List[str]):
+        """Get the latest price of symbols, create missing tickers"""
+        latest = StockPrice.objects.filter(ticker=OuterRef("pk")).order_by(
+            "-date"
+        )
+        rows = (
+            Ticker.objects.filter(symbol__in=symbols)
+            .annotate(
+                latest_date=Subquery(latest.values("date")[:1]),
+                latest_close=Subquery(latest.values("close_price")[:1]),
+            )
+            .values_list("symbol", "latest_date", "latest_close")
+        )
+        for symbol, latest_date, latest_close in rows:
+            self.baselines[symbol] = (latest_date, latest_close)
+            if latest_date is not None:
+                self.closes[symbol] = [(latest_date, latest_close)]
+
+        missing = [
+            symbol for symbol in symbols if symbol not in self.baselines
+        ]
+        if len(missing) > 0:
+            tickers = Ticker.objects.bulk_create(
+                [Ticker(symbol=symbol) for symbol in missing]
+            )
+            for ticker in tickers:
+                self.baselines[ticker.symbol] = (None, None)
+            if self.on_new_tickers is not None:
+                self.on_new_tickers(tickers)
+
+    def is_new(self, symbol: str, date) -> bool:
+        latest_date, _ = self.baselines[symbol]
+        stored = latest_date is not None and date <= latest_date
+        if stored and not self.backfill:
+            return False
+        first, last = self.written.get(symbol, (None, None))
+        return first is None or not first <= date <= last
+
+    def write(self, pending: Dict[str, List]) -> int:
+        self.load_baselines([s for s in pending if s not in self.baselines])
+
+        objs = []
+        touched = []
+        # dates of the rows sent for each symbol
+        ranges = {}
+        for symbol, prices in pending.items():
+            new = [price for price in prices if self.is_new(symbol, price[0])]
+            if len(new) == 0:
+                continue
+
+            # rows are consecutive so the written dates stay a range
+            dates = [date for date, _, _ in new]
+            first, last = self.written.get(symbol, (min(dates), max(dates)))
+            self.written[symbol] = (
+                min(first, min(dates)),
+                max(last, max(dates)),
+            )
+            self.closes[symbol] = heapq.nlargest(
+                2,
+                self.closes.get(symbol, [])
+                + [(date, close) for date, close, _ in new],
+            )
+            ranges[symbol] = (min(dates), max(dates))
+            touched.append(symbol)
+
+            objs.extend(
+                StockPrice(
+                    ticker_id=symbol,
+                    date=date,
+                    close_price=close,
+                    volume=volume,
+                )
+                for date, close, volume in new
+            )
+
+        # rows may be stored already (a backfill, a concurrent writer, a
+        # retried chunk...), count what the insert added
+        before = self.count_prices(ranges)
+        # the (ticker, date) constraint makes writes idempotent
+        StockPrice.objects.bulk_create(objs, ignore_conflicts=True)
+        after = self.count_prices(ranges)
+        inserted = Counter({s: after[s] - before[s] for s in touched})
+        self.inserted.update(inserted)
+        self.update_tickers(touched)
+
+        store = get_store()
+        if store is not None and len(touched) > 0:
+            transaction.on_commit(lambda: store.refresh(touched))
+        if len(touched) > 0:
+            cache = get_return_cache()
+            if self.backfill:
+                # older closes can change any return of these tickers
+                transaction.on_commit(lambda: cache.forget(touched))
+            else:
+                # new closes change their open returns
+                transaction.on_commit(lambda: cache.invalidate(touched))
+
+        written = sum(inserted.values())
+        logger.info(f"Inserted {written} prices for {len(touched)} tickers")
+        return written
+
+    def count_prices(
+        self, ranges: Dict[str, Tuple[datetime.date, datetime.date]]
+    ) -> Counter:
+        """Number of stored prices of symbols between two dates"""
+        counts = Counter()
+        symbols = list(ranges)
+        for i in range(0, len(symbols), self.COUNT_CHUNK_SIZE):
+            within = Q()
+            for symbol in symbols[i : i + self.COUNT_CHUNK_SIZE]:
+                within |= Q(ticker_id=symbol, date__range=ranges[symbol])
+            rows = (
+                StockPrice.objects.filter(within)
+                .order_by()
+                .values("ticker_id")
+                .annotate(count=Count("pk"))
+                .values_list("ticker_id", "count")
+            )
+            counts.update(dict(rows))
+        return counts
+
+    def update_tickers(self, symbols: List[str]):
+        """Update the latest price and performance of tickers"""
+        now = timezone.now()
+        tickers = []
+        for symbol in symbols:
+            closes = self.closes[symbol]
+            ticker = Ticker(symbol=symbol, last_updated=now)
+            ticker.last_price = closes[0][1]
+            if len(closes) > 1:
+                start = closes[1][1]
+                ticker.delta = ticker.last_price - start
+                ticker.percentage_change = ticker.delta / start
+            tickers.append(ticker)
+
+        Ticker.objects.bulk_update(
+            tickers,
+            ["last_price", "delta", "percentage_change", "last_updated"],
+        )
@@ -0,0 +1,63 @@
+from unittest import mock
+
+from django.test import TransactionTestCase
+
+from stockspec.ingestion.aio import AsyncAlphaVantage
+from stockspec.ingestion.fakeapi import COMPACT_SIZE
+from stockspec.ingestion.models import IngestionRun
+from stockspec.ingestion.sink import PriceSink
+from stockspec.portfolio.models import StockPrice
+from stockspec.test_alphavantage import fake_api
+
+
+class AsyncImportTests(TransactionTestCase):
+    """Requests are made from the event loop, prices written by a single
+    writer on its own connection
+    """
+
+    symbols = ["AAA", "BBB", "CCC"]
+
+    def setUp(self):
+        self.run = IngestionRun.start(
+            "test", dict.fromkeys(self.symbols, "compact")
+        )
+
+    def test_import(self):
+        av = AsyncAlphaVantage(fake_api(self), concurrency_per_key=2)
+        stats = av.run(self.symbols, run=self.run)
+
+        self.assertEqual(stats["symbols"], 3)
+        self.assertEqual(stats["inserted"], 3 * COMPACT_SIZE)
+        for symbol in self.symbols:
+            prices = StockPrice.objects.filter(ticker_id=symbol)
+            self.assertEqual(prices.count(), COMPACT_SIZE)
+        self.assertEqual(self.run.counts(), {"done": 3})
+
+    def test_failed_requests(self):
+        av = AsyncAlphaVantage(
+            fake_api(self, api_url="http://127.0.0.1:9/query?")
+        )
+        stats = av.run(self.symbols, run=self.run)
+
+        self.assertEqual(stats["failed"], 3)
+        self.assertEqual(stats["inserted"], 0)
+        self.assertEqual(self.run.counts(), {"failed": 3})
+
+    def test_failed_writes_are_retried(self):
+        add = PriceSink.add
+        failures = {"BBB"}
+
+        def flaky_add(sink, symbol, rows):
+            if symbol in failures:
+                failures.remove(symbol)
+                raise OSError("disk full")
+            return add(sink, symbol, rows)
+
+        av = AsyncAlphaVantage(fake_api(self))
+        with mock.patch.object(PriceSink, "add", flaky_add):
+            stats = av.run(self.symbols, run=self.run)
+
+        self.assertEqual(stats["symbols"], 3)
+        self.assertEqual(stats["failed"], 0)
+        self.assertEqual(stats["inserted"], 3 * COMPACT_SIZE)
+        self.assertEqual(self.run.counts(), {"done": 3})
@@ -0,0 +1,71 @@
+from collections import Counter
+
+from django.test import TestCase
+from django.utils import timezone
+
+from stockspec.ingestion.enrichment import CompanyInfoWorker
+from stockspec.ingestion.models import CompanyInfoTask
+from stockspec.ingestion.test_sink import rows
+from stockspec.portfolio.models import Ticker
+from stockspec.test_alphavantage import fake_api
+
+
+class CompanyInfoTests(TestCase):
+    def test_new_tickers_are_queued(self):
+        av = fake_api(self)
+        for symbol in ("AAA", "BBB"):
+            av.insert_prices(symbol, rows(3))
+        self.assertEqual(
+            set(CompanyInfoTask.due().values_list("ticker_id", flat=True)),
+            {"AAA", "BBB"},
+        )
+        # only once
+        CompanyInfoTask.enqueue(list(Ticker.objects.all()))
+        self.assertEqual(CompanyInfoTask.objects.count(), 2)
+
+    def test_worker(self):
+        av = fake_api(self)
+        CompanyInfoTask.enqueue(
+            [Ticker.objects.create(symbol=s) for s in ("AAA", "BBB")]
+        )
+        stats = CompanyInfoWorker(av).run()
+
+        self.assertEqual(stats["done"], 2)
+        self.assertFalse(CompanyInfoTask.objects.exists())
+        ticker = Ticker.objects.get(symbol="AAA")
+        self.assertEqual(ticker.company, "AAA Inc")
+        self.assertIsNotNone(ticker.beta)
+
+    def test_failed_tasks_are_retried(self):
+        av = fake_api(self, unknown_symbols=["BAD"])
+        CompanyInfoTask.enqueue([Ticker.objects.create(symbol="BAD")])
+        worker = CompanyInfoWorker(av)
+
+        task = CompanyInfoTask.objects.get()
+        worker.process(task, Counter())
+        task.refresh_from_db()
+        self.assertEqual(task.status, CompanyInfoTask.PENDING)
+        self.assertEqual(task.attempts, 1)
+        self.assertIn("Invalid API call", task.last_error)
+
+        # retried until it runs out of attempts
+        stats = worker.run()
+        self.assertEqual(stats["failed"], 1)
+        task.refresh_from_db()
+        self.assertEqual(task.status, CompanyInfoTask.FAILED)
+        self.assertEqual(task.attempts, av.MAX_ATTEMPTS)
+        self.assertFalse(CompanyInfoTask.pending().exists())
+
+    def test_rate_limited_tasks_are_rescheduled(self):
+        av = fake_api(self, rate_limit=0)
+        av.BACKOFF_BASE = 60
+        CompanyInfoTask.enqueue([Ticker.objects.create(symbol="AAA")])
+
+        stats = Counter()
+        CompanyInfoWorker(av).process(CompanyInfoTask.objects.get(), stats)
+        self.assertEqual(stats["rate_limited"], 1)
+        task = CompanyInfoTask.objects.get()
+        # not the task's fault
+        self.assertEqual(task.attempts, 0)
+        self.assertGreater(task.next_attempt_at, timezone.now())
+        self.assertFalse(CompanyInfoTask.due().exists())
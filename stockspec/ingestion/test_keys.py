@@ -0,0 +1,88 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from stockspec.ingestion.keys import KeyManager
+from stockspec.ingestion.test_ratelimit import Clock
+
+
+class KeyManagerTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = Clock()
+        for module in ("keys", "ratelimit"):
+            patcher = mock.patch(
+                f"stockspec.ingestion.{module}.monotonic", self.clock
+            )
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # a request per second for each key
+        self.keys = KeyManager(["k1", "k2"], {}, default=60)
+
+    def test_keys_take_turns(self):
+        first, _ = self.keys.try_acquire()
+        second, _ = self.keys.try_acquire()
+        self.assertEqual({first, second}, {"k1", "k2"})
+        # both buckets are empty
+        key, wait = self.keys.try_acquire()
+        self.assertIsNone(key)
+        self.assertAlmostEqual(wait, 1)
+
+    def test_healthier_key_first(self):
+        for key, ok in (("k1", False), ("k2", True)):
+            self.keys.try_acquire(key)
+            self.keys.record(key, 0.1, ok=ok)
+        self.clock.now += 1
+        self.assertEqual(self.keys.try_acquire(), ("k2", 0))
+
+    def test_rate_limited_key_is_benched(self):
+        self.keys.rate_limited("k1")
+        health = self.keys.health["k1"]
+        self.assertEqual(health.benched_until, self.clock.now + 60)
+
+        for _ in range(3):
+            self.assertEqual(self.keys.try_acquire(), ("k2", 0))
+            self.clock.now += 1
+        # only k1 was asked for
+        key, wait = self.keys.try_acquire("k1")
+        self.assertIsNone(key)
+        self.assertAlmostEqual(wait, 57)
+
+        self.clock.now += 57
+        self.assertEqual(self.keys.try_acquire("k1"), ("k1", 0))
+
+    def test_bench_doubles(self):
+        health = self.keys.health["k1"]
+        for cooldown in (60, 120, 240):
+            self.keys.rate_limited("k1")
+            self.assertEqual(health.benched_until, self.clock.now + cooldown)
+            self.clock.now += cooldown
+        # up to COOLDOWN_MAX
+        for _ in range(5):
+            self.keys.rate_limited("k1")
+        self.assertEqual(health.benched_until, self.clock.now + 15 * 60)
+
+        # a key that recovered starts over
+        self.clock.now += 2 * 15 * 60 + 1
+        self.keys.rate_limited("k1")
+        self.assertEqual(health.benched_until, self.clock.now + 60)
+
+    def test_every_key_benched(self):
+        self.keys.rate_limited("k1")
+        self.clock.now += 10
+        self.keys.rate_limited("k2")
+        key, wait = self.keys.try_acquire()
+        self.assertIsNone(key)
+        # until the first one is back
+        self.assertEqual(wait, 50)
+
+    def test_stats(self):
+        self.keys.try_acquire("k1")
+        self.keys.record("k1", 0.2)
+        self.clock.now += 1
+        self.keys.try_acquire("k1")
+        self.keys.rate_limited("k1")
+        health = self.keys.health["k1"]
+        self.assertEqual(health.requests, 2)
+        self.assertEqual(health.success_rate, 0.5)
+        self.assertEqual(health.rate_limit_rate, 0.5)
+        self.assertEqual(str(health), "...k1")
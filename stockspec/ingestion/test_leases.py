@@ -0,0 +1,106 @@
+from collections import Counter
+from datetime import timedelta
+from time import sleep
+
+from django.db.models import Min
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from stockspec.ingestion.leases import LeaseWorker
+from stockspec.ingestion.models import IngestionEntry, IngestionRun
+
+SYMBOLS = ["AAA", "BBB", "CCC", "DDD", "EEE"]
+
+
+def start_run() -> IngestionRun:
+    return IngestionRun.start("get_prices", dict.fromkeys(SYMBOLS, "full"))
+
+
+class LeaseTests(TestCase):
+    def setUp(self):
+        self.run = start_run()
+        self.workers = [LeaseWorker(self.run, batch_size=2) for _ in "ab"]
+
+    def test_claims_are_disjoint(self):
+        first, second = (worker.claim() for worker in self.workers)
+        self.assertEqual(first, {"AAA": "full", "BBB": "full"})
+        self.assertEqual(second, {"CCC": "full", "DDD": "full"})
+        # the last one, on top of what it holds
+        self.assertEqual(len(self.workers[0].claim()), 3)
+        self.assertEqual(self.workers[1].claim(), second)
+
+    def test_expired_leases_are_claimed_again(self):
+        crashed, worker = self.workers
+        crashed.claim()
+        self.run.entries.filter(owner=crashed.owner).update(
+            lease_expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        worker.batch_size = 5
+        self.assertEqual(set(worker.claim()), set(SYMBOLS))
+        self.assertEqual(crashed.renew(), 0)
+
+    def test_renew(self):
+        worker = self.workers[0]
+        worker.claim()
+        entries = self.run.entries.filter(owner=worker.owner)
+        expiry = entries.aggregate(m=Min("lease_expires_at"))["m"]
+        self.assertEqual(worker.renew(), 2)
+        self.assertGreater(
+            entries.aggregate(m=Min("lease_expires_at"))["m"], expiry
+        )
+        # done entries are not held anymore
+        self.run.checkpoint({"AAA": 1})
+        self.assertEqual(worker.renew(), 1)
+
+    def test_release(self):
+        worker, other = self.workers
+        worker.claim()
+        self.run.fail("AAA", "AAA: request failed")
+        self.assertEqual(worker.release(), 1)
+        self.assertEqual(other.claim(), {"BBB": "full", "CCC": "full"})
+        self.assertEqual(
+            self.run.entries.get(symbol="AAA").status, IngestionEntry.FAILED
+        )
+
+    def test_finish(self):
+        self.assertFalse(self.run.finish())
+        self.run.checkpoint(dict.fromkeys(SYMBOLS[1:], 0))
+        self.run.fail("AAA", "AAA: request failed")
+        self.assertTrue(self.run.finish())
+        # of the workers sharing the run, only one finishes it
+        self.assertFalse(IngestionRun.objects.get().finish())
+        self.assertEqual(self.run.status, IngestionRun.FINISHED)
+
+
+class LeaseWorkerTests(TransactionTestCase):
+    """The heartbeat renews leases from its own connection"""
+
+    def setUp(self):
+        self.run = start_run()
+
+    def test_heartbeat(self):
+        worker = LeaseWorker(
+            self.run, batch_size=2, lease_duration=timedelta(seconds=0.3)
+        )
+        worker.claim()
+        entries = self.run.entries.filter(owner=worker.owner)
+        claimed = entries.aggregate(m=Min("lease_expires_at"))["m"]
+        with worker.heartbeat():
+            sleep(0.5)
+        # renewed past the end of the first lease
+        renewed = entries.aggregate(m=Min("lease_expires_at"))["m"]
+        self.assertGreater(renewed, claimed + timedelta(seconds=0.1))
+
+    def test_work(self):
+        batches = []
+
+        def ingest(plan):
+            batches.append(sorted(plan))
+            self.run.checkpoint(dict.fromkeys(plan, 1))
+            return Counter(symbols=len(plan))
+
+        worker = LeaseWorker(self.run, batch_size=2)
+        self.assertEqual(worker.work(ingest), {"symbols": 5})
+        self.assertEqual(batches, [["AAA", "BBB"], ["CCC", "DDD"], ["EEE"]])
+        self.assertEqual(self.run.counts(), {"done": 5})
+        self.assertFalse(self.run.entries.exclude(owner=None).exists())
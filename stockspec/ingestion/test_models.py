@@ -0,0 +1,77 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TransactionTestCase, override_settings
+
+from stockspec.ingestion.fakeapi import COMPACT_SIZE
+from stockspec.ingestion.models import IngestionEntry, IngestionRun
+from stockspec.portfolio.models import StockPrice
+from stockspec.test_alphavantage import QUOTAS, fake_server
+
+
+class JournalTests(TransactionTestCase):
+    """An interrupted fetch_tickers run: AAA was written, BBB failed and
+    CCC was never fetched
+    """
+
+    def setUp(self):
+        server = fake_server(self)
+        settings = override_settings(
+            ALPHAVANTAGE_API_URL=server.url,
+            ALPHAVANTAGE_KEY_POOL=list(QUOTAS),
+            ALPHAVANTAGE_KEY_QUOTAS=QUOTAS,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.run = IngestionRun.start(
+            "fetch_tickers", dict.fromkeys(["AAA", "BBB", "CCC"], "compact")
+        )
+        self.run.checkpoint({"AAA": 0})
+        self.run.fail("BBB", "BBB: request failed")
+        self.run.interrupt()
+
+    def fetch_tickers(self, *args):
+        out = StringIO()
+        call_command("fetch_tickers", *args, stdout=out)
+        self.run.refresh_from_db()
+        return out.getvalue()
+
+    def fetched(self):
+        return set(
+            StockPrice.objects.values_list("ticker_id", flat=True).distinct()
+        )
+
+    def test_restart(self):
+        self.assertEqual(self.run.restart(), {"CCC": "compact"})
+        self.assertEqual(self.run.status, IngestionRun.RUNNING)
+        self.assertEqual(
+            self.run.restart(pending=False, failed=True), {"BBB": "compact"}
+        )
+        entry = self.run.entries.get(symbol="BBB")
+        self.assertEqual(entry.status, IngestionEntry.PENDING)
+        self.assertIsNone(entry.error)
+
+    def test_resume(self):
+        self.fetch_tickers("--resume")
+        self.assertEqual(self.fetched(), {"CCC"})
+        self.assertEqual(self.run.status, IngestionRun.FINISHED)
+        self.assertEqual(self.run.counts(), {"done": 2, "failed": 1})
+        self.assertEqual(
+            self.run.entries.get(symbol="CCC").inserted, COMPACT_SIZE
+        )
+        # nothing left to resume
+        self.assertIn("No run to resume", self.fetch_tickers("--resume"))
+
+    def test_retry_failed(self):
+        self.fetch_tickers("--resume", "--retry-failed")
+        self.assertEqual(self.fetched(), {"BBB", "CCC"})
+        self.assertEqual(self.run.status, IngestionRun.FINISHED)
+        self.assertEqual(self.run.counts(), {"done": 3})
+
+    def test_new_run(self):
+        self.fetch_tickers("-t", "DDD")
+        self.assertEqual(self.fetched(), {"DDD"})
+        # the interrupted run is left alone
+        self.assertEqual(self.run.status, IngestionRun.INTERRUPTED)
+        self.assertEqual(IngestionRun.objects.count(), 2)
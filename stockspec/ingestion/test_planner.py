@@ -0,0 +1,62 @@
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import pytz
+from django.test import TestCase
+
+from stockspec.ingestion.planner import (
+    COMPACT,
+    COMPACT_SIZE,
+    FULL,
+    plan_fetches,
+)
+from stockspec.portfolio.models import StockPrice, Ticker
+from stockspec.tradingcalendar import NYSE
+
+# after the close of Friday 2020-11-20
+NOW = datetime(2020, 11, 20, 22, tzinfo=pytz.utc)
+LAST_SESSION = date(2020, 11, 20)
+
+
+def sessions_before(day: date, count: int) -> date:
+    """The session count sessions before day"""
+    for _ in range(count):
+        day = NYSE.previous_session(day)
+    return day
+
+
+class PlanFetchesTests(TestCase):
+    def add_ticker(self, symbol: str, latest: date = None):
+        ticker = Ticker.objects.create(symbol=symbol)
+        if latest is not None:
+            StockPrice.objects.create(
+                ticker=ticker,
+                date=latest,
+                close_price=Decimal(1),
+                volume=1,
+            )
+
+    def test_up_to_date(self):
+        self.add_ticker("AAA", LAST_SESSION)
+        self.assertEqual(plan_fetches(now=NOW), {})
+        # nothing closed over the weekend
+        self.assertEqual(plan_fetches(now=NOW + timedelta(days=2)), {})
+
+    def test_gaps(self):
+        self.add_ticker("NEW")
+        self.add_ticker("AAA", LAST_SESSION)
+        self.add_ticker("BBB", sessions_before(LAST_SESSION, 1))
+        self.add_ticker("CCC", sessions_before(LAST_SESSION, COMPACT_SIZE - 1))
+        self.add_ticker("DDD", sessions_before(LAST_SESSION, COMPACT_SIZE))
+
+        self.assertEqual(
+            plan_fetches(now=NOW),
+            {"NEW": COMPACT, "BBB": COMPACT, "CCC": COMPACT, "DDD": FULL},
+        )
+        # only some tickers
+        self.assertEqual(plan_fetches(["AAA", "DDD"], now=NOW), {"DDD": FULL})
+
+    def test_before_the_close(self):
+        # Thursday's close is the last one
+        self.add_ticker("AAA", sessions_before(LAST_SESSION, 1))
+        self.assertEqual(plan_fetches(now=NOW - timedelta(hours=6)), {})
@@ -0,0 +1,56 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from stockspec.ingestion.ratelimit import TokenBucket
+
+
+class Clock:
+    """A monotonic clock moved by hand"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TokenBucketTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch(
+            "stockspec.ingestion.ratelimit.monotonic", self.clock
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_per_minute(self):
+        bucket = TokenBucket.per_minute(5)
+        self.assertEqual(bucket.try_acquire(), 0)
+        # one request every 12 seconds
+        self.assertAlmostEqual(bucket.try_acquire(), 12)
+        self.clock.now += 12
+        self.assertEqual(bucket.try_acquire(), 0)
+
+    def test_capacity(self):
+        bucket = TokenBucket(rate=1, capacity=2)
+        self.assertEqual(bucket.try_acquire(), 0)
+        self.assertEqual(bucket.try_acquire(), 0)
+        self.assertAlmostEqual(bucket.try_acquire(), 1)
+        # tokens don't pile up over the capacity
+        self.clock.now += 60
+        self.assertEqual(bucket.try_acquire(), 0)
+        self.assertEqual(bucket.try_acquire(), 0)
+        self.assertGreater(bucket.try_acquire(), 0)
+
+    def test_wait_time_takes_no_token(self):
+        bucket = TokenBucket(rate=2)
+        self.assertEqual(bucket.wait_time(), 0)
+        self.assertEqual(bucket.try_acquire(), 0)
+        self.clock.now += 0.25
+        self.assertAlmostEqual(bucket.wait_time(), 0.25)
+        self.assertAlmostEqual(bucket.try_acquire(), 0.25)
+
+    def test_rate_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            TokenBucket(rate=0)
@@ -0,0 +1,114 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.test import TestCase
+
+from stockspec.ingestion.sink import PriceSink
+from stockspec.portfolio.models import StockPrice, Ticker
+
+START = date(2020, 11, 2)
+
+
+def rows(count: int, start: date = START, close: int = 100):
+    """count daily rows from start, newest first like AlphaVantage"""
+    return [
+        {
+            "timestamp": (start + timedelta(days=i)).isoformat(),
+            "close": str(close + i),
+            "volume": "1000",
+        }
+        for i in reversed(range(count))
+    ]
+
+
+class PriceSinkTests(TestCase):
+    def setUp(self):
+        self.flushed = []
+        self.sink = PriceSink(
+            batch_size=4, on_flush=self.flushed.append, refresh_stats=False
+        )
+
+    def test_batches(self):
+        self.sink.add("AAA", rows(10))
+        # a symbol is only checkpointed once all its rows are written
+        self.assertEqual(self.flushed, [])
+        self.assertEqual(StockPrice.objects.count(), 8)
+        # the batch filled by BBB completes AAA
+        self.sink.add("BBB", rows(3))
+        self.assertEqual(self.flushed, [{"AAA": 10}])
+        self.sink.close()
+
+        self.assertEqual(self.flushed, [{"AAA": 10}, {"BBB": 3}])
+        self.assertEqual(self.sink.inserted, {"AAA": 10, "BBB": 3})
+        self.assertEqual(self.sink.total_inserted, 13)
+        ticker = Ticker.objects.get(symbol="AAA")
+        self.assertEqual(ticker.last_price, Decimal(109))
+        self.assertEqual(ticker.delta, Decimal(1))
+
+    def test_only_newer_rows(self):
+        self.sink.add("AAA", rows(5))
+        self.sink.close()
+
+        sink = PriceSink(refresh_stats=False)
+        with sink:
+            # a compact response overlapping the stored prices
+            sink.add("AAA", rows(5, START + timedelta(days=3), close=103))
+        self.assertEqual(sink.inserted, {"AAA": 3})
+        self.assertEqual(StockPrice.objects.count(), 8)
+
+    def test_failed_flush_is_rolled_back(self):
+        self.sink.add("AAA", rows(3))
+        with mock.patch.object(
+            PriceSink, "update_tickers", side_effect=OSError("disk full")
+        ):
+            with self.assertRaises(OSError):
+                self.sink.flush()
+
+        # nothing was stored, the batch is kept for the next flush
+        self.assertEqual(StockPrice.objects.count(), 0)
+        self.assertFalse(Ticker.objects.filter(symbol="AAA").exists())
+        self.assertEqual(self.sink.total_inserted, 0)
+        self.assertEqual(self.flushed, [])
+
+        self.sink.close()
+        self.assertEqual(StockPrice.objects.count(), 3)
+        self.assertEqual(self.sink.inserted, {"AAA": 3})
+        self.assertEqual(self.flushed, [{"AAA": 3}])
+
+    def test_failed_symbol_is_dropped(self):
+        broken = rows(6)
+        del broken[5]["close"]
+        with self.assertRaises(Exception):
+            self.sink.add("AAA", broken)
+        self.sink.add("BBB", rows(2))
+        self.sink.close()
+
+        # the rows flushed before the failure stay, the symbol is retried
+        self.assertEqual(self.flushed, [{"BBB": 2}])
+        self.assertEqual(StockPrice.objects.filter(ticker_id="AAA").count(), 4)
+
+    def test_concurrent_writers(self):
+        other = PriceSink(refresh_stats=False)
+        # both saw no prices for AAA
+        other.load_baselines(["AAA"])
+        self.sink.add("AAA", rows(3))
+        self.sink.close()
+
+        # rows written meanwhile are ignored, not an integrity error
+        with other:
+            other.add("AAA", rows(5))
+        self.assertEqual(other.inserted, {"AAA": 2})
+        self.assertEqual(StockPrice.objects.count(), 5)
+
+    def test_backfill(self):
+        stored = rows(10)
+        del stored[3:6]
+        with PriceSink(refresh_stats=False) as sink:
+            sink.add("AAA", stored)
+
+        with PriceSink(backfill=True, refresh_stats=False) as sink:
+            sink.add("AAA", rows(10))
+        # only the gap was missing
+        self.assertEqual(sink.inserted, {"AAA": 3})
+        self.assertEqual(StockPrice.objects.count(), 10)
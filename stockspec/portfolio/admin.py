@@ -1,7 +1,19 @@
 from django.contrib import admin
 
-from stockspec.portfolio.models import Portfolio, Ticker, StockPrice
+from stockspec.portfolio.models import (
+    Portfolio,
+    Ticker,
+    TickerCorrelation,
+    TickerPopularity,
+    TickerRisk,
+    TickerStats,
+    StockPrice,
+)
 
 admin.site.register(Portfolio)
 admin.site.register(Ticker)
+admin.site.register(TickerStats)
+admin.site.register(TickerRisk)
+admin.site.register(TickerCorrelation)
+admin.site.register(TickerPopularity)
 admin.site.register(StockPrice)
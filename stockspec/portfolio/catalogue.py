@@ -0,0 +1,78 @@
+import gzip
+import logging
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional, Tuple
+
+from django.core.cache import cache
+from django.db.models import Count, Max, Q
+from rest_framework.renderers import JSONRenderer
+
+from stockspec.portfolio.models import Ticker, TickerStats
+from stockspec.portfolio.serializers import TickerSerializer
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = "catalogue"
+# changes may commit that long after their last_updated (a long
+# ingestion transaction), the changes feed looks back that far
+CHANGES_MARGIN = timedelta(minutes=10)
+
+
+class Catalogue(NamedTuple):
+    """The serialized list of every ticker, as sent and gzipped"""
+
+    etag: str
+    last_modified: Optional[datetime]
+    content: bytes
+    compressed: bytes
+
+
+def version() -> Tuple[str, Optional[datetime]]:
+    """ETag and time of the last change of the tickers or their stats,
+    the ETag also changes when tickers are deleted. Weak, the catalogue
+    is sent either gzipped or not.
+    """
+    tickers = Ticker.objects.aggregate(
+        count=Count("pk"), last=Max("last_updated")
+    )
+    stats = TickerStats.objects.aggregate(last=Max("updated_at"))
+    changes = [last for last in (tickers["last"], stats["last"]) if last]
+    last_modified = max(changes, default=None)
+    stamp = int(last_modified.timestamp() * 1e6) if last_modified else 0
+    return f'W/"{tickers["count"]}-{stamp}"', last_modified
+
+
+def render(tickers) -> bytes:
+    """tickers as the api renders them"""
+    return JSONRenderer().render(TickerSerializer(tickers, many=True).data)
+
+
+def publish_catalogue(
+    current: Tuple[str, Optional[datetime]] = None,
+) -> Catalogue:
+    """Serialize and compress the catalogue once for every request until
+    tickers change, into the default cache
+    """
+    etag, last_modified = current or version()
+    content = render(Ticker.objects.select_related("stats"))
+    catalogue = Catalogue(
+        etag, last_modified, content, gzip.compress(content, mtime=0)
+    )
+    cache.set(CACHE_KEY, catalogue, None)
+    logger.info(f"Published the ticker catalogue {etag}")
+    return catalogue
+
+
+def get_catalogue() -> Catalogue:
+    """The published catalogue, published again when it is out of date"""
+    current = version()
+    catalogue = cache.get(CACHE_KEY)
+    if catalogue is None or catalogue.etag != current[0]:
+        catalogue = publish_catalogue(current)
+    return catalogue
+
+
+def changed_since(since: datetime):
+    """Tickers whose fields or stats changed after a time"""
+    changed = Q(last_updated__gt=since) | Q(stats__updated_at__gt=since)
+    return Ticker.objects.select_related("stats").filter(changed)
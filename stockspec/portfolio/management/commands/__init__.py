@@ -1,11 +1,67 @@
+import argparse
+from typing import Callable, Dict, Optional, Tuple
+
 from django.conf import settings
 from django.core.management.base import BaseCommand
 
 from stockspec.alphavantage import AlphaVantage
+from stockspec.ingestion.models import IngestionRun
+from stockspec.portfolio.catalogue import publish_catalogue
+from stockspec.portfolio.stats import refresh_ticker_stats
 
 
 class APIBaseCommand(BaseCommand):
     """An BaseCommand abstract class to use with AlphaVantage"""
 
-    def __init__(self):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
         self.av = AlphaVantage(settings.ALPHAVANTAGE_KEY_POOL)
+
+    def add_journal_arguments(self, parser: argparse.ArgumentParser):
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Continue the last interrupted run from its checkpoint",
+        )
+        parser.add_argument(
+            "--retry-failed",
+            action="store_true",
+            help="Redo the symbols that failed in the last run",
+        )
+
+    def start_run(
+        self, command: str, make_plan: Callable[[], Dict[str, str]], **kwargs
+    ) -> Tuple[Optional[IngestionRun], Dict[str, str]]:
+        """Start a journaled run, or restart the last one with --resume
+        and/or --retry-failed. Returns the run and its symbol -> outputsize
+        plan.
+        """
+        resume = kwargs.get("resume")
+        retry_failed = kwargs.get("retry_failed")
+        if not resume and not retry_failed:
+            plan = make_plan()
+            return IngestionRun.start(command, plan), plan
+
+        run = IngestionRun.last(command, unfinished=not retry_failed)
+        if run is None:
+            return None, {}
+        return run, run.restart(pending=resume, failed=retry_failed)
+
+    def finish_run(self, run: IngestionRun):
+        """Mark the run as finished, refresh the statistics of the tickers
+        it got prices for and publish the ticker catalogue. Done once for
+        the whole run, by the process whose finish went through (see
+        IngestionRun.finish).
+        """
+        if not run.finish():
+            self.stdout.write(f"{run}: finished by another worker")
+            return
+        symbols = run.updated_symbols()
+        if len(symbols) > 0:
+            refresh_ticker_stats(symbols)
+            publish_catalogue()
+        counts = run.counts()
+        self.stdout.write(
+            f"{run}: {counts.get('done', 0)} done, "
+            f"{counts.get('failed', 0)} failed"
+        )
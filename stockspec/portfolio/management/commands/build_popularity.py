@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from stockspec.portfolio.popularity import rebuild_popularity
+
+
+class Command(BaseCommand):
+    """Count the uses of tickers in portfolios again"""
+
+    def handle(self, *args, **kwargs):
+        tickers = rebuild_popularity()
+        self.stdout.write(f"Counted the uses of {tickers} tickers")
@@ -0,0 +1,22 @@
+import argparse
+
+from django.core.management.base import BaseCommand, CommandError
+
+from stockspec.portfolio.pricestore import get_store
+
+
+class Command(BaseCommand):
+    """Build or refresh the memory-mapped price store (PRICE_STORE_DIR)"""
+
+    def add_arguments(self, parser: argparse.ArgumentParser):
+        parser.add_argument(
+            "-t", "--tickers", nargs="+", help="Only refresh these tickers"
+        )
+
+    def handle(self, *args, **kwargs):
+        store = get_store()
+        if store is None:
+            raise CommandError("PRICE_STORE_DIR is not set")
+
+        changed = store.refresh(kwargs.get("tickers"))
+        self.stdout.write(f"Refreshed {len(changed)} tickers")
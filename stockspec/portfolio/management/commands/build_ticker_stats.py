@@ -0,0 +1,25 @@
+import argparse
+
+from django.core.management.base import BaseCommand
+
+from stockspec.portfolio.stats import refresh_ticker_stats
+
+
+class Command(BaseCommand):
+    """Build or refresh the statistics of tickers"""
+
+    def add_arguments(self, parser: argparse.ArgumentParser):
+        parser.add_argument(
+            "-t", "--tickers", nargs="+", help="Only refresh these tickers"
+        )
+        parser.add_argument(
+            "--no-volatility",
+            action="store_true",
+            help="Leave out the volatility, which reads a year of prices",
+        )
+
+    def handle(self, *args, **kwargs):
+        refreshed = refresh_ticker_stats(
+            kwargs.get("tickers"), volatility=not kwargs.get("no_volatility")
+        )
+        self.stdout.write(f"Refreshed {refreshed} tickers")
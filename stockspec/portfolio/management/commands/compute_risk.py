@@ -0,0 +1,34 @@
+import argparse
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from stockspec.portfolio.risk import compute_risk
+
+
+class Command(BaseCommand):
+    """Compute volatility, beta and correlations of tickers from prices"""
+
+    def add_arguments(self, parser: argparse.ArgumentParser):
+        parser.add_argument(
+            "-b",
+            "--benchmark",
+            default=settings.RISK_BENCHMARK,
+            help="Ticker betas are computed against",
+        )
+        parser.add_argument(
+            "-c",
+            "--correlated",
+            type=int,
+            default=settings.RISK_CORRELATION_TICKERS,
+            help="Number of popular tickers to correlate pairwise",
+        )
+
+    def handle(self, *args, **kwargs):
+        tickers, correlations = compute_risk(
+            kwargs.get("benchmark"), kwargs.get("correlated")
+        )
+        self.stdout.write(
+            f"Computed the risk of {tickers} tickers and "
+            f"{correlations} correlations"
+        )
@@ -0,0 +1,41 @@
+import argparse
+
+from django.core.management.base import BaseCommand
+
+from stockspec.ingestion.fakeapi import FakeAlphaVantageServer
+
+
+class Command(BaseCommand):
+    help = "Starts a local AlphaVantage stand-in (use with AV_API_URL)"
+
+    def add_arguments(self, parser: argparse.ArgumentParser):
+        parser.add_argument("-p", "--port", type=int, default=8100)
+        parser.add_argument(
+            "--rate-limit",
+            type=int,
+            default=None,
+            help="Calls per minute allowed for each key (default: no limit)",
+        )
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0,
+            help="Seconds to wait before answering each request",
+        )
+        parser.add_argument("-v", "--verbose", action="store_true")
+
+    def handle(self, *args, **kwargs):
+        httpd = FakeAlphaVantageServer(
+            ("127.0.0.1", kwargs["port"]),
+            rate_limit=kwargs["rate_limit"],
+            latency=kwargs["latency"],
+            verbose=kwargs["verbose"],
+        )
+        try:
+            print(f"Fake AlphaVantage running on {httpd.url}")
+            print("> Press Ctrl-C to exit")
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            print("Stopping fake AlphaVantage...")
+        finally:
+            httpd.server_close()
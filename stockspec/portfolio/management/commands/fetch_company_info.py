@@ -0,0 +1,33 @@
+import argparse
+
+from . import APIBaseCommand
+from stockspec.ingestion.enrichment import CompanyInfoWorker
+from stockspec.ingestion.models import CompanyInfoTask
+from stockspec.portfolio.models import Ticker
+
+
+class Command(APIBaseCommand):
+    """Drain the company info queue filled when new tickers are imported"""
+
+    def add_arguments(self, parser: argparse.ArgumentParser):
+        parser.add_argument(
+            "--missing",
+            action="store_true",
+            help="Queue every ticker without company info first",
+        )
+        parser.add_argument(
+            "--follow",
+            action="store_true",
+            help="Keep waiting for new tasks once the queue is empty",
+        )
+
+    def handle(self, *args, **kwargs):
+        if kwargs.get("missing"):
+            CompanyInfoTask.enqueue(
+                Ticker.objects.filter(company__isnull=True)
+            )
+
+        try:
+            CompanyInfoWorker(self.av).run(follow=kwargs.get("follow"))
+        except KeyboardInterrupt:
+            print("Exiting early...")
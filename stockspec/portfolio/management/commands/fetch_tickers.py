@@ -1,6 +1,9 @@
 import argparse
 
+from django.core.management.base import CommandError
+
 from . import APIBaseCommand
+from stockspec.ingestion.planner import COMPACT
 
 
 class Command(APIBaseCommand):
@@ -8,12 +11,32 @@ class Command(APIBaseCommand):
 
     def add_arguments(self, parser: argparse.ArgumentParser):
         parser.add_argument(
-            "-t", "--tickers", nargs="+", required=True, help="<Required>"
+            "-t",
+            "--tickers",
+            nargs="+",
+            help="<Required> unless resuming a run",
         )
+        self.add_journal_arguments(parser)
 
     def handle(self, *args, **kwargs):
         symbols = kwargs.get("tickers")
+        resuming = kwargs.get("resume") or kwargs.get("retry_failed")
+        if not symbols and not resuming:
+            raise CommandError("the following arguments are required: -t")
+
+        run, plan = self.start_run(
+            "fetch_tickers",
+            lambda: {symbol: COMPACT for symbol in symbols},
+            **kwargs,
+        )
+        if run is None:
+            self.stdout.write("No run to resume")
+            return
+
         try:
-            self.av.import_symbols(symbols)
+            self.av.import_symbols(list(plan), plan, run)
         except KeyboardInterrupt:
+            run.interrupt()
             print("Exiting early...")
+        else:
+            self.finish_run(run)
@@ -1,4 +1,10 @@
+import argparse
+
 from . import APIBaseCommand
+from stockspec.ingestion.aio import AsyncAlphaVantage
+from stockspec.ingestion.leases import LeaseWorker
+from stockspec.ingestion.models import IngestionRun
+from stockspec.ingestion.planner import plan_fetches, COMPACT, FULL
 from stockspec.portfolio.models import Ticker
 
 
@@ -6,10 +12,88 @@ class Command(APIBaseCommand):
     """Get prices from AlphaVantage
     """
 
+    def add_arguments(self, parser: argparse.ArgumentParser):
+        parser.add_argument(
+            "--async",
+            dest="use_async",
+            action="store_true",
+            help="Use the asyncio ingestion engine",
+        )
+        parser.add_argument(
+            "--all",
+            dest="all_tickers",
+            action="store_true",
+            help="Fetch every ticker, even the ones that are up to date",
+        )
+        parser.add_argument(
+            "--backfill",
+            action="store_true",
+            help="Fetch the full history of every ticker and fill the gaps",
+        )
+        self.add_journal_arguments(parser)
+        parser.add_argument(
+            "--plan-only",
+            action="store_true",
+            help="Only journal a new run, for --worker processes to share",
+        )
+        parser.add_argument(
+            "--worker",
+            action="store_true",
+            help="Claim batches of the last unfinished run until it is done",
+        )
+
+    def make_plan(self, all_tickers: bool = False, backfill: bool = False):
+        if all_tickers or backfill:
+            symbols = Ticker.objects.values_list("symbol", flat=True)
+            outputsize = FULL if backfill else COMPACT
+            return {symbol: outputsize for symbol in symbols}
+        # skip up to date tickers, only get full history when needed
+        return plan_fetches()
+
+    def ingest(self, plan, run, use_async: bool = False):
+        if use_async:
+            return AsyncAlphaVantage(self.av).run(list(plan), plan, run)
+        return self.av.import_symbols(list(plan), plan, run)
+
+    def work(self, use_async: bool = False):
+        """Share the last unfinished run with other worker processes"""
+        run = IngestionRun.last("get_prices", unfinished=True)
+        if run is None:
+            self.stdout.write("No run to work on")
+            return
+
+        worker = LeaseWorker(run)
+        try:
+            worker.work(lambda plan: self.ingest(plan, run, use_async))
+        except KeyboardInterrupt:
+            print("Exiting early...")
+            return
+        # every worker tries, the one seeing no entry pending finishes
+        self.finish_run(run)
+
     def handle(self, *args, **kwargs):
-        symbols = Ticker.objects.values_list("symbol", flat=True)
+        self.av.backfill = kwargs.get("backfill")
+        if kwargs.get("worker"):
+            return self.work(kwargs.get("use_async"))
+
+        run, plan = self.start_run(
+            "get_prices",
+            lambda: self.make_plan(
+                kwargs.get("all_tickers"), kwargs.get("backfill")
+            ),
+            **kwargs,
+        )
+        if run is None:
+            self.stdout.write("No run to resume")
+            return
+        if kwargs.get("plan_only"):
+            self.stdout.write(f"{run}: {len(plan)} symbols to fetch")
+            return
 
         try:
-            self.av.import_symbols(list(symbols))
+            self.ingest(plan, run, kwargs.get("use_async"))
         except KeyboardInterrupt:
+            run.interrupt()
             print("Exiting early...")
+        else:
+            self.finish_run(run)
@@ -0,0 +1,34 @@
+# Generated by Django 3.1.2 on 2026-10-17 19:03
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicates(apps, schema_editor):
+    """Keep the first price of every (ticker, date)"""
+    StockPrice = apps.get_model('portfolio', 'StockPrice')
+    duplicates = (
+        StockPrice.objects.order_by()
+        .values('ticker_id', 'date')
+        .annotate(keep=Min('id'), count=Count('id'))
+        .filter(count__gt=1)
+    )
+    for row in duplicates:
+        StockPrice.objects.filter(
+            ticker_id=row['ticker_id'], date=row['date']
+        ).exclude(id=row['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0004_auto_20201123_0858'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='stockprice',
+            constraint=models.UniqueConstraint(fields=('ticker', 'date'), name='price_ticker_date'),
+        ),
+    ]
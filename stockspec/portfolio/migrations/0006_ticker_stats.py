@@ -0,0 +1,32 @@
+# Generated by Django 3.1.2 on 2026-10-17 19:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0005_price_ticker_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TickerStats',
+            fields=[
+                ('ticker', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='portfolio.ticker')),
+                ('as_of', models.DateField()),
+                ('change_1w', models.DecimalField(blank=True, decimal_places=4, max_digits=10, null=True)),
+                ('change_1m', models.DecimalField(blank=True, decimal_places=4, max_digits=10, null=True)),
+                ('change_ytd', models.DecimalField(blank=True, decimal_places=4, max_digits=10, null=True)),
+                ('high_52w', models.DecimalField(blank=True, decimal_places=4, max_digits=10, null=True)),
+                ('low_52w', models.DecimalField(blank=True, decimal_places=4, max_digits=10, null=True)),
+                ('volatility', models.DecimalField(blank=True, decimal_places=4, max_digits=8, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'ticker stats',
+                'db_table': 'ticker_stats',
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 3.1.2 on 2026-10-17 19:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0006_ticker_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TickerRisk',
+            fields=[
+                ('ticker', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='risk', serialize=False, to='portfolio.ticker')),
+                ('as_of', models.DateField()),
+                ('benchmark', models.CharField(max_length=20)),
+                ('volatility_1m', models.DecimalField(blank=True, decimal_places=4, max_digits=8, null=True)),
+                ('volatility_3m', models.DecimalField(blank=True, decimal_places=4, max_digits=8, null=True)),
+                ('beta', models.DecimalField(blank=True, decimal_places=4, max_digits=10, null=True)),
+                ('correlation', models.DecimalField(blank=True, decimal_places=4, max_digits=5, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'ticker_risk',
+            },
+        ),
+        migrations.CreateModel(
+            name='TickerCorrelation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('correlation', models.DecimalField(decimal_places=4, max_digits=5)),
+                ('as_of', models.DateField()),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='portfolio.ticker')),
+                ('ticker', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='correlations', to='portfolio.ticker')),
+            ],
+            options={
+                'db_table': 'ticker_correlation',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='tickercorrelation',
+            constraint=models.UniqueConstraint(fields=('ticker', 'other'), name='correlation_pair'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 3.1.2 on 2026-10-17 19:20
+
+import hashlib
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def backfill_tickers_key(apps, schema_editor):
+    """Fingerprint the ticker set of existing portfolios"""
+    Portfolio = apps.get_model('portfolio', 'Portfolio')
+    symbols = defaultdict(list)
+    rows = Portfolio.tickers.through.objects.values_list(
+        'portfolio_id', 'ticker_id'
+    )
+    for pk, symbol in rows:
+        symbols[pk].append(symbol)
+    portfolios = []
+    for pk, tickers in symbols.items():
+        canonical = ','.join(sorted(set(tickers)))
+        key = hashlib.sha256(canonical.encode()).hexdigest()
+        portfolios.append(Portfolio(pk=pk, tickers_key=key))
+    Portfolio.objects.bulk_update(portfolios, ['tickers_key'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0007_ticker_risk'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='portfolio',
+            name='tickers_key',
+            field=models.CharField(default='', editable=False, max_length=64),
+        ),
+        migrations.RunPython(backfill_tickers_key, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='portfolio',
+            index=models.Index(fields=['user', 'tickers_key'], name='portfolio_user_tickers'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 3.1.2 on 2026-10-17 19:23
+
+import math
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+def count_uses(apps, schema_editor):
+    """Popularity of tickers in existing portfolios, see popularity.py"""
+    Portfolio = apps.get_model('portfolio', 'Portfolio')
+    TickerPopularity = apps.get_model('portfolio', 'TickerPopularity')
+    half_life = settings.TRENDING_HALF_LIFE * 24 * 3600
+    popularity = {}
+    links = Portfolio.tickers.through.objects.values_list(
+        'ticker_id', 'portfolio__created_at'
+    )
+    for symbol, created_at in links:
+        row = popularity.setdefault(
+            symbol, TickerPopularity(ticker_id=symbol, portfolios=0)
+        )
+        row.portfolios += 1
+        weight = (created_at - EPOCH).total_seconds() / half_life
+        if row.trending is None:
+            row.trending = weight
+        else:
+            high, low = max(row.trending, weight), min(row.trending, weight)
+            row.trending = high + math.log2(1 + 2 ** (low - high))
+    TickerPopularity.objects.bulk_create(popularity.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0008_portfolio_tickers_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TickerPopularity',
+            fields=[
+                ('ticker', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='popularity', serialize=False, to='portfolio.ticker')),
+                ('portfolios', models.PositiveIntegerField(default=0)),
+                ('trending', models.FloatField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'ticker popularity',
+                'db_table': 'ticker_popularity',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='tickerpopularity',
+            index=models.Index(fields=['-portfolios', 'ticker'], name='popularity_portfolios'),
+        ),
+        migrations.AddIndex(
+            model_name='tickerpopularity',
+            index=models.Index(fields=['-trending', 'ticker'], name='popularity_trending'),
+        ),
+        migrations.RunPython(count_uses, migrations.RunPython.noop),
+    ]
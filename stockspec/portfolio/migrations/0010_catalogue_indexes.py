@@ -0,0 +1,21 @@
+# Generated by Django 3.1.2 on 2026-10-17 19:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0009_ticker_popularity'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ticker',
+            index=models.Index(fields=['last_updated'], name='ticker_last_updated'),
+        ),
+        migrations.AddIndex(
+            model_name='tickerstats',
+            index=models.Index(fields=['updated_at'], name='ticker_stats_updated_at'),
+        ),
+    ]
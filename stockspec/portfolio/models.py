@@ -1,9 +1,22 @@
+import datetime
+import hashlib
 import pytz
-from typing import List
-from django.db import models
-from django.db.models import Count, Subquery
+from collections import Counter
+from typing import Iterable, List
+from django.db import models, transaction
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import receiver
 from django.conf import settings
+from django.utils import timezone
 
+from stockspec.portfolio.pricestore import get_store
+from stockspec.portfolio.returncache import get_return_cache
+from stockspec.tradingcalendar import TradingCalendar, calendar_for
 from stockspec.users.models import User
 
 TIMEZONES = tuple(zip(pytz.all_timezones, pytz.all_timezones))
@@ -15,6 +28,10 @@ class Ticker(models.Model):
 
     class Meta:
         db_table = "ticker"
+        # the version of the catalogue, see catalogue.version
+        indexes = [
+            models.Index(fields=["last_updated"], name="ticker_last_updated")
+        ]
 
     symbol = models.CharField(
         max_length=20, blank=False, null=False, primary_key=True
@@ -49,40 +66,30 @@ class Ticker(models.Model):
     def __str__(self):
         return self.symbol
 
-    def price_at_date(self, date):
-        """returns the price just before given date (latest price)"""
-        return (
-            self.prices.filter(date__lte=date)
-            .values_list("close_price", flat=True)
-            .order_by("-date")
-            .first()
-        )
+    @property
+    def calendar(self) -> TradingCalendar:
+        """trading sessions of the ticker's exchange"""
+        return calendar_for(self.exchange, self.timezone)
 
     def return_for_period(self, start_date, end_date):
         """calculates performance of an asset within period time"""
-        price_start = self.price_at_date(start_date)
-        price_end = self.price_at_date(end_date)
+        from stockspec.portfolio.performance import ticker_returns
+
+        # between the closes of the governing sessions, cached
+        key = (
+            self.symbol,
+            self.calendar.session_at(start_date),
+            self.calendar.session_at(end_date),
+        )
+        performance = ticker_returns(
+            [key],
+            {self.symbol: self.calendar},
+            {self.symbol: self.last_updated},
+        )[key]
         # check whether we have prices for period
-        if not all([price_start, price_end]):
+        if performance is None:
             raise Exception("No prices for given period")
-
-        return (price_end - price_start) / price_start
-
-    @staticmethod
-    def top_tickers():
-        """Get tickers that have been used the most in portfolios"""
-        # cant do all of this in one query with the orm...
-        sql = """
-        SELECT
-        COUNT(portfolio_tickers.ticker_id) as ticker_count,
-        ticker.*
-        FROM portfolio_tickers
-        INNER JOIN ticker ON ticker.symbol=portfolio_tickers.ticker_id
-        GROUP BY portfolio_tickers.ticker_id
-        ORDER BY ticker_count DESC
-        LIMIT 10
-        """
-        return Ticker.objects.raw(sql)
+        return performance
 
 
 class StockPrice(models.Model):
@@ -93,6 +100,12 @@ class StockPrice(models.Model):
     class Meta:
         db_table = "price"
         ordering = ["date"]
+        # also the index of as-of lookups and series scans
+        constraints = [
+            models.UniqueConstraint(
+                fields=["ticker", "date"], name="price_ticker_date"
+            )
+        ]
 
     ticker = models.ForeignKey(
         Ticker, on_delete=models.CASCADE, related_name="prices"
@@ -102,21 +115,171 @@ class StockPrice(models.Model):
     date = models.DateField(null=True)
 
     @staticmethod
-    def get_series(symbol: str, length: int):
-        """Efficient limit-offset method for getting last n-rows"""
-        return StockPrice.objects.raw(
-            """
-            SELECT * FROM price
-            WHERE ticker_id = %s
-            ORDER BY date ASC
-            LIMIT %s
-            OFFSET (
-                SELECT count(*)
-                FROM price WHERE ticker_id = %s
-            ) - %s
-            """,
-            [symbol, length, symbol, length],
-        )
+    def get_series(
+        symbol: str,
+        length: int,
+        start: datetime.date = None,
+        end: datetime.date = None,
+        before: datetime.date = None,
+    ) -> List["StockPrice"]:
+        """Last n prices of a symbol within [start, end] and before a
+        date, oldest first. A descending scan of the (ticker, date) index,
+        the rest of the history is never read.
+        """
+        queryset = StockPrice.objects.filter(ticker_id=symbol)
+        if start is not None:
+            queryset = queryset.filter(date__gte=start)
+        if end is not None:
+            queryset = queryset.filter(date__lte=end)
+        if before is not None:
+            queryset = queryset.filter(date__lt=before)
+        return list(reversed(queryset.order_by("-date")[:length]))
+
+
+class TickerStats(models.Model):
+    """Statistics of a ticker over several horizons, as of its latest
+    close. Denormalized so that lists of tickers don't scan prices,
+    refreshed at the end of each ingestion (see refresh_ticker_stats).
+    """
+
+    class Meta:
+        db_table = "ticker_stats"
+        verbose_name_plural = "ticker stats"
+        indexes = [
+            models.Index(fields=["updated_at"], name="ticker_stats_updated_at")
+        ]
+
+    ticker = models.OneToOneField(
+        Ticker,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="stats",
+    )
+    # date of the latest close
+    as_of = models.DateField()
+
+    # changes since the latest close before the horizon
+    change_1w = models.DecimalField(
+        decimal_places=4, max_digits=10, null=True, blank=True
+    )
+    change_1m = models.DecimalField(
+        decimal_places=4, max_digits=10, null=True, blank=True
+    )
+    change_ytd = models.DecimalField(
+        decimal_places=4, max_digits=10, null=True, blank=True
+    )
+    high_52w = models.DecimalField(
+        decimal_places=4, max_digits=10, null=True, blank=True
+    )
+    low_52w = models.DecimalField(
+        decimal_places=4, max_digits=10, null=True, blank=True
+    )
+    # annualized, from the daily returns of the last 52 weeks
+    volatility = models.DecimalField(
+        decimal_places=4, max_digits=8, null=True, blank=True
+    )
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.ticker_id} stats"
+
+
+class TickerRisk(models.Model):
+    """Risk measures of a ticker computed from stored prices by the
+    analytics job (see compute_risk)
+    """
+
+    class Meta:
+        db_table = "ticker_risk"
+
+    ticker = models.OneToOneField(
+        Ticker,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="risk",
+    )
+    as_of = models.DateField()
+    benchmark = models.CharField(max_length=20)
+
+    # annualized, from the daily returns over each window, the yearly
+    # one is the ticker's stats volatility
+    volatility_1m = models.DecimalField(
+        decimal_places=4, max_digits=8, null=True, blank=True
+    )
+    volatility_3m = models.DecimalField(
+        decimal_places=4, max_digits=8, null=True, blank=True
+    )
+    # against the benchmark, over a year
+    beta = models.DecimalField(
+        decimal_places=4, max_digits=10, null=True, blank=True
+    )
+    correlation = models.DecimalField(
+        decimal_places=4, max_digits=5, null=True, blank=True
+    )
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.ticker_id} risk"
+
+
+class TickerCorrelation(models.Model):
+    """Correlation of the daily returns of two popular tickers over a
+    year, stored both ways so a ticker's are read from one index range
+    """
+
+    class Meta:
+        db_table = "ticker_correlation"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["ticker", "other"], name="correlation_pair"
+            )
+        ]
+
+    ticker = models.ForeignKey(
+        Ticker, on_delete=models.CASCADE, related_name="correlations"
+    )
+    other = models.ForeignKey(
+        Ticker, on_delete=models.CASCADE, related_name="+"
+    )
+    correlation = models.DecimalField(decimal_places=4, max_digits=5)
+    as_of = models.DateField()
+
+    def __str__(self):
+        return f"{self.ticker_id}/{self.other_id}"
+
+
+class TickerPopularity(models.Model):
+    """How much a ticker is used in portfolios, kept up to date as
+    portfolios change (see record_uses) so rankings are index scans
+    """
+
+    class Meta:
+        db_table = "ticker_popularity"
+        verbose_name_plural = "ticker popularity"
+        indexes = [
+            models.Index(
+                fields=["-portfolios", "ticker"], name="popularity_portfolios"
+            ),
+            models.Index(
+                fields=["-trending", "ticker"], name="popularity_trending"
+            ),
+        ]
+
+    ticker = models.OneToOneField(
+        Ticker,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="popularity",
+    )
+    # number of portfolios with the ticker
+    portfolios = models.PositiveIntegerField(default=0)
+    # log2 of the uses weighted by their recency, see popularity.weight
+    trending = models.FloatField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.ticker_id} popularity"
 
 
 class Portfolio(models.Model):
@@ -127,10 +290,17 @@ class Portfolio(models.Model):
     class Meta:
         db_table = "portfolio"
         ordering = ["-updated_at", "name"]
+        indexes = [
+            models.Index(
+                fields=["user", "tickers_key"], name="portfolio_user_tickers"
+            )
+        ]
 
     name = models.CharField(max_length=100, blank=True, null=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=False)
     tickers = models.ManyToManyField(Ticker)
+    # fingerprint of the ticker set, kept in sync by update_tickers_key
+    tickers_key = models.CharField(max_length=64, default="", editable=False)
 
     updated_at = models.DateTimeField(auto_now=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -140,12 +310,38 @@ class Portfolio(models.Model):
 
     def return_for_period(self, start_date, end_date):
         """return the performance of a portfolio over a period of time"""
-        returns = [
-            ticker.return_for_period(start_date, end_date)
-            for ticker in self.tickers.all()
-        ]
+        from stockspec.portfolio.performance import (
+            period_key,
+            portfolio_returns,
+        )
+
         # for now all assets have the same weight (1/len(assets))
-        return sum(returns) / len(returns)
+        returns = portfolio_returns([(self, start_date, end_date)])
+        performance = returns.get(period_key(self, start_date, end_date))
+        if performance is None:
+            raise Exception("No prices for given period")
+        return performance
+
+    @staticmethod
+    def listed():
+        """Portfolios with what their serializer reads: users, and tickers
+        with their stats, in three queries whatever their number
+        """
+        return Portfolio.objects.select_related("user").prefetch_related(
+            models.Prefetch(
+                "tickers", queryset=Ticker.objects.select_related("stats")
+            )
+        )
+
+    @staticmethod
+    def key_for(symbols: Iterable[str]) -> str:
+        """Fingerprint of a set of tickers, the same whatever their order,
+        empty for no tickers
+        """
+        canonical = ",".join(sorted(set(symbols)))
+        if canonical == "":
+            return ""
+        return hashlib.sha256(canonical.encode()).hexdigest()
 
     @classmethod
     def get_or_create_from_tickers(cls, user: User, tickers: List[Ticker]):
@@ -153,28 +349,103 @@ class Portfolio(models.Model):
         Check whether a portfolio with given tickers exists and returns it,
         otherwise it creates one and returns it.
         """
-        portfolio = cls.exact_tickers(tickers).filter(user=user).first()
+        key = cls.key_for(ticker.symbol for ticker in tickers)
+        portfolio = cls.objects.filter(user=user, tickers_key=key).first()
         if portfolio is None:
-            portfolio = cls.objects.create(user=user)
+            portfolio = cls.objects.create(user=user, tickers_key=key)
             portfolio.tickers.set(tickers)
         return portfolio
 
     @classmethod
     def exact_tickers(cls, tickers: List[Ticker]):
-        """A method that returns portfolios with exactly given tickers.
-
-        It dynamically filters to match exact symbols, which unfortunately
-        joins the ticker table n-times (once for each comparison).
-        SQLite has a hard limit of 64 joins, our portfolios should not have more.
-        ref: https://www.sqlite.org/limits.html
+        """Portfolios with exactly given tickers, an index lookup on the
+        fingerprint of their ticker set whatever its size
         """
-        # avoid database error
-        tickers = tickers[:63]
-        queryset = cls.objects.annotate(count=Count("tickers")).filter(
-            count=len(tickers)
+        key = cls.key_for(ticker.symbol for ticker in tickers)
+        return cls.objects.filter(tickers_key=key)
+
+
+@receiver([post_save, post_delete], sender=StockPrice)
+def refresh_price_store(sender, instance: StockPrice, **kwargs):
+    """Keep the price store in line with single price changes, bulk
+    writes refresh it themselves (see PriceSink). The ticker is updated
+    with the price so every store notices it.
+    """
+    symbol = instance.ticker_id
+    Ticker.objects.filter(symbol=symbol).update(last_updated=timezone.now())
+    store = get_store()
+    if store is not None:
+        transaction.on_commit(lambda: store.refresh([symbol], rebuild=True))
+
+
+@receiver([post_save, post_delete], sender=StockPrice)
+def forget_returns(sender, instance: StockPrice, **kwargs):
+    """Edited prices can change any return of their ticker, bulk writes
+    only append and invalidate open returns themselves (see PriceSink)
+    """
+    symbol = instance.ticker_id
+    transaction.on_commit(lambda: get_return_cache().forget([symbol]))
+
+
+@receiver(m2m_changed, sender=Portfolio.tickers.through)
+def update_tickers_key(sender, instance, action, reverse, pk_set, **kwargs):
+    """Recompute the fingerprint of portfolios whose tickers changed"""
+    if action == "pre_clear" and reverse:
+        # the portfolios are unknown once cleared
+        instance._cleared_portfolios = list(
+            instance.portfolio_set.values_list("pk", flat=True)
+        )
+        return
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    if not reverse:
+        portfolios = [instance.pk]
+    elif action == "post_clear":
+        portfolios = instance.__dict__.pop("_cleared_portfolios", [])
+    else:
+        portfolios = pk_set
+    rows = sender.objects.filter(portfolio_id__in=portfolios).values_list(
+        "portfolio_id", "ticker_id"
+    )
+    symbols = {pk: [] for pk in portfolios}
+    for pk, symbol in rows:
+        symbols[pk].append(symbol)
+    for pk, tickers in symbols.items():
+        Portfolio.objects.filter(pk=pk).update(
+            tickers_key=Portfolio.key_for(tickers)
         )
 
-        # dynamically chain filters
-        for ticker in tickers:
-            queryset = queryset.filter(tickers__symbol=ticker.symbol)
-        return queryset
+
+@receiver(m2m_changed, sender=Portfolio.tickers.through)
+def count_ticker_uses(sender, instance, action, reverse, pk_set, **kwargs):
+    """Keep the popularity of tickers in line with their portfolios"""
+    from stockspec.portfolio.popularity import record_uses
+
+    if action == "post_add":
+        # only the links that were missing
+        if reverse:
+            record_uses({instance.pk: len(pk_set)})
+        else:
+            record_uses(dict.fromkeys(pk_set, 1))
+    elif action in ("pre_remove", "pre_clear"):
+        # the links that exist, before they are deleted
+        if reverse:
+            links = sender.objects.filter(ticker_id=instance.pk)
+            if action == "pre_remove":
+                links = links.filter(portfolio_id__in=pk_set)
+        else:
+            links = sender.objects.filter(portfolio_id=instance.pk)
+            if action == "pre_remove":
+                links = links.filter(ticker_id__in=pk_set)
+        removed = Counter(links.values_list("ticker_id", flat=True))
+        record_uses({symbol: -count for symbol, count in removed.items()})
+
+
+@receiver(pre_delete, sender=Portfolio)
+def forget_ticker_uses(sender, instance: Portfolio, **kwargs):
+    """Deleted portfolios don't send m2m_changed for their tickers"""
+    from stockspec.portfolio.popularity import record_uses
+
+    symbols = instance.tickers.values_list("pk", flat=True)
+    record_uses({symbol: -1 for symbol in symbols})
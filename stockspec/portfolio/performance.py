@@ -0,0 +1,303 @@
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from django.db.models import OuterRef, Q, Subquery
+
+from stockspec.portfolio.models import Portfolio, StockPrice, Ticker
+from stockspec.portfolio.pricestore import get_store
+from stockspec.portfolio.returncache import ReturnKey, get_return_cache
+from stockspec.tradingcalendar import (
+    NYSE,
+    TradingCalendar,
+    calendar_for,
+    governing_sessions,
+)
+
+logger = logging.getLogger(__name__)
+
+# (portfolio, start, end)
+Period = Tuple[Portfolio, object, object]
+PeriodKey = Tuple[int, object, object]
+
+# the latest price before a date is looked for within this window first
+LOOKBACK = timedelta(days=14)
+# days looked up by one query when a price is older than LOOKBACK
+GAP_CHUNK_SIZE = 50
+
+
+def period_key(portfolio: Portfolio, start, end) -> PeriodKey:
+    return (portfolio.pk, start, end)
+
+
+def latest_on(day: date, field: str) -> Subquery:
+    """field of the outer ticker's latest price on or before day, an index
+    seek
+    """
+    return Subquery(
+        StockPrice.objects.filter(ticker=OuterRef("pk"), date__lte=day)
+        .order_by("-date")
+        .values(field)[:1]
+    )
+
+
+def fill_gaps(
+    symbols: List[str], days: List[date], closes: np.ndarray, found: np.ndarray
+):
+    """Look up the cells of load_closes left nan by its windows in place,
+    with one query of correlated subqueries per chunk of days
+    """
+    gaps = np.isnan(closes)
+    rows = {symbol: i for i, symbol in enumerate(symbols)}
+    missing = [symbols[i] for i in np.flatnonzero(gaps.any(axis=1))]
+    cols = np.flatnonzero(gaps.any(axis=0))
+    for i in range(0, len(cols), GAP_CHUNK_SIZE):
+        chunk = cols[i : i + GAP_CHUNK_SIZE]
+        latest = {}
+        for col in chunk:
+            latest[f"date_{col}"] = latest_on(days[col], "date")
+            latest[f"close_{col}"] = latest_on(days[col], "close_price")
+        tickers = Ticker.objects.filter(pk__in=missing).values("pk", **latest)
+        for ticker in tickers:
+            row = rows[ticker["pk"]]
+            for col in chunk:
+                day = ticker[f"date_{col}"]
+                if gaps[row, col] and day is not None:
+                    found[row, col] = day.toordinal()
+                    closes[row, col] = float(ticker[f"close_{col}"])
+
+
+def load_closes(
+    symbols: List[str],
+    days: List[date],
+    updated: Dict[str, Optional[datetime]] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Latest closes on or before each day for every symbol, and the
+    ordinals of their date, as (len(symbols), len(days)) float arrays with
+    nan where there is none. Prices come from the price store when it is
+    set, tickers older than their file are refreshed first (updated is
+    their last_updated when already loaded). Otherwise they come from a
+    single query over small windows before each day, and one more per
+    chunk of days for longer gaps.
+    """
+    store = get_store()
+    if store is not None:
+        updated = updated or {}
+        if any(symbol not in updated for symbol in symbols):
+            updated = dict(
+                Ticker.objects.filter(symbol__in=symbols).values_list(
+                    "symbol", "last_updated"
+                )
+            )
+        stale = store.stale({s: updated.get(s) for s in symbols})
+        if len(stale) > 0:
+            store.refresh(stale)
+        return store.prices_at(symbols, days)
+
+    # merge overlapping windows, they are sorted by day
+    windows = []
+    for day in days:
+        if windows and day - LOOKBACK <= windows[-1][1]:
+            windows[-1] = (windows[-1][0], day)
+        else:
+            windows.append((day - LOOKBACK, day))
+    in_windows = Q()
+    for start, end in windows:
+        in_windows |= Q(date__range=(start, end))
+
+    series = defaultdict(lambda: ([], []))
+    rows = (
+        StockPrice.objects.filter(in_windows, ticker_id__in=symbols)
+        .order_by("ticker_id", "date")
+        .values_list("ticker_id", "date", "close_price")
+    )
+    for symbol, day, close in rows:
+        series[symbol][0].append(day.toordinal())
+        series[symbol][1].append(float(close))
+
+    ordinals = np.array([day.toordinal() for day in days])
+    closes = np.full((len(symbols), len(days)), np.nan)
+    found = np.full((len(symbols), len(days)), np.nan)
+    for row, symbol in enumerate(symbols):
+        dates, prices = (np.array(values) for values in series[symbol])
+        if len(dates) > 0:
+            i = np.searchsorted(dates, ordinals, side="right")
+            # a price from an earlier window may not be the latest one
+            ok = (i > 0) & (
+                dates[np.maximum(i - 1, 0)] >= ordinals - LOOKBACK.days
+            )
+            closes[row, ok] = prices[i[ok] - 1]
+            found[row, ok] = dates[i[ok] - 1]
+
+    # gaps longer than the window
+    fill_gaps(symbols, days, closes, found)
+    return closes, found
+
+
+def is_closed(
+    found: date, day: date, calendar: TradingCalendar = NYSE
+) -> bool:
+    """Whether the latest close on or before day, found at a date, is
+    final. Prices are only appended, so it is unless a session that is
+    not in yet can still come before day.
+    """
+    return found == day or calendar.sessions_between(found, day) == 0
+
+
+def ticker_returns(
+    keys: Iterable[ReturnKey],
+    calendars: Dict[str, TradingCalendar] = None,
+    updated: Dict[str, Optional[datetime]] = None,
+) -> Dict[ReturnKey, Optional[float]]:
+    """Returns of tickers over periods, keyed by (symbol, start date, end
+    date), None when a price is missing. Dates are sessions of the
+    ticker's calendar (NYSE unless given in calendars).
+
+    Returns are taken from the return cache when possible, the others are
+    computed at once from one price query (none with the price store) and
+    cached.
+    """
+    calendars = calendars or {}
+    keys = set(keys)
+    cache = get_return_cache()
+    results = cache.get_many(keys)
+    missing = [key for key in keys if key not in results]
+    if len(missing) == 0:
+        return results
+    # read before the prices, see ReturnCache.set_many
+    generations = cache.generations(
+        {symbol for symbol, _, _ in missing}, create=True
+    )
+    versions = cache.versions({symbol for symbol, _, _ in missing})
+
+    symbols = sorted({symbol for symbol, _, _ in missing})
+    days = sorted({day for _, *period in missing for day in period})
+    closes, found = load_closes(symbols, days, updated)
+    rows = {symbol: i for i, symbol in enumerate(symbols)}
+    cols = {day: i for i, day in enumerate(days)}
+
+    row = np.array([rows[symbol] for symbol, _, _ in missing], dtype=np.int64)
+    start_col = np.array([cols[s] for _, s, _ in missing], dtype=np.int64)
+    end_col = np.array([cols[e] for _, _, e in missing], dtype=np.int64)
+    start_prices = closes[row, start_col]
+    end_prices = closes[row, end_col]
+    end_found = found[row, end_col]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = (end_prices - start_prices) / start_prices
+    # like Ticker.return_for_period, a zero price counts as missing
+    invalid = ~np.isfinite(returns) | (start_prices == 0) | (end_prices == 0)
+
+    closed = {}
+    cached = {}
+    for i, key in enumerate(missing):
+        if invalid[i]:
+            results[key] = None
+            continue
+        results[key] = float(returns[i])
+        calendar = calendars.get(key[0], NYSE)
+        bounds = (int(end_found[i]), key[2], calendar)
+        if bounds not in closed:
+            closed[bounds] = is_closed(
+                date.fromordinal(bounds[0]), key[2], calendar
+            )
+        cached[key] = (results[key], not closed[bounds])
+    cache.set_many(cached, generations, versions)
+    return results
+
+
+def portfolio_returns(
+    periods: Iterable[Period], holdings: Dict[int, Iterable[Ticker]] = None
+) -> Dict[PeriodKey, Optional[float]]:
+    """Equal-weight returns of many portfolios over their own period.
+
+    Holdings are loaded with one query, unless given as portfolio id ->
+    tickers (when they are prefetched already). Period bounds are mapped
+    to the governing session of each ticker's calendar, so a bound
+    between two closes always gets the earlier one. Returns of every
+    (portfolio, ticker) pair come from ticker_returns and are averaged at
+    once. Returns a dict keyed by period_key, None when a price is
+    missing for the period.
+    """
+
+    periods = [
+        (portfolio, start, end)
+        for portfolio, start, end in periods
+        if start is not None and end is not None
+    ]
+    if len(periods) == 0:
+        return {}
+
+    if holdings is None:
+        rows = Portfolio.tickers.through.objects.filter(
+            portfolio_id__in={portfolio.pk for portfolio, _, _ in periods}
+        ).values_list(
+            "portfolio_id",
+            "ticker_id",
+            "ticker__exchange",
+            "ticker__timezone",
+            "ticker__last_updated",
+        )
+    else:
+        rows = [
+            (
+                portfolio_id,
+                ticker.symbol,
+                ticker.exchange,
+                ticker.timezone,
+                ticker.last_updated,
+            )
+            for portfolio_id, tickers in holdings.items()
+            for ticker in tickers
+        ]
+    symbols = defaultdict(list)
+    calendars = {}
+    updated = {}
+    for portfolio_id, symbol, exchange, tz, last_updated in rows:
+        symbols[portfolio_id].append(symbol)
+        calendars[symbol] = calendar_for(exchange, tz)
+        updated[symbol] = last_updated
+
+    # many periods share their bounds and tickers their calendar, each
+    # bound is mapped once per calendar
+    bounds = list({day for _, *period in periods for day in period})
+    distinct = list(set(calendars.values()))
+    sessions = governing_sessions(distinct, bounds)
+    dates = {
+        (calendar, bound): date.fromordinal(int(sessions[row, col]))
+        for row, calendar in enumerate(distinct)
+        for col, bound in enumerate(bounds)
+    }
+
+    # one entry per (period, ticker) pair
+    group, pairs = [], []
+    for i, (portfolio, start, end) in enumerate(periods):
+        for symbol in symbols[portfolio.pk]:
+            calendar = calendars[symbol]
+            group.append(i)
+            pairs.append(
+                (symbol, dates[calendar, start], dates[calendar, end])
+            )
+    returns = ticker_returns(pairs, calendars, updated)
+
+    group = np.array(group, dtype=np.int64)
+    # missing returns become nan
+    values = np.array([returns[pair] for pair in pairs], dtype=np.float64)
+    invalid = np.isnan(values)
+    counts = np.bincount(group, minlength=len(periods))
+    totals = np.bincount(
+        group, weights=np.where(invalid, 0, values), minlength=len(periods)
+    )
+    missing = np.bincount(group, weights=invalid, minlength=len(periods))
+
+    results = {}
+    for i, (portfolio, start, end) in enumerate(periods):
+        key = period_key(portfolio, start, end)
+        if counts[i] == 0 or missing[i] > 0:
+            logger.warning(f"No prices for portfolio {portfolio.pk} in period")
+            results[key] = None
+        else:
+            results[key] = float(totals[i] / counts[i])
+    return results
@@ -0,0 +1,142 @@
+import logging
+import math
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from stockspec.portfolio.models import Portfolio, TickerPopularity
+
+logger = logging.getLogger(__name__)
+
+# uses are weighted by 2 ** (half-lives since the epoch): old ones lose
+# weight relative to new ones without any score being decayed, and
+# rankings stay index scans. Scores are stored as log2, they don't
+# overflow.
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+# ranking -> tickers it has
+RANKINGS = {
+    "portfolios": Q(portfolios__gt=0),
+    "trending": Q(trending__isnull=False),
+}
+# length of the cached rankings, longer ones are read from the database
+CACHED = 50
+
+
+def cache_key(ranking: str) -> str:
+    return f"popularity:{ranking}"
+
+
+def weight(when: datetime) -> float:
+    """log2 of the weight of a use at a time"""
+    half_life = settings.TRENDING_HALF_LIFE * 24 * 3600
+    return (when - EPOCH).total_seconds() / half_life
+
+
+def add_log2(a: Optional[float], b: float) -> float:
+    """log2(2 ** a + 2 ** b), a being None for nothing"""
+    if a is None:
+        return b
+    high, low = max(a, b), min(a, b)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def invalidate():
+    """Drop the cached rankings once the current transaction commits"""
+    keys = [cache_key(ranking) for ranking in RANKINGS]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def record_uses(uses: Dict[str, int], when: datetime = None):
+    """Count uses of tickers by portfolios, negative for removed ones.
+    New uses also count towards trending, removed ones don't.
+    """
+    uses = {symbol: count for symbol, count in uses.items() if count != 0}
+    if len(uses) == 0:
+        return
+
+    added = {symbol: count for symbol, count in uses.items() if count > 0}
+    changes = defaultdict(list)
+    for symbol, count in uses.items():
+        changes[count].append(symbol)
+    with transaction.atomic():
+        if added:
+            TickerPopularity.objects.bulk_create(
+                [TickerPopularity(ticker_id=symbol) for symbol in added],
+                ignore_conflicts=True,
+            )
+            now = weight(when or timezone.now())
+            rows = list(
+                TickerPopularity.objects.select_for_update().filter(
+                    ticker_id__in=added
+                )
+            )
+            for row in rows:
+                row.trending = add_log2(
+                    row.trending, now + math.log2(added[row.ticker_id])
+                )
+            TickerPopularity.objects.bulk_update(rows, ["trending"])
+        for count, symbols in changes.items():
+            TickerPopularity.objects.filter(ticker_id__in=symbols).update(
+                portfolios=F("portfolios") + count
+            )
+        invalidate()
+
+
+def ranking(count: int, trending: bool = False) -> List[str]:
+    """Symbols of the count tickers used in the most portfolios, or with
+    the most recent uses, read from the ranking's index
+    """
+    name = "trending" if trending else "portfolios"
+    return list(
+        TickerPopularity.objects.filter(RANKINGS[name])
+        .order_by(f"-{name}", "ticker_id")
+        .values_list("ticker_id", flat=True)[:count]
+    )
+
+
+def top_tickers(count: int, trending: bool = False) -> List[str]:
+    """ranking served from the default cache, until tickers are used in
+    portfolios or for POPULARITY_CACHE_TIMEOUT
+    """
+    if count > CACHED:
+        return ranking(count, trending)
+    key = cache_key("trending" if trending else "portfolios")
+    symbols = cache.get(key)
+    if symbols is None:
+        symbols = ranking(CACHED, trending)
+        cache.set(key, symbols, settings.POPULARITY_CACHE_TIMEOUT)
+    return symbols[:count]
+
+
+def rebuild_popularity() -> int:
+    """Count the uses of every ticker again from portfolios, as if they
+    had been used when their portfolio was created. Returns the number
+    of tickers used.
+    """
+    links = Portfolio.tickers.through.objects.values_list(
+        "ticker_id", "portfolio__created_at"
+    )
+    popularity = {}
+    for symbol, created_at in links:
+        if symbol not in popularity:
+            popularity[symbol] = TickerPopularity(
+                ticker_id=symbol, portfolios=0
+            )
+        row = popularity[symbol]
+        row.portfolios += 1
+        row.trending = add_log2(row.trending, weight(created_at))
+
+    with transaction.atomic():
+        TickerPopularity.objects.all().delete()
+        TickerPopularity.objects.bulk_create(
+            popularity.values(), batch_size=1000
+        )
+        invalidate()
+    logger.info(f"Counted the uses of {len(popularity)} tickers")
+    return len(popularity)
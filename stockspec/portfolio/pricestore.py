@@ -0,0 +1,227 @@
+import logging
+import os
+import tempfile
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import quote, unquote
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+EPOCH = date(1970, 1, 1)
+SCALE = 10 ** 4  # close prices have 4 decimal places
+
+
+def as_date(value) -> date:
+    """Dates and datetimes to a date, the way the price table compares
+    them (aware datetimes are converted to the default timezone first).
+    """
+    from stockspec.portfolio.models import StockPrice
+
+    return StockPrice._meta.get_field("date").to_python(value)
+
+
+def to_days(value) -> int:
+    return (as_date(value) - EPOCH).days
+
+
+def stamp(updated: Optional[datetime]) -> int:
+    """A ticker's last_updated in nanoseconds, 0 for never"""
+    if updated is None:
+        return 0
+    since = updated - datetime(1970, 1, 1, tzinfo=timezone.utc)
+    return since // timedelta(microseconds=1) * 1000
+
+
+class PriceStore:
+    """A read-optimized, columnar copy of the price table.
+
+    Every ticker has a single .npy file holding two int64 columns sorted
+    by date: days since epoch and close prices in ten-thousandths, so
+    closes are exact. Files are memory-mapped, as-of lookups are a binary
+    search and never touch the database.
+
+    Files are replaced atomically by refresh, which only rewrites tickers
+    whose prices changed (appending new rows when possible). Readers
+    notice a replaced file and map it again.
+
+    A file's mtime is the last_updated of its ticker when it was read.
+    Price writes update it in their transaction (see PriceSink and the
+    price signals), so a file whose mtime differs from its ticker's may
+    miss prices, whichever process wrote them.
+    """
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self.mapped = {}  # symbol -> (file version, array)
+
+    def path(self, symbol: str) -> Path:
+        return self.root / f"{quote(symbol, safe='')}.npy"
+
+    def load(self, symbol: str) -> Optional[Tuple[int, np.ndarray]]:
+        """The stamp and (2, n) array of a ticker, None if it is not in
+        the store
+        """
+        path = self.path(symbol)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self.mapped.pop(symbol, None)
+            return None
+
+        version = (stat.st_ino, stat.st_mtime_ns)
+        mapped = self.mapped.get(symbol)
+        if mapped is None or mapped[0] != version:
+            mapped = (version, np.load(path, mmap_mode="r"))
+            self.mapped[symbol] = mapped
+        return stat.st_mtime_ns, mapped[1]
+
+    def series(self, symbol: str) -> Optional[np.ndarray]:
+        """The (2, n) array of a ticker, None if it is not in the store"""
+        loaded = self.load(symbol)
+        return None if loaded is None else loaded[1]
+
+    def __contains__(self, symbol: str) -> bool:
+        return self.series(symbol) is not None
+
+    def stale(self, updated: Dict[str, Optional[datetime]]) -> List[str]:
+        """Tickers, given as symbol -> last_updated, whose file is missing
+        or older than the ticker
+        """
+        stale = []
+        for symbol, last_updated in updated.items():
+            loaded = self.load(symbol)
+            if loaded is None or loaded[0] != stamp(last_updated):
+                stale.append(symbol)
+        return stale
+
+    def prices_at(
+        self, symbols: List[str], days: Iterable
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Latest closes on or before each day, for many tickers at once.
+        Returns two (len(symbols), len(days)) float arrays, the closes and
+        the ordinals of their date, nan where there is no price (or the
+        ticker is not in the store).
+        """
+        days = np.array([to_days(day) for day in days], dtype=np.int64)
+        prices = np.full((len(symbols), len(days)), np.nan)
+        dates = np.full((len(symbols), len(days)), np.nan)
+        for row, symbol in enumerate(symbols):
+            series = self.series(symbol)
+            if series is None or series.shape[1] == 0:
+                continue
+            i = np.searchsorted(series[0], days, side="right")
+            found = i > 0
+            prices[row, found] = series[1][i[found] - 1] / SCALE
+            dates[row, found] = series[0][i[found] - 1] + EPOCH.toordinal()
+        return prices, dates
+
+    def write(self, symbol: str, series: np.ndarray, updated: int):
+        """Atomically replace the file of a ticker, stamped with its
+        last_updated
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, series)
+            os.utime(tmp, ns=(updated, updated))
+            os.replace(tmp, self.path(symbol))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def rows(self, symbol: str, after: date = None) -> np.ndarray:
+        """Prices of a ticker from the price table, as a (2, n) array"""
+        from stockspec.portfolio.models import StockPrice
+
+        queryset = StockPrice.objects.filter(ticker_id=symbol)
+        if after is not None:
+            queryset = queryset.filter(date__gt=after)
+        rows = queryset.order_by("date").values_list("date", "close_price")
+        series = np.array(
+            [((day - EPOCH).days, int(close * SCALE)) for day, close in rows],
+            dtype=np.int64,
+        )
+        return series.reshape(-1, 2).T
+
+    def refresh(
+        self, symbols: Iterable[str] = None, rebuild: bool = False
+    ) -> Dict[str, int]:
+        """Bring the store up to date with the price table, for some
+        tickers or all of them. Tickers are compared by row count and sum
+        of closes, so edited prices are noticed. New prices are appended,
+        other changes and rebuild rewrite the ticker, a newer ticker only
+        stamps its file again. Returns symbol -> rows in the store for
+        the tickers written.
+        """
+        from stockspec.portfolio.models import Ticker
+
+        queryset = Ticker.objects.all()
+        if symbols is not None:
+            symbols = list(symbols)
+            queryset = queryset.filter(symbol__in=symbols)
+        # last_updated is read with the totals, before the prices
+        tables = queryset.annotate(
+            count=Count("prices"), total=Sum("prices__close_price")
+        ).values_list("symbol", "last_updated", "count", "total")
+
+        changed = {}
+        seen = set()
+        for symbol, last_updated, count, total in tables:
+            seen.add(symbol)
+            updated = stamp(last_updated)
+            total = int((total or 0) * SCALE)
+            loaded = self.load(symbol)
+            series = None if loaded is None else loaded[1]
+            if series is None or rebuild:
+                series = self.rows(symbol)
+            elif (series.shape[1], int(series[1].sum())) != (count, total):
+                # only newer prices were added, append them
+                stored_last = None
+                if series.shape[1] > 0:
+                    stored_last = EPOCH + timedelta(days=int(series[0][-1]))
+                new = self.rows(symbol, after=stored_last)
+                series = np.concatenate([series, new], axis=1)
+                if (series.shape[1], int(series[1].sum())) != (count, total):
+                    series = self.rows(symbol)
+            elif loaded[0] == updated:
+                continue
+            self.write(symbol, series, updated)
+            changed[symbol] = series.shape[1]
+
+        # tickers that were deleted
+        if symbols is None:
+            symbols = [unquote(path.stem) for path in self.root.glob("*.npy")]
+        for symbol in set(symbols) - seen:
+            self.remove(symbol)
+
+        if len(changed) > 0:
+            logger.info(f"Refreshed {len(changed)} tickers in price store")
+        return changed
+
+    def remove(self, symbol: str):
+        self.mapped.pop(symbol, None)
+        try:
+            os.unlink(self.path(symbol))
+        except FileNotFoundError:
+            pass
+
+
+_store = None
+
+
+def get_store() -> Optional[PriceStore]:
+    """The price store of the process, None unless PRICE_STORE_DIR is set"""
+    global _store
+    root = settings.PRICE_STORE_DIR
+    if not root:
+        return None
+    if _store is None or _store.root != Path(root):
+        _store = PriceStore(root)
+    return _store
@@ -0,0 +1,189 @@
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, Iterable, Tuple
+from urllib.parse import quote
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache
+
+# (symbol, start date, end date)
+ReturnKey = Tuple[str, date, date]
+
+
+class ReturnCache:
+    """Returns of tickers over periods, keyed by the dates of the period.
+
+    A return is closed when its end price is the close of the end date
+    (or of the last session before it): prices are only appended, so it
+    only changes when a price is edited. Closed returns are kept in a
+    bounded in-process LRU and in the backend, under a version of their
+    ticker which is replaced when one of its prices is edited. LRU
+    entries are checked against the version in the backend.
+
+    Other returns are open, a new price may change them. They are only
+    kept in the backend, for open_timeout seconds and under a generation
+    of their ticker which is replaced when new prices are written for it
+    (see PriceSink). With a backend shared by every process they are
+    dropped everywhere at once, otherwise processes that didn't write
+    the prices keep them until they expire.
+    """
+
+    def __init__(
+        self, backend: BaseCache, size: int, open_timeout: int = None
+    ):
+        self.backend = backend
+        self.size = size
+        self.open_timeout = open_timeout
+        # key -> (version, return)
+        self.lru = OrderedDict()
+        self.lock = threading.Lock()
+
+    def key(self, key: ReturnKey, tag: str = None) -> str:
+        symbol, start, end = key
+        parts = [quote(symbol, safe=""), start.isoformat(), end.isoformat()]
+        if tag is not None:
+            parts.insert(1, tag)
+        return "return:" + ":".join(parts)
+
+    def generation_key(self, symbol: str) -> str:
+        return f"return-generation:{quote(symbol, safe='')}"
+
+    def version_key(self, symbol: str) -> str:
+        return f"return-version:{quote(symbol, safe='')}"
+
+    def current(
+        self, name, symbols: Iterable[str], create: bool = False
+    ) -> Dict[str, str]:
+        """Current value of a per ticker key, created when missing"""
+        symbols = set(symbols)
+        keys = {name(symbol): symbol for symbol in symbols}
+        found = self.backend.get_many(list(keys))
+        values = {keys[key]: value for key, value in found.items()}
+        if create:
+            for symbol in symbols - set(values):
+                key = name(symbol)
+                # another process may have created it first
+                self.backend.add(key, uuid4().hex[:12], timeout=None)
+                value = self.backend.get(key)
+                if value is not None:
+                    values[symbol] = value
+        return values
+
+    def generations(
+        self, symbols: Iterable[str], create: bool = False
+    ) -> Dict[str, str]:
+        """Current generation of tickers, for their open returns"""
+        return self.current(self.generation_key, symbols, create)
+
+    def versions(self, symbols: Iterable[str]) -> Dict[str, str]:
+        """Current version of tickers, for their closed returns. None
+        with a backend that keeps nothing, the LRU is then only cleared
+        in the process that edits prices.
+        """
+        return self.current(self.version_key, symbols, create=True)
+
+    def get_many(self, keys: Iterable[ReturnKey]) -> Dict[ReturnKey, float]:
+        keys = list(keys)
+        if len(keys) == 0:
+            return {}
+        versions = self.versions(symbol for symbol, _, _ in keys)
+        found = {}
+        missing = []
+        with self.lock:
+            for key in keys:
+                entry = self.lru.get(key)
+                if entry is None or entry[0] != versions.get(key[0]):
+                    missing.append(key)
+                else:
+                    self.lru.move_to_end(key)
+                    found[key] = entry[1]
+        if len(missing) == 0:
+            return found
+
+        generations = self.generations(symbol for symbol, _, _ in missing)
+        names = {}
+        for key in missing:
+            version = versions.get(key[0])
+            names[self.key(key, version and f"v{version}")] = (key, False)
+            generation = generations.get(key[0])
+            if generation is not None:
+                names[self.key(key, generation)] = (key, True)
+
+        for name, value in self.backend.get_many(list(names)).items():
+            key, is_open = names[name]
+            found[key] = value
+            if not is_open:
+                self.remember(key, value, versions.get(key[0]))
+        return found
+
+    def set_many(
+        self,
+        returns: Dict[ReturnKey, Tuple[float, bool]],
+        generations: Dict[str, str],
+        versions: Dict[str, str],
+    ):
+        """Keep returns, given as key -> (return, is open). Returns are
+        kept under the generations and versions read before computing
+        them, if prices changed since they are out of reach at once.
+        """
+        closed, opened = {}, {}
+        for key, (value, is_open) in returns.items():
+            if not is_open:
+                version = versions.get(key[0])
+                closed[self.key(key, version and f"v{version}")] = value
+                self.remember(key, value, version)
+            elif key[0] in generations:
+                opened[self.key(key, generations[key[0]])] = value
+        self.backend.set_many(closed)
+        self.backend.set_many(opened, timeout=self.open_timeout)
+
+    def remember(self, key: ReturnKey, value: float, version: str = None):
+        with self.lock:
+            self.lru[key] = (version, value)
+            self.lru.move_to_end(key)
+            while len(self.lru) > self.size:
+                self.lru.popitem(last=False)
+
+    def invalidate(self, symbols: Iterable[str]):
+        """Drop the open returns of tickers, new prices were appended"""
+        self.backend.delete_many(
+            [self.generation_key(symbol) for symbol in symbols]
+        )
+
+    def forget(self, symbols: Iterable[str]):
+        """Drop every return of tickers, when a price was edited: their
+        generation and version are replaced
+        """
+        symbols = set(symbols)
+        self.invalidate(symbols)
+        self.backend.set_many(
+            {self.version_key(symbol): uuid4().hex[:12] for symbol in symbols},
+            timeout=None,
+        )
+        with self.lock:
+            for key in [key for key in self.lru if key[0] in symbols]:
+                del self.lru[key]
+
+    def clear(self):
+        """Drop every return, in the process and in the backend"""
+        self.backend.clear()
+        with self.lock:
+            self.lru.clear()
+
+
+_cache = None
+
+
+def get_return_cache() -> ReturnCache:
+    """The return cache of the process"""
+    global _cache
+    if _cache is None:
+        _cache = ReturnCache(
+            caches["returns"],
+            settings.RETURNS_CACHE_SIZE,
+            settings.RETURNS_OPEN_TIMEOUT,
+        )
+    return _cache
@@ -0,0 +1,189 @@
+import logging
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+
+from stockspec.portfolio.models import (
+    StockPrice,
+    TickerCorrelation,
+    TickerRisk,
+)
+from stockspec.portfolio.popularity import ranking
+
+logger = logging.getLogger(__name__)
+
+# a year of sessions, with some slack for holidays
+LOOKBACK = timedelta(weeks=53)
+SESSIONS_PER_YEAR = 252
+# volatility field -> sessions in its window
+WINDOWS = {"volatility_1m": 21, "volatility_3m": 63}
+# share of a window's returns needed for a measure
+MIN_COVERAGE = 0.75
+
+
+def cache_key(risk: TickerRisk) -> str:
+    """key of a ticker's risk response, new for every analytics run and
+    stats refresh so no process serves it once they are replaced
+    """
+    stamps = [risk.updated_at]
+    stats = getattr(risk.ticker, "stats", None)
+    if stats is not None:
+        stamps.append(stats.updated_at)
+    version = "-".join(str(int(stamp.timestamp() * 1e6)) for stamp in stamps)
+    return f"risk:{risk.ticker_id}:{version}"
+
+
+def to_decimal(value: float, max_digits: int) -> Optional[Decimal]:
+    """value rounded to 4 decimals, None when it doesn't fit the field"""
+    if not np.isfinite(value) or abs(value) >= 10 ** (max_digits - 4):
+        return None
+    return Decimal(str(round(float(value), 4)))
+
+
+def return_matrix(end: date) -> Tuple[np.ndarray, List[str]]:
+    """Daily log returns of every ticker over the year before end, with
+    one row per date any ticker has a close on and one column per ticker.
+    A return is nan when either close is missing.
+    """
+    rows = (
+        StockPrice.objects.filter(date__gt=end - LOOKBACK, date__lte=end)
+        .order_by()
+        .values_list("ticker_id", "date", "close_price")
+    )
+    names, days, closes = [], [], []
+    for symbol, day, close in rows:
+        names.append(symbol)
+        days.append(day.toordinal())
+        closes.append(float(close))
+    if len(closes) == 0:
+        return np.empty((0, 0)), []
+
+    symbols, col = np.unique(names, return_inverse=True)
+    dates, row = np.unique(days, return_inverse=True)
+    matrix = np.full((len(dates), len(symbols)), np.nan)
+    matrix[row, col] = closes
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = np.diff(np.log(matrix), axis=0)
+    # zero closes
+    returns[~np.isfinite(returns)] = np.nan
+    return returns, list(symbols)
+
+
+def volatilities(returns: np.ndarray, window: int) -> np.ndarray:
+    """Annualized volatility of every column over its last window rows"""
+    returns = returns[-window:]
+    counts = np.isfinite(returns).sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means = np.nansum(returns, axis=0) / counts
+        squares = np.nansum((returns - means) ** 2, axis=0)
+        annualized = np.sqrt(squares / (counts - 1) * SESSIONS_PER_YEAR)
+    annualized[counts < MIN_COVERAGE * min(window, len(returns))] = np.nan
+    return annualized
+
+
+def covariances(
+    x: np.ndarray, y: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Covariance, variance of x and variance of y for every pair of
+    columns of x and y, over the rows where both are known. Returns
+    (x columns, y columns) arrays.
+    """
+    known_x = np.isfinite(x).astype(float)
+    known_y = np.isfinite(y).astype(float)
+    x = np.nan_to_num(x)
+    y = np.nan_to_num(y)
+
+    counts = known_x.T @ known_y
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sum_x = x.T @ known_y
+        sum_y = known_x.T @ y
+        cov = (x.T @ y - sum_x * sum_y / counts) / (counts - 1)
+        var_x = ((x * x).T @ known_y - sum_x**2 / counts) / (counts - 1)
+        var_y = (known_x.T @ (y * y) - sum_y**2 / counts) / (counts - 1)
+    too_few = counts < MIN_COVERAGE * len(x)
+    for values in (cov, var_x, var_y):
+        values[too_few] = np.nan
+    return cov, var_x, var_y
+
+
+def compute_risk(
+    benchmark: str = None, correlated: int = None
+) -> Tuple[int, int]:
+    """Recompute the risk of every ticker from the last year of prices.
+
+    Prices are loaded with one query into an aligned (dates, tickers)
+    matrix of returns, every measure is then computed for all tickers
+    at once. Betas are against the benchmark ticker, pairwise
+    correlations are kept for the most used tickers. Results replace the
+    stored ones, cached responses are keyed by them. Returns the number of
+    tickers and of correlations stored.
+    """
+    benchmark = benchmark or settings.RISK_BENCHMARK
+    correlated = correlated or settings.RISK_CORRELATION_TICKERS
+
+    end = StockPrice.objects.aggregate(end=Max("date"))["end"]
+    if end is None:
+        return 0, 0
+    returns, symbols = return_matrix(end)
+    columns = {symbol: i for i, symbol in enumerate(symbols)}
+
+    windows = {
+        name: volatilities(returns, window) for name, window in WINDOWS.items()
+    }
+    if benchmark in columns:
+        market = returns[:, [columns[benchmark]]]
+        cov, var, var_market = (a[:, 0] for a in covariances(returns, market))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            betas = cov / var_market
+            correlations = cov / np.sqrt(var * var_market)
+    else:
+        logger.warning(f"No prices for benchmark {benchmark}, no betas")
+        betas = correlations = np.full(len(symbols), np.nan)
+
+    risks = [
+        TickerRisk(
+            ticker_id=symbol,
+            as_of=end,
+            benchmark=benchmark,
+            beta=to_decimal(betas[i], 10),
+            correlation=to_decimal(correlations[i], 5),
+            **{
+                name: to_decimal(values[i], 8)
+                for name, values in windows.items()
+            },
+        )
+        for i, symbol in enumerate(symbols)
+    ]
+
+    popular = [s for s in ranking(correlated) if s in columns]
+    pairs = returns[:, [columns[symbol] for symbol in popular]]
+    cov, var_x, var_y = covariances(pairs, pairs)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        matrix = cov / np.sqrt(var_x * var_y)
+    pairwise = [
+        TickerCorrelation(
+            ticker_id=symbol,
+            other_id=other,
+            correlation=to_decimal(np.clip(matrix[i, j], -1, 1), 5),
+            as_of=end,
+        )
+        for i, symbol in enumerate(popular)
+        for j, other in enumerate(popular)
+        if i != j and np.isfinite(matrix[i, j])
+    ]
+
+    with transaction.atomic():
+        TickerRisk.objects.all().delete()
+        TickerRisk.objects.bulk_create(risks, batch_size=1000)
+        TickerCorrelation.objects.all().delete()
+        TickerCorrelation.objects.bulk_create(pairwise, batch_size=1000)
+    logger.info(
+        f"Computed the risk of {len(risks)} tickers and "
+        f"{len(pairwise)} correlations"
+    )
+    return len(risks), len(pairwise)
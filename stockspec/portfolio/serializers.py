@@ -1,7 +1,15 @@
 from rest_framework import serializers
 
 from stockspec.users.serializers import BaseUserSerializer
-from stockspec.portfolio.models import Portfolio, Ticker, StockPrice
+from stockspec.portfolio.models import (
+    Portfolio,
+    Ticker,
+    TickerCorrelation,
+    TickerRisk,
+    TickerStats,
+    StockPrice,
+)
+from stockspec.portfolio.performance import period_key
 
 
 class PortfolioSerialier(serializers.ModelSerializer):
@@ -20,18 +28,44 @@ class PortfolioSerialier(serializers.ModelSerializer):
             end_date = self.context.get("end_date")
 
             if all([start_date, end_date]):
+                # computed in batch, see portfolio_returns
+                performances = self.context.get("performances")
+                if performances is not None:
+                    key = period_key(obj, start_date, end_date)
+                    return performances.get(key)
                 return obj.return_for_period(start_date, end_date)
         return None
 
     def get_tickers(self, obj: Portfolio):
         if self.context.get("with_tickers", False):
+            tickers = obj.tickers.all()
+            # prefetched with their stats in lists, see Portfolio.listed
+            if "tickers" not in getattr(obj, "_prefetched_objects_cache", {}):
+                tickers = tickers.select_related("stats")
             return TickerSerializer(
-                obj.tickers, context=self.context, many=True
+                tickers, context=self.context, many=True
             ).data
         return None
 
 
+class TickerStatsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TickerStats
+        fields = [
+            "as_of",
+            "change_1w",
+            "change_1m",
+            "change_ytd",
+            "high_52w",
+            "low_52w",
+            "volatility",
+        ]
+
+
 class TickerSerializer(serializers.ModelSerializer):
+    # select_related("stats") to avoid a query per ticker
+    stats = TickerStatsSerializer(read_only=True)
+
     class Meta:
         model = Ticker
         fields = [
@@ -48,8 +82,50 @@ class TickerSerializer(serializers.ModelSerializer):
             "last_price",
             "delta",
             "percentage_change",
+            "stats",
+        ]
+
+
+class TickerCorrelationSerializer(serializers.ModelSerializer):
+    symbol = serializers.ReadOnlyField(source="other_id")
+
+    class Meta:
+        model = TickerCorrelation
+        fields = ["symbol", "correlation"]
+
+
+class TickerRiskSerializer(serializers.ModelSerializer):
+    symbol = serializers.ReadOnlyField(source="ticker_id")
+    # computed once, with the ticker's stats
+    volatility_1y = serializers.DecimalField(
+        source="ticker.stats.volatility",
+        decimal_places=4,
+        max_digits=8,
+        read_only=True,
+    )
+    correlations = serializers.SerializerMethodField()
+
+    class Meta:
+        model = TickerRisk
+        fields = [
+            "symbol",
+            "as_of",
+            "benchmark",
+            "volatility_1m",
+            "volatility_3m",
+            "volatility_1y",
+            "beta",
+            "correlation",
+            "correlations",
         ]
 
+    def get_correlations(self, obj: TickerRisk):
+        """correlations with popular tickers, the closest first"""
+        correlations = TickerCorrelation.objects.filter(
+            ticker_id=obj.ticker_id
+        ).order_by("-correlation")
+        return TickerCorrelationSerializer(correlations, many=True).data
+
 
 class StockPriceSerializer(serializers.ModelSerializer):
     price = serializers.ReadOnlyField(source="close_price")
@@ -59,3 +135,31 @@ class StockPriceSerializer(serializers.ModelSerializer):
         model = StockPrice
         fields = ["price", "time", "volume"]
 
+
+class ChangesParamsSerializer(serializers.Serializer):
+    """Query parameters of the ticker changes, since is the until of the
+    previous changes or the time the catalogue was loaded at
+    """
+
+    since = serializers.DateTimeField()
+
+
+class SeriesParamsSerializer(serializers.Serializer):
+    """Query parameters of a price series, before is the date of the
+    oldest price already known (a cursor to the previous page)
+    """
+
+    MAX_LIMIT = 5000
+
+    start = serializers.DateField(required=False)
+    to = serializers.DateField(required=False)
+    before = serializers.DateField(required=False)
+    limit = serializers.IntegerField(
+        min_value=1, max_value=MAX_LIMIT, default=100
+    )
+
+    def get_fields(self):
+        fields = super().get_fields()
+        # from is a keyword, it can't be declared
+        fields["from"] = fields.pop("start")
+        return fields
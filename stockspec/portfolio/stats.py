@@ -0,0 +1,171 @@
+import logging
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Max, Min, OuterRef, Subquery
+
+from stockspec.portfolio.models import StockPrice, Ticker, TickerStats
+
+logger = logging.getLogger(__name__)
+
+YEAR = timedelta(weeks=52)
+SESSIONS_PER_YEAR = 252
+MIN_RETURNS = 20  # daily returns needed for a volatility
+CHUNK_SIZE = 500  # symbols per query
+
+
+def month_before(day: date) -> date:
+    """Same day of the previous month, or its last day"""
+    last = day.replace(day=1) - timedelta(days=1)
+    return last.replace(day=min(day.day, last.day))
+
+
+def horizons(latest: date) -> Dict[str, date]:
+    """Dates whose latest close is the base of each change"""
+    return {
+        "change_1w": latest - timedelta(weeks=1),
+        "change_1m": month_before(latest),
+        # last close of the previous year
+        "change_ytd": date(latest.year - 1, 12, 31),
+    }
+
+
+def close_on(day: date) -> Subquery:
+    """Latest close of the outer ticker on or before day, an index seek"""
+    return Subquery(
+        StockPrice.objects.filter(ticker=OuterRef("pk"), date__lte=day)
+        .order_by("-date")
+        .values("close_price")[:1]
+    )
+
+
+def change(last: Decimal, base: Decimal) -> Optional[Decimal]:
+    if last is None or not base:
+        return None
+    return ((last - base) / base).quantize(Decimal("0.0001"))
+
+
+def volatilities(
+    symbols: List[str], start: date, end: date
+) -> Dict[str, float]:
+    """Annualized volatility of the daily log returns in (start, end],
+    computed for every symbol at once
+    """
+    rows = list(
+        StockPrice.objects.filter(
+            ticker_id__in=symbols, date__gt=start, date__lte=end
+        )
+        .order_by("ticker_id", "date")
+        .values_list("ticker_id", "close_price")
+    )
+    if len(rows) < 2:
+        return {}
+    names = np.array([symbol for symbol, _ in rows])
+    closes = np.array([float(close) for _, close in rows])
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = np.diff(np.log(closes))
+    # no return across two tickers, nor from a zero price
+    valid = (names[1:] == names[:-1]) & np.isfinite(returns)
+    keys, group = np.unique(names[1:][valid], return_inverse=True)
+    returns = returns[valid]
+
+    counts = np.bincount(group, minlength=len(keys))
+    means = np.bincount(group, weights=returns, minlength=len(keys)) / counts
+    squares = np.bincount(
+        group, weights=(returns - means[group]) ** 2, minlength=len(keys)
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        annualized = np.sqrt(squares / (counts - 1) * SESSIONS_PER_YEAR)
+    return {
+        symbol: float(annualized[i])
+        for i, symbol in enumerate(keys)
+        if counts[i] >= MIN_RETURNS
+    }
+
+
+def compute_stats(
+    symbols: List[str], latest: date, volatility: bool = True
+) -> List[TickerStats]:
+    """Statistics of symbols whose latest close is on the same date, with
+    one query for the changes, one for the 52 weeks range and one for the
+    volatility
+    """
+    bases = horizons(latest)
+    tickers = (
+        Ticker.objects.filter(symbol__in=symbols)
+        .annotate(
+            close=close_on(latest),
+            **{name: close_on(day) for name, day in bases.items()},
+        )
+        .values_list("symbol", "close", *bases)
+    )
+    stats = {}
+    for symbol, close, *closes in tickers:
+        stats[symbol] = TickerStats(
+            ticker_id=symbol,
+            as_of=latest,
+            **{name: change(close, base) for name, base in zip(bases, closes)},
+        )
+
+    ranges = (
+        StockPrice.objects.filter(
+            ticker_id__in=symbols, date__gt=latest - YEAR, date__lte=latest
+        )
+        .order_by()
+        .values("ticker_id")
+        .annotate(high=Max("close_price"), low=Min("close_price"))
+        .values_list("ticker_id", "high", "low")
+    )
+    for symbol, high, low in ranges:
+        stats[symbol].high_52w = high
+        stats[symbol].low_52w = low
+
+    if volatility:
+        for symbol, value in volatilities(
+            symbols, latest - YEAR, latest
+        ).items():
+            stats[symbol].volatility = round(value, 4)
+    return list(stats.values())
+
+
+def refresh_ticker_stats(
+    symbols: Iterable[str] = None, volatility: bool = True
+) -> int:
+    """Recompute the statistics of tickers (every one by default).
+
+    Tickers are grouped by the date of their latest close, so the bounds
+    of each horizon are the same for a whole group and its statistics
+    come from a few set-based queries over the (ticker, date) index.
+    The daily returns for the volatility are reduced with NumPy, they
+    can be left out. Returns the number of tickers refreshed.
+    """
+    prices = StockPrice.objects.all()
+    if symbols is not None:
+        prices = prices.filter(ticker_id__in=set(symbols))
+    latest = (
+        prices.order_by()
+        .values("ticker_id")
+        .annotate(latest=Max("date"))
+        .values_list("ticker_id", "latest")
+    )
+    groups = defaultdict(list)
+    for symbol, day in latest:
+        if day is not None:
+            groups[day].append(symbol)
+
+    refreshed = 0
+    for day, group in groups.items():
+        for i in range(0, len(group), CHUNK_SIZE):
+            chunk = group[i : i + CHUNK_SIZE]
+            stats = compute_stats(chunk, day, volatility=volatility)
+            with transaction.atomic():
+                TickerStats.objects.filter(ticker_id__in=chunk).delete()
+                TickerStats.objects.bulk_create(stats)
+            refreshed += len(stats)
+    logger.info(f"Refreshed the statistics of {refreshed} tickers")
+    return refreshed
@@ -0,0 +1,85 @@
+from django.test import TestCase
+
+from stockspec.portfolio.models import Portfolio, Ticker
+from stockspec.users.models import User
+
+
+class TickersKeyTests(TestCase):
+    """The fingerprint follows the ticker set, whichever side changes it"""
+
+    def setUp(self):
+        self.user = User.objects.create(username="user", email="user@x.io")
+        self.tickers = {
+            symbol: Ticker.objects.create(symbol=symbol)
+            for symbol in ("AAA", "BBB", "CCC")
+        }
+        self.portfolio = Portfolio.objects.create(user=self.user)
+        self.other = Portfolio.objects.create(user=self.user)
+
+    def assertKey(self, portfolio, symbols):
+        portfolio.refresh_from_db()
+        self.assertEqual(portfolio.tickers_key, Portfolio.key_for(symbols))
+
+    def test_key_for(self):
+        self.assertEqual(Portfolio.key_for([]), "")
+        self.assertEqual(
+            Portfolio.key_for(["BBB", "AAA", "AAA"]),
+            Portfolio.key_for(["AAA", "BBB"]),
+        )
+        self.assertNotEqual(
+            Portfolio.key_for(["AAA", "BBB"]), Portfolio.key_for(["AAA"])
+        )
+
+    def test_portfolio_side(self):
+        aaa, bbb, ccc = self.tickers.values()
+        self.portfolio.tickers.add(aaa, bbb)
+        self.assertKey(self.portfolio, ["AAA", "BBB"])
+        self.portfolio.tickers.remove(aaa)
+        self.assertKey(self.portfolio, ["BBB"])
+        self.portfolio.tickers.set([aaa, ccc])
+        self.assertKey(self.portfolio, ["AAA", "CCC"])
+        self.portfolio.tickers.clear()
+        self.assertKey(self.portfolio, [])
+
+    def test_ticker_side(self):
+        aaa, bbb = self.tickers["AAA"], self.tickers["BBB"]
+        self.portfolio.tickers.add(aaa)
+        self.other.tickers.add(aaa)
+        bbb.portfolio_set.add(self.portfolio, self.other)
+        self.assertKey(self.portfolio, ["AAA", "BBB"])
+        self.assertKey(self.other, ["AAA", "BBB"])
+
+        bbb.portfolio_set.remove(self.other)
+        self.assertKey(self.portfolio, ["AAA", "BBB"])
+        self.assertKey(self.other, ["AAA"])
+
+        # the cleared portfolios are only known before
+        aaa.portfolio_set.clear()
+        self.assertKey(self.portfolio, ["BBB"])
+        self.assertKey(self.other, [])
+
+    def test_get_or_create_from_tickers(self):
+        aaa, bbb, ccc = self.tickers.values()
+        portfolio = Portfolio.get_or_create_from_tickers(self.user, [aaa, bbb])
+        self.assertKey(portfolio, ["AAA", "BBB"])
+        self.assertEqual(
+            Portfolio.get_or_create_from_tickers(self.user, [bbb, aaa]),
+            portfolio,
+        )
+        # one ticker more, or another user
+        self.assertNotEqual(
+            Portfolio.get_or_create_from_tickers(self.user, [aaa, bbb, ccc]),
+            portfolio,
+        )
+        user = User.objects.create(username="user2", email="user2@x.io")
+        self.assertNotEqual(
+            Portfolio.get_or_create_from_tickers(user, [aaa, bbb]), portfolio
+        )
+        # edited to the same tickers
+        portfolio.tickers.remove(bbb)
+        self.assertEqual(
+            Portfolio.get_or_create_from_tickers(self.user, [aaa]), portfolio
+        )
+        # of any user
+        self.assertEqual(Portfolio.exact_tickers([bbb, aaa]).count(), 1)
+        self.assertEqual(Portfolio.exact_tickers([aaa]).count(), 1)
@@ -0,0 +1,132 @@
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.test import TestCase, override_settings
+
+from stockspec.portfolio.models import Portfolio, StockPrice, Ticker
+from stockspec.portfolio.performance import (
+    load_closes,
+    period_key,
+    portfolio_returns,
+)
+from stockspec.portfolio.returncache import get_return_cache
+from stockspec.users.models import User
+
+FIRST = date(2020, 10, 1)
+LAST = date(2020, 11, 20)
+# no prices for BBB in between, longer than the lookback window
+GAP = (date(2020, 10, 20), date(2020, 11, 10))
+
+
+def weekdays(start: date, end: date):
+    day = start
+    while day <= end:
+        if day.weekday() < 5:
+            yield day
+        day += timedelta(days=1)
+
+
+def close(symbol: str, day: date) -> float:
+    days = (day - FIRST).days
+    return 100 + days if symbol == "AAA" else 50 + 2 * days
+
+
+class PortfolioReturnsTests(TestCase):
+    def setUp(self):
+        get_return_cache().clear()
+        user = User.objects.create(username="user", email="user@x.io")
+        self.tickers = [
+            Ticker.objects.create(symbol=symbol) for symbol in ("AAA", "BBB")
+        ]
+        StockPrice.objects.bulk_create(
+            StockPrice(
+                ticker=ticker,
+                date=day,
+                close_price=Decimal(close(ticker.symbol, day)),
+                volume=1,
+            )
+            for ticker in self.tickers
+            for day in weekdays(FIRST, LAST)
+            if ticker.symbol == "AAA" or not GAP[0] <= day <= GAP[1]
+        )
+        self.portfolio = Portfolio.get_or_create_from_tickers(
+            user, self.tickers
+        )
+        self.single = Portfolio.get_or_create_from_tickers(
+            user, self.tickers[:1]
+        )
+        self.gapped = Portfolio.get_or_create_from_tickers(
+            user, self.tickers[1:]
+        )
+
+    def expected(self, start: date, end: date, symbols=None):
+        returns = [
+            (close(symbol, end) - close(symbol, start)) / close(symbol, start)
+            for symbol in symbols or ["AAA", "BBB"]
+        ]
+        return sum(returns) / len(returns)
+
+    def returns(self, *periods):
+        results = portfolio_returns(periods)
+        return [results.get(period_key(*period)) for period in periods]
+
+    def test_returns(self):
+        start, end = date(2020, 10, 5), date(2020, 11, 16)
+        returns = self.returns(
+            (self.portfolio, start, end), (self.single, start, end)
+        )
+        self.assertAlmostEqual(returns[0], self.expected(start, end))
+        self.assertAlmostEqual(returns[1], self.expected(start, end, ["AAA"]))
+
+    def test_weekend_bounds(self):
+        # Saturday and Sunday stand for the Friday before them
+        [result] = self.returns(
+            (self.portfolio, date(2020, 10, 3), date(2020, 11, 15))
+        )
+        self.assertAlmostEqual(
+            result, self.expected(date(2020, 10, 2), date(2020, 11, 13))
+        )
+
+    def test_gaps(self):
+        # BBB's latest close is from before its gap
+        [result] = self.returns(
+            (self.gapped, date(2020, 10, 5), date(2020, 11, 2))
+        )
+        self.assertAlmostEqual(
+            result,
+            self.expected(date(2020, 10, 5), date(2020, 10, 19), ["BBB"]),
+        )
+        closes, found = load_closes(["BBB"], [date(2020, 11, 2)])
+        self.assertEqual(found[0, 0], date(2020, 10, 19).toordinal())
+
+    def test_missing_prices(self):
+        # before the first price
+        results = self.returns(
+            (self.portfolio, date(2020, 9, 1), LAST), (self.single, None, LAST)
+        )
+        self.assertEqual(results, [None, None])
+
+    def test_queries(self):
+        # BBB has no close within two weeks of the end
+        end = date(2020, 11, 6)
+        periods = [
+            (self.portfolio, FIRST + timedelta(days=i), end) for i in range(10)
+        ]
+        # holdings, prices within windows and one more for the gaps
+        with self.assertNumQueries(3):
+            portfolio_returns(periods)
+        # all cached
+        with self.assertNumQueries(1):
+            portfolio_returns(periods)
+
+    def test_price_store(self):
+        periods = [
+            (self.portfolio, day, LAST)
+            for day in (date(2020, 10, 5), date(2020, 10, 26))
+        ]
+        expected = portfolio_returns(periods)
+        get_return_cache().clear()
+        with tempfile.TemporaryDirectory() as root:
+            with override_settings(PRICE_STORE_DIR=root):
+                self.assertEqual(portfolio_returns(periods), expected)
@@ -0,0 +1,131 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from stockspec.portfolio.models import Portfolio, Ticker, TickerPopularity
+from stockspec.portfolio.popularity import (
+    EPOCH,
+    add_log2,
+    ranking,
+    rebuild_popularity,
+    record_uses,
+    weight,
+)
+from stockspec.users.models import User
+
+SYMBOLS = ("AAA", "BBB", "CCC")
+
+
+def counts():
+    return dict(
+        TickerPopularity.objects.filter(portfolios__gt=0).values_list(
+            "ticker_id", "portfolios"
+        )
+    )
+
+
+class PopularityTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="user", email="user@x.io")
+        self.tickers = [Ticker.objects.create(symbol=s) for s in SYMBOLS]
+
+    def portfolio(self, *symbols):
+        return Portfolio.get_or_create_from_tickers(
+            self.user, [t for t in self.tickers if t.symbol in symbols]
+        )
+
+    def test_weights(self):
+        self.assertEqual(weight(EPOCH), 0)
+        with self.settings(TRENDING_HALF_LIFE=7):
+            self.assertEqual(weight(EPOCH + timedelta(days=14)), 2)
+        self.assertEqual(add_log2(None, 2), 2)
+        self.assertEqual(add_log2(3, 3), 4)
+        self.assertAlmostEqual(add_log2(1000, 0), 1000)
+
+    def test_counts(self):
+        portfolio = self.portfolio("AAA", "BBB")
+        self.portfolio("AAA")
+        self.assertEqual(counts(), {"AAA": 2, "BBB": 1})
+        self.assertEqual(ranking(10), ["AAA", "BBB"])
+
+        portfolio.tickers.remove(self.tickers[1])
+        portfolio.tickers.add(self.tickers[2])
+        self.assertEqual(counts(), {"AAA": 2, "CCC": 1})
+        # adding an existing link doesn't count it twice
+        portfolio.tickers.add(self.tickers[2])
+        self.assertEqual(counts(), {"AAA": 2, "CCC": 1})
+
+        # from the ticker side
+        self.tickers[0].portfolio_set.clear()
+        self.assertEqual(counts(), {"CCC": 1})
+        self.tickers[1].portfolio_set.add(portfolio)
+        self.assertEqual(counts(), {"BBB": 1, "CCC": 1})
+
+        portfolio.delete()
+        self.assertEqual(counts(), {})
+        self.assertEqual(ranking(10), [])
+
+    def test_trending(self):
+        record_uses({"AAA": 3}, EPOCH)
+        record_uses({"BBB": 1}, EPOCH + timedelta(days=7))
+        # AAA's uses are still worth more than BBB's single one
+        self.assertEqual(ranking(10, trending=True), ["AAA", "BBB"])
+        # until three half-lives
+        record_uses({"CCC": 1}, EPOCH + timedelta(days=21))
+        self.assertEqual(ranking(10, trending=True), ["CCC", "AAA", "BBB"])
+        self.assertEqual(ranking(10), ["AAA", "BBB", "CCC"])
+
+        # removed uses still trend
+        record_uses({"CCC": -1})
+        self.assertEqual(ranking(10), ["AAA", "BBB"])
+        self.assertEqual(ranking(1, trending=True), ["CCC"])
+
+    def test_rebuild(self):
+        self.portfolio("AAA", "BBB")
+        self.portfolio("BBB")
+        expected = counts()
+        TickerPopularity.objects.update(portfolios=7)
+        TickerPopularity.objects.create(ticker_id="CCC", portfolios=1)
+        self.assertEqual(rebuild_popularity(), 2)
+        self.assertEqual(counts(), expected)
+        self.assertEqual(ranking(10, trending=True)[0], "BBB")
+
+
+class TopTickersTests(TransactionTestCase):
+    """Cached rankings are dropped once portfolio changes commit"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username="user", email="user@x.io")
+        self.tickers = [Ticker.objects.create(symbol=s) for s in SYMBOLS]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def top(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [ticker["symbol"] for ticker in response.json()["results"]]
+
+    def test_top(self):
+        Portfolio.get_or_create_from_tickers(self.user, self.tickers[1:])
+        Portfolio.get_or_create_from_tickers(self.user, self.tickers[2:])
+        self.assertEqual(self.top("/api/tickers/top"), ["CCC", "BBB"])
+        # cached, one query for the tickers
+        with self.assertNumQueries(1):
+            self.top("/api/tickers/top")
+
+        Portfolio.get_or_create_from_tickers(self.user, self.tickers[:2])
+        Portfolio.get_or_create_from_tickers(self.user, self.tickers[1:2])
+        self.assertEqual(self.top("/api/tickers/top"), ["BBB", "CCC", "AAA"])
+
+    def test_trending(self):
+        record_uses({"AAA": 1}, timezone.now() - timedelta(days=30))
+        record_uses({"BBB": 1})
+        self.assertEqual(self.top("/api/tickers/trending"), ["BBB", "AAA"])
+        record_uses({"CCC": 2})
+        self.assertEqual(
+            self.top("/api/tickers/trending"), ["CCC", "BBB", "AAA"]
+        )
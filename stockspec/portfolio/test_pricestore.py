@@ -0,0 +1,104 @@
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from stockspec.portfolio.models import StockPrice, Ticker
+from stockspec.portfolio.performance import load_closes
+from stockspec.portfolio.pricestore import get_store
+
+DAY = date(2020, 11, 2)
+
+
+class PriceStoreTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.settings = override_settings(PRICE_STORE_DIR=self.root.name)
+        self.settings.enable()
+        self.store = get_store()
+        self.tickers = [
+            Ticker.objects.create(symbol=f"T{i}") for i in range(2)
+        ]
+        self.add_prices(self.tickers, range(0, 10, 2))
+        self.store.refresh()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.root.cleanup()
+
+    def add_prices(self, tickers, days):
+        """Written like the sink does, without refreshing the store"""
+        StockPrice.objects.bulk_create(
+            StockPrice(
+                ticker=ticker,
+                date=DAY + timedelta(days=day),
+                close_price=Decimal(100 + day) + Decimal("0.0001"),
+                volume=1,
+            )
+            for ticker in tickers
+            for day in days
+        )
+        Ticker.objects.filter(pk__in=[t.pk for t in tickers]).update(
+            last_updated=timezone.now()
+        )
+
+    def test_prices_at(self):
+        days = [DAY - timedelta(days=1), DAY, DAY + timedelta(days=5)]
+        closes, found = self.store.prices_at(["T0", "T1", "NONE"], days)
+        np.testing.assert_array_equal(closes[0], [np.nan, 100.0001, 104.0001])
+        self.assertEqual(found[1, 2], (DAY + timedelta(days=4)).toordinal())
+        self.assertTrue(np.isnan(closes[2]).all())
+
+    def test_refresh_appends(self):
+        self.add_prices(self.tickers[:1], [12])
+        self.assertEqual(self.store.stale(self.updated()), ["T0"])
+
+        # only the new price is read
+        with self.assertNumQueries(2):
+            changed = self.store.refresh()
+        self.assertEqual(changed, {"T0": 6})
+        self.assertEqual(self.store.stale(self.updated()), [])
+        self.assertEqual(self.store.series("T0")[1][-1], 1120001)
+
+    def test_refresh_rebuilds_edited(self):
+        StockPrice.objects.filter(ticker_id="T0", date=DAY).update(
+            close_price=50
+        )
+        self.assertEqual(self.store.refresh(), {"T0": 5})
+        self.assertEqual(self.store.series("T0")[1][0], 500000)
+        self.assertEqual(self.store.refresh(), {})
+        self.assertEqual(self.store.refresh(rebuild=True), {"T0": 5, "T1": 5})
+
+    def test_refresh_removes_deleted(self):
+        self.tickers[1].delete()
+        self.store.refresh()
+        self.assertNotIn("T1", self.store)
+
+    def test_stale_tickers_are_refreshed(self):
+        self.add_prices(self.tickers, [12])
+        # an edit through the model updates its ticker
+        price = StockPrice.objects.get(ticker_id="T1", date=DAY)
+        price.close_price = 50
+        price.save()
+
+        days = [DAY, DAY + timedelta(days=12)]
+        closes, _ = load_closes(["T0", "T1"], days)
+        np.testing.assert_array_equal(
+            closes, [[100.0001, 112.0001], [50, 112.0001]]
+        )
+        self.assertEqual(self.store.stale(self.updated()), [])
+
+    def test_same_as_price_table(self):
+        self.add_prices(self.tickers[1:], [12])
+        days = [DAY + timedelta(days=day) for day in range(-1, 20, 3)]
+        from_store = load_closes(["T0", "T1"], days)
+        with override_settings(PRICE_STORE_DIR=None):
+            from_table = load_closes(["T0", "T1"], days)
+        for store, table in zip(from_store, from_table):
+            np.testing.assert_array_equal(store, table)
+
+    def updated(self):
+        return dict(Ticker.objects.values_list("symbol", "last_updated"))
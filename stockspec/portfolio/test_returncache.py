@@ -0,0 +1,72 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.test import TransactionTestCase
+
+from stockspec.alphavantage import AlphaVantage
+from stockspec.portfolio.models import StockPrice, Ticker
+from stockspec.portfolio.returncache import get_return_cache
+
+START = date(2020, 11, 16)
+# Friday, its close is not in yet
+END = date(2020, 11, 20)
+
+
+class ReturnCacheTests(TransactionTestCase):
+    """Returns are dropped once the prices changing them are committed"""
+
+    def setUp(self):
+        self.cache = get_return_cache()
+        self.cache.clear()
+        self.ticker = Ticker.objects.create(symbol="AAA")
+        StockPrice.objects.bulk_create(
+            StockPrice(
+                ticker=self.ticker,
+                date=START + timedelta(days=i),
+                close_price=Decimal(100 + i),
+                volume=1,
+            )
+            for i in range(4)
+        )
+
+    def insert_prices(self, rows):
+        av = AlphaVantage(["k1"], api_url="http://localhost/query?")
+        av.insert_prices(
+            "AAA",
+            [
+                {"timestamp": day.isoformat(), "close": close, "volume": "1"}
+                for day, close in rows
+            ],
+        )
+
+    def assertReturn(self, start, end, expected, queries):
+        with self.assertNumQueries(queries):
+            result = self.ticker.return_for_period(start, end)
+        self.assertAlmostEqual(result, expected)
+
+    def test_open_returns(self):
+        # up to Thursday's close
+        self.assertReturn(START, END, 0.03, 1)
+        self.assertReturn(START, END, 0.03, 0)
+        # Friday's close is in
+        self.insert_prices([(END, "110")])
+        self.assertReturn(START, END, 0.10, 1)
+        # closed now, kept in the process
+        self.assertReturn(START, END, 0.10, 0)
+        self.assertIn(("AAA", START, END), self.cache.lru)
+
+    def test_closed_returns(self):
+        thursday = END - timedelta(days=1)
+        self.assertReturn(START, thursday, 0.03, 1)
+        self.assertIn(("AAA", START, thursday), self.cache.lru)
+        # new prices don't change it
+        self.insert_prices([(END, "110")])
+        self.assertReturn(START, thursday, 0.03, 0)
+
+    def test_edited_prices(self):
+        thursday = END - timedelta(days=1)
+        self.assertReturn(START, thursday, 0.03, 1)
+        price = StockPrice.objects.get(date=thursday)
+        price.close_price = Decimal(120)
+        price.save()
+        self.assertReturn(START, thursday, 0.20, 1)
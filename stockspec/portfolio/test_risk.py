@@ -0,0 +1,147 @@
+import math
+import statistics
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+
+import numpy as np
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from stockspec.portfolio.models import (
+    Portfolio,
+    StockPrice,
+    Ticker,
+    TickerCorrelation,
+    TickerRisk,
+)
+from stockspec.portfolio.risk import compute_risk
+from stockspec.users.models import User
+
+LAST = date(2020, 11, 20)
+SESSIONS = 80
+
+
+def sessions():
+    """Weekdays up to LAST, oldest first"""
+    days = []
+    day = LAST
+    while len(days) < SESSIONS:
+        if day.weekday() < 5:
+            days.append(day)
+        day -= timedelta(days=1)
+    return list(reversed(days))
+
+
+class RiskTests(TestCase):
+    """AAA moves twice as much as the benchmark, BBB on its own and CCC
+    has too short a history
+    """
+
+    def setUp(self):
+        cache.clear()
+        rnd = np.random.default_rng(0)
+        market = rnd.normal(0, 0.01, SESSIONS - 1)
+        returns = {
+            "SPY": market,
+            "AAA": 2 * market,
+            "BBB": rnd.normal(0, 0.02, SESSIONS - 1),
+        }
+        days = sessions()
+        self.closes = {}
+        for symbol, series in returns.items():
+            ticker = Ticker.objects.create(symbol=symbol)
+            closes = 100 * np.exp(np.concatenate([[0], np.cumsum(series)]))
+            self.closes[symbol] = [round(float(c), 4) for c in closes]
+            StockPrice.objects.bulk_create(
+                StockPrice(
+                    ticker=ticker,
+                    date=day,
+                    close_price=Decimal(str(close)),
+                    volume=1,
+                )
+                for day, close in zip(days, self.closes[symbol])
+            )
+        ccc = Ticker.objects.create(symbol="CCC")
+        StockPrice.objects.bulk_create(
+            StockPrice(ticker=ccc, date=day, close_price=Decimal(10), volume=1)
+            for day in days[-5:]
+        )
+
+        user = User.objects.create(username="user", email="user@x.io")
+        Portfolio.get_or_create_from_tickers(
+            user, list(Ticker.objects.filter(symbol__in=["AAA", "BBB"]))
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def volatility(self, symbol: str, window: int) -> float:
+        closes = self.closes[symbol][-window - 1 :]
+        returns = [math.log(closes[i + 1] / closes[i]) for i in range(window)]
+        return statistics.stdev(returns) * math.sqrt(252)
+
+    def test_compute_risk(self):
+        self.assertEqual(compute_risk("SPY", 10), (4, 2))
+        risks = {risk.ticker_id: risk for risk in TickerRisk.objects.all()}
+
+        aaa = risks["AAA"]
+        self.assertEqual(aaa.as_of, LAST)
+        self.assertEqual(aaa.benchmark, "SPY")
+        self.assertAlmostEqual(float(aaa.beta), 2, places=2)
+        self.assertAlmostEqual(float(aaa.correlation), 1, places=3)
+        self.assertAlmostEqual(
+            float(aaa.volatility_1m), self.volatility("AAA", 21), places=3
+        )
+        self.assertAlmostEqual(
+            float(aaa.volatility_3m), self.volatility("AAA", 63), places=3
+        )
+        self.assertLess(abs(float(risks["BBB"].correlation)), 0.5)
+        self.assertAlmostEqual(float(risks["SPY"].beta), 1, places=4)
+
+        # not enough returns
+        self.assertIsNone(risks["CCC"].volatility_1m)
+        self.assertIsNone(risks["CCC"].beta)
+
+        # between the portfolio's tickers
+        pairs = TickerCorrelation.objects.values_list("ticker_id", "other_id")
+        self.assertEqual(set(pairs), {("AAA", "BBB"), ("BBB", "AAA")})
+
+    def test_unknown_benchmark(self):
+        compute_risk("QQQ", 10)
+        aaa = TickerRisk.objects.get(ticker_id="AAA")
+        self.assertIsNone(aaa.beta)
+        self.assertIsNotNone(aaa.volatility_1m)
+
+    def test_command(self):
+        out = StringIO()
+        call_command("compute_risk", "-b", "SPY", stdout=out)
+        self.assertIn("risk of 4 tickers", out.getvalue())
+
+    def test_endpoint(self):
+        compute_risk("SPY", 10)
+        response = self.client.get("/api/tickers/AAA/risk")
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["symbol"], "AAA")
+        self.assertEqual([c["symbol"] for c in data["correlations"]], ["BBB"])
+
+        # cached, the ticker and its risk are still read for the key
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                self.client.get("/api/tickers/AAA/risk").json(), data
+            )
+        # until the next run
+        StockPrice.objects.filter(date=LAST).delete()
+        compute_risk("SPY", 10)
+        data = self.client.get("/api/tickers/AAA/risk").json()
+        self.assertEqual(data["as_of"], str(LAST - timedelta(days=1)))
+
+    def test_unknown_ticker(self):
+        compute_risk("SPY", 10)
+        # known, but without risk
+        TickerRisk.objects.filter(ticker_id="CCC").delete()
+        for symbol in ("DDD", "CCC"):
+            response = self.client.get(f"/api/tickers/{symbol}/risk")
+            self.assertEqual(response.status_code, 404)
@@ -0,0 +1,91 @@
+import math
+import statistics
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.test import TestCase
+
+from stockspec.portfolio.models import StockPrice, Ticker, TickerStats
+from stockspec.portfolio.stats import month_before, refresh_ticker_stats
+
+FIRST = date(2019, 11, 1)
+LATEST = date(2020, 11, 20)
+
+
+def close(day: date) -> Decimal:
+    """Up a point a day, down five once a week"""
+    days = (day - FIRST).days
+    return Decimal(100 + days - 6 * (days // 7))
+
+
+class TickerStatsTests(TestCase):
+    def setUp(self):
+        aaa, bbb = (Ticker.objects.create(symbol=s) for s in ("AAA", "BBB"))
+        days = (
+            FIRST + timedelta(days=i) for i in range((LATEST - FIRST).days + 1)
+        )
+        StockPrice.objects.bulk_create(
+            StockPrice(ticker=aaa, date=day, close_price=close(day), volume=1)
+            for day in days
+        )
+        # a few prices, up to another date
+        StockPrice.objects.bulk_create(
+            StockPrice(
+                ticker=bbb,
+                date=date(2020, 11, 10) + timedelta(days=i),
+                close_price=Decimal(10 + i),
+                volume=1,
+            )
+            for i in range(5)
+        )
+
+    def change(self, base: date) -> Decimal:
+        return ((close(LATEST) - close(base)) / close(base)).quantize(
+            Decimal("0.0001")
+        )
+
+    def test_month_before(self):
+        self.assertEqual(month_before(date(2020, 3, 31)), date(2020, 2, 29))
+        self.assertEqual(month_before(date(2020, 1, 15)), date(2019, 12, 15))
+
+    def test_refresh(self):
+        self.assertEqual(refresh_ticker_stats(), 2)
+        stats = TickerStats.objects.get(ticker_id="AAA")
+        self.assertEqual(stats.as_of, LATEST)
+        self.assertEqual(stats.change_1w, self.change(date(2020, 11, 13)))
+        self.assertEqual(stats.change_1m, self.change(date(2020, 10, 20)))
+        self.assertEqual(stats.change_ytd, self.change(date(2019, 12, 31)))
+
+        year = [close(LATEST - timedelta(days=i)) for i in range(52 * 7)]
+        self.assertEqual(stats.high_52w, max(year))
+        self.assertEqual(stats.low_52w, min(year))
+        returns = [
+            math.log(year[i] / year[i + 1]) for i in range(len(year) - 1)
+        ]
+        self.assertAlmostEqual(
+            float(stats.volatility),
+            statistics.stdev(returns) * math.sqrt(252),
+            places=4,
+        )
+
+        # too short a history
+        stats = TickerStats.objects.get(ticker_id="BBB")
+        self.assertEqual(stats.as_of, date(2020, 11, 14))
+        self.assertEqual(stats.change_1w, None)
+        self.assertEqual(stats.high_52w, Decimal(14))
+        self.assertEqual(stats.volatility, None)
+
+    def test_refresh_some(self):
+        refresh_ticker_stats(volatility=False)
+        self.assertIsNone(TickerStats.objects.get(ticker_id="AAA").volatility)
+        StockPrice.objects.create(
+            ticker_id="BBB",
+            date=date(2020, 11, 20),
+            close_price=Decimal(20),
+            volume=1,
+        )
+        self.assertEqual(refresh_ticker_stats(["BBB"]), 1)
+        self.assertEqual(TickerStats.objects.count(), 2)
+        stats = TickerStats.objects.get(ticker_id="BBB")
+        self.assertEqual(stats.as_of, LATEST)
+        self.assertEqual(stats.high_52w, Decimal(20))
@@ -0,0 +1,148 @@
+import gzip
+import json
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.test import APIClient
+
+from stockspec.portfolio.catalogue import CHANGES_MARGIN
+from stockspec.portfolio.models import StockPrice, Ticker
+from stockspec.users.models import User
+
+FIRST = date(2020, 11, 1)
+
+
+class APITestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="user", email="user@x.io")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+class PriceSeriesTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        ticker = Ticker.objects.create(symbol="AAA")
+        StockPrice.objects.bulk_create(
+            StockPrice(
+                ticker=ticker,
+                date=FIRST + timedelta(days=i),
+                close_price=Decimal(100 + i),
+                volume=i,
+            )
+            for i in range(30)
+        )
+
+    def series(self, **params):
+        response = self.client.get("/api/series/AAA", params)
+        self.assertEqual(response.status_code, 200)
+        return [price["time"] for price in response.json()]
+
+    def test_last_prices(self):
+        days = self.series(limit=5)
+        self.assertEqual(days[0], "2020-11-26")
+        self.assertEqual(days[-1], "2020-11-30")
+
+    def test_pages(self):
+        # the oldest date of a page is the cursor to the previous one
+        pages = []
+        before = None
+        while True:
+            params = {"limit": 7, "from": "2020-11-03", "to": "2020-11-20"}
+            if before is not None:
+                params["before"] = before
+            page = self.series(**params)
+            if len(page) == 0:
+                break
+            pages.insert(0, page)
+            before = page[0]
+
+        self.assertEqual([len(page) for page in pages], [4, 7, 7])
+        days = [day for page in pages for day in page]
+        self.assertEqual(days[0], "2020-11-03")
+        self.assertEqual(days[-1], "2020-11-20")
+        self.assertEqual(days, sorted(set(days)))
+
+    def test_queries(self):
+        # the ticker, then the prices
+        with self.assertNumQueries(2):
+            self.client.get("/api/series/AAA", {"limit": 10})
+
+    def test_invalid_params(self):
+        for params in ({"limit": 0}, {"limit": 5001}, {"before": "later"}):
+            response = self.client.get("/api/series/AAA", params)
+            self.assertEqual(response.status_code, 400)
+
+    def test_unknown_ticker(self):
+        response = self.client.get("/api/series/BBB")
+        self.assertEqual(response.status_code, 404)
+
+
+class CatalogueTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        for symbol in ("AAA", "BBB"):
+            Ticker.objects.create(symbol=symbol)
+
+    def symbols(self, content: bytes):
+        return [ticker["symbol"] for ticker in json.loads(content)]
+
+    def test_catalogue(self):
+        response = self.client.get("/api/tickers")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.symbols(response.content), ["AAA", "BBB"])
+        self.assertNotIn("Content-Encoding", response)
+        self.assertIn("Accept-Encoding", response["Vary"])
+
+        response = self.client.get(
+            "/api/tickers", HTTP_ACCEPT_ENCODING="br, gzip;q=0.8"
+        )
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(
+            self.symbols(gzip.decompress(response.content)), ["AAA", "BBB"]
+        )
+
+    def test_not_modified(self):
+        etag = self.client.get("/api/tickers")["ETag"]
+        response = self.client.get("/api/tickers", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(response.content, b"")
+
+        # published again once tickers change
+        Ticker.objects.create(symbol="CCC")
+        response = self.client.get("/api/tickers", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(len(self.symbols(response.content)), 3)
+        Ticker.objects.filter(symbol="CCC").delete()
+        self.assertNotEqual(
+            self.client.get("/api/tickers")["ETag"], response["ETag"]
+        )
+
+    def test_changes(self):
+        before = timezone.now() - CHANGES_MARGIN
+        Ticker.objects.filter(symbol="AAA").update(
+            last_updated=before - timedelta(minutes=1)
+        )
+        response = self.client.get("/api/tickers/changes", {"since": before})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(
+            [ticker["symbol"] for ticker in data["tickers"]], ["BBB"]
+        )
+        # a margin before now, late commits are sent again
+        self.assertLessEqual(
+            parse_datetime(data["until"]), timezone.now() - CHANGES_MARGIN
+        )
+
+    def test_changes_params(self):
+        for params in ({}, {"since": "yesterday"}):
+            response = self.client.get("/api/tickers/changes", params)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("since", response.json())
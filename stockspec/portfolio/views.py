@@ -1,15 +1,50 @@
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils import timezone
+from django.utils.http import http_date
 
-from rest_framework.generics import ListCreateAPIView, ListAPIView
+from rest_framework.generics import (
+    ListCreateAPIView,
+    ListAPIView,
+    RetrieveAPIView,
+)
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from stockspec.portfolio.models import Portfolio, Ticker, StockPrice
+from stockspec.portfolio.models import (
+    Portfolio,
+    Ticker,
+    TickerRisk,
+    StockPrice,
+)
+from stockspec.portfolio.catalogue import (
+    CHANGES_MARGIN,
+    changed_since,
+    get_catalogue,
+)
+from stockspec.portfolio.popularity import top_tickers
+from stockspec.portfolio.risk import cache_key
 from stockspec.portfolio.serializers import (
     PortfolioSerialier,
     TickerSerializer,
+    TickerRiskSerializer,
     StockPriceSerializer,
+    SeriesParamsSerializer,
+    ChangesParamsSerializer,
 )
 
+ACCEPTS_GZIP = re.compile(r"\bgzip\b")
+
 
 class PortfolioList(ListCreateAPIView):
     permission_classes = [IsAuthenticated]
@@ -18,23 +53,111 @@ class PortfolioList(ListCreateAPIView):
     def get_queryset(self):
         """return portfolios owned by current user"""
         user = self.request.user
-        return Portfolio.objects.filter(user=user)
+        return Portfolio.listed().filter(user=user)
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
 
-class TickerList(ListAPIView):
+class TickerList(APIView):
     permission_classes = [IsAuthenticated]
-    serializer_class = TickerSerializer
-    pagination_class = None
-    queryset = Ticker.objects.all()
+
+    def get(self, request):
+        """Every ticker, serialized and gzipped once per change of the
+        tickers (see publish_catalogue). Clients with an up to date copy
+        get a 304.
+        """
+        catalogue = get_catalogue()
+        response = get_conditional_response(
+            request,
+            etag=catalogue.etag,
+            last_modified=(
+                int(catalogue.last_modified.timestamp())
+                if catalogue.last_modified
+                else None
+            ),
+        )
+        if response is None:
+            encoding = request.META.get("HTTP_ACCEPT_ENCODING", "")
+            if ACCEPTS_GZIP.search(encoding):
+                response = HttpResponse(
+                    catalogue.compressed, content_type="application/json"
+                )
+                response["Content-Encoding"] = "gzip"
+            else:
+                response = HttpResponse(
+                    catalogue.content, content_type="application/json"
+                )
+        response["ETag"] = catalogue.etag
+        if catalogue.last_modified is not None:
+            response["Last-Modified"] = http_date(
+                catalogue.last_modified.timestamp()
+            )
+        # always revalidated, with the etag
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ["Accept-Encoding"])
+        return response
+
+
+class TickerChanges(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        """Tickers that changed since a time, and the time to ask for the
+        next changes with
+        """
+        params = ChangesParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        # changes committed late are sent again next time rather than lost
+        until = timezone.now() - CHANGES_MARGIN
+        tickers = changed_since(params.validated_data["since"])
+        return Response(
+            {
+                "until": until,
+                "tickers": TickerSerializer(tickers, many=True).data,
+            }
+        )
 
 
 class TopTickersList(ListAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = TickerSerializer
-    queryset = Ticker.top_tickers()
+    count = 10
+    trending = False
+
+    def get_queryset(self):
+        """the tickers used in the most portfolios, or trending ones"""
+        symbols = top_tickers(self.count, trending=self.trending)
+        tickers = Ticker.objects.select_related("stats").in_bulk(symbols)
+        return [tickers[symbol] for symbol in symbols if symbol in tickers]
+
+
+class TrendingTickersList(TopTickersList):
+    trending = True
+
+
+class TickerRiskDetail(RetrieveAPIView):
+    permission_classes = [IsAuthenticated]
+    serializer_class = TickerRiskSerializer
+    queryset = TickerRisk.objects.select_related("ticker__stats")
+    lookup_field = "symbol"
+
+    def retrieve(self, request, *args, **kwargs):
+        """Risk of a ticker, cached until the next analytics run
+        (see compute_risk), stats refresh or RISK_CACHE_TIMEOUT
+        """
+        risk = self.get_object()
+        key = cache_key(risk)
+        data = cache.get(key)
+        if data is None:
+            data = self.get_serializer(risk).data
+            cache.set(key, data, settings.RISK_CACHE_TIMEOUT)
+        return Response(data)
+
+    def get_object(self):
+        return get_object_or_404(
+            self.get_queryset(), ticker_id=self.kwargs[self.lookup_field]
+        )
 
 
 class PriceSeries(ListAPIView):
@@ -44,13 +167,22 @@ class PriceSeries(ListAPIView):
     lookup_field = "symbol"
 
     def get_queryset(self):
-        """Returns a series of the last 100 prices for a symbol"""
+        """Returns a series of the last prices for a symbol, 100 unless
+        given a limit, within from/to and before a date
+        """
         assert self.lookup_field in self.kwargs, (
             "Expected %s to be called with a URL keyword argument named '%s'."
             % (self.__class__.__name__, self.lookup_field)
         )
+        params = SeriesParamsSerializer(data=self.request.query_params)
+        params.is_valid(raise_exception=True)
         # check symbol
         symbol = self.kwargs[self.lookup_field]
         get_object_or_404(Ticker, symbol=symbol)
-        return StockPrice.get_series(symbol, 100)
-
+        return StockPrice.get_series(
+            symbol,
+            params.validated_data["limit"],
+            start=params.validated_data.get("from"),
+            end=params.validated_data.get("to"),
+            before=params.validated_data.get("before"),
+        )
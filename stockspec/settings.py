@@ -45,6 +45,43 @@ ALPHAVANTAGE_KEY = os.environ["AV_KEY"]
 ALPHAVANTAGE_KEY_POOL = os.environ.get("AV_KEY_POOL", ALPHAVANTAGE_KEY).split(
     ","
 )
+ALPHAVANTAGE_API_URL = os.environ.get(
+    "AV_API_URL", "https://www.alphavantage.co/query?"
+)
+# requests per minute allowed for each key. Premium keys can be given
+# their own quota with AV_KEY_QUOTAS='key1:75,key2:150'
+ALPHAVANTAGE_RATE_LIMIT = int(os.environ.get("AV_RATE_LIMIT", "5"))
+ALPHAVANTAGE_KEY_QUOTAS = {
+    key: int(quota)
+    for key, quota in (
+        item.split(":")
+        for item in os.environ.get("AV_KEY_QUOTAS", "").split(",")
+        if item
+    )
+}
+# on-disk cache of api responses, modes are cache, record and replay
+ALPHAVANTAGE_CACHE_DIR = os.environ.get("AV_CACHE_DIR")
+ALPHAVANTAGE_CACHE_MODE = os.environ.get("AV_CACHE_MODE", "cache")
+
+# memory-mapped copy of the price table, disabled when empty
+PRICE_STORE_DIR = os.environ.get("PRICE_STORE_DIR")
+
+# risk analytics: betas are against the benchmark ticker, correlations
+# are kept for the most used tickers
+RISK_BENCHMARK = os.environ.get("RISK_BENCHMARK", "SPY")
+RISK_CORRELATION_TICKERS = int(
+    os.environ.get("RISK_CORRELATION_TICKERS", "50")
+)
+# seconds the risk of a ticker is served from the default cache
+RISK_CACHE_TIMEOUT = int(os.environ.get("RISK_CACHE_TIMEOUT", "3600"))
+
+# days after which a use of a ticker counts half as much for trending
+TRENDING_HALF_LIFE = float(os.environ.get("TRENDING_HALF_LIFE", "7"))
+# seconds top tickers are served from the default cache, new portfolios
+# also invalidate them
+POPULARITY_CACHE_TIMEOUT = int(
+    os.environ.get("POPULARITY_CACHE_TIMEOUT", "60")
+)
 
 
 # Application definition
@@ -64,6 +101,7 @@ INSTALLED_APPS = [
     "stockspec.users",
     "stockspec.portfolio",
     "stockspec.bet",
+    "stockspec.ingestion",
 ]
 
 MIDDLEWARE = [
@@ -132,10 +170,47 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # on disk, settlement workers are other processes
+        "TEST": {"NAME": BASE_DIR / "test_db.sqlite3"},
     }
 }
 
 
+# Caches
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+# "returns" keeps period returns, it must be shared by every process
+# (memcached, database...) for new prices to invalidate them everywhere.
+# Without one only returns that can't change are kept, in each process.
+CACHES = {
+    # shared by every process for the ingestion to publish the catalogue
+    "default": {
+        "BACKEND": os.environ.get(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.environ.get("CACHE_LOCATION", ""),
+    },
+    # open returns are only dropped everywhere when it is shared
+    "returns": {
+        "BACKEND": os.environ.get(
+            "RETURNS_CACHE_BACKEND",
+            "django.core.cache.backends.locmem.LocMemCache",
+        ),
+        "LOCATION": os.environ.get("RETURNS_CACHE_LOCATION", "returns"),
+        "TIMEOUT": 7 * 24 * 3600,
+        "OPTIONS": {
+            "MAX_ENTRIES": int(
+                os.environ.get("RETURNS_CACHE_ENTRIES", "100000")
+            ),
+        },
+    },
+}
+# in-process LRU in front of the returns cache, in entries
+RETURNS_CACHE_SIZE = int(os.environ.get("RETURNS_CACHE_SIZE", "100000"))
+# seconds open returns are kept, how late a process that doesn't share
+# the returns cache with the ingestion sees new prices
+RETURNS_OPEN_TIMEOUT = int(os.environ.get("RETURNS_OPEN_TIMEOUT", "300"))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
 AUTH_PASSWORD_VALIDATORS = [
@@ -1,6 +1,177 @@
-from django.test import TestCase
+import io
+import tempfile
+import threading
+
+import requests
+
+from django.test import TestCase, TransactionTestCase
+
+from stockspec.alphavantage import AlphaVantage
+from stockspec.exceptions import APIRateLimited
+from stockspec.ingestion.cache import ResponseCache
+from stockspec.ingestion.fakeapi import COMPACT_SIZE, FakeAlphaVantageServer
+from stockspec.ingestion.models import IngestionRun
+from stockspec.portfolio.models import StockPrice
+
+HEADER = b"timestamp,open,high,low,close,adjusted_close,volume\r\n"
+ROW = b"2020-11-20,117.19,117.35,116.81,117.34,117.34,9003489\r\n"
+NOTE = b'{"Note": "Thank you for using Alpha Vantage!"}'
+# plenty of requests per minute, tests don't wait for tokens
+QUOTAS = {"k1": 6000, "k2": 6000}
+
+
+def fake_server(test, **kwargs) -> FakeAlphaVantageServer:
+    """Serve the fake api for the duration of a test"""
+    server = FakeAlphaVantageServer(("127.0.0.1", 0), **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    test.addCleanup(server.server_close)
+    test.addCleanup(server.shutdown)
+    return server
+
+
+def fake_api(test, api_url: str = None, **kwargs) -> AlphaVantage:
+    """A client of the fake api retrying failed symbols at once"""
+    api_url = api_url or fake_server(test, **kwargs).url
+    av = AlphaVantage(list(QUOTAS), quotas=QUOTAS, api_url=api_url)
+    av.BACKOFF_BASE = 0
+    av.MAX_ATTEMPTS = 2
+    return av
+
+
+def response(content: bytes) -> requests.Response:
+    """A response streaming content"""
+    res = requests.Response()
+    res.status_code = 200
+    res.raw = io.BytesIO(content)
+    return res
 
 
 class AlphaVantageTests(TestCase):
     def test_fetch(self):
         self.assertIs(True, True)
+
+    def test_check_payload(self):
+        av = AlphaVantage(["k1"], api_url="http://localhost/query?")
+        for throttled in (b"", b"\r\n", NOTE):
+            with self.assertRaises(APIRateLimited):
+                av.check_payload("IBM", throttled)
+        # prices, or none for a delisted symbol
+        av.check_payload("IBM", HEADER + ROW)
+        av.check_payload("IBM", HEADER)
+
+    def test_parse_stream(self):
+        av = AlphaVantage(["k1"], api_url="http://localhost/query?")
+        av.STREAM_CHUNK_SIZE = 16  # rows span chunks
+        rows = list(av.parse_stream("IBM", response(HEADER + ROW * 3)))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]["timestamp"], "2020-11-20")
+        self.assertEqual(rows[0]["close"], "117.34")
+
+    def test_parse_stream_without_prices(self):
+        av = AlphaVantage(["k1"], api_url="http://localhost/query?")
+        # a delisted symbol, or an unknown one
+        error = b'{"Error Message": "Invalid API call."}'
+        for content in (HEADER, error):
+            self.assertEqual(
+                list(av.parse_stream("IBM", response(content))), []
+            )
+
+    def test_parse_stream_throttled(self):
+        av = AlphaVantage(["k1"], api_url="http://localhost/query?")
+        for throttled in (b"", b"\r\n", NOTE):
+            with self.assertRaises(APIRateLimited):
+                av.parse_stream("IBM", response(throttled))
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.cache = ResponseCache(self.root.name)
+        self.params = {"function": "TIME_SERIES_DAILY", "symbol": "IBM"}
+
+    def tearDown(self):
+        self.root.cleanup()
+
+    def test_throttled_responses_are_not_stored(self):
+        for throttled in (b"", b"\r\n", NOTE):
+            self.cache.put_content(self.params, throttled)
+            self.assertIsNone(self.cache.get(self.params))
+
+    def test_responses_are_stored(self):
+        for content in (HEADER + ROW, HEADER):
+            self.cache.put_content(self.params, content)
+            self.assertEqual(self.cache.get(self.params).content, content)
+
+    def requests(self, av: AlphaVantage) -> int:
+        return sum(h.requests for h in av.keys.health.values())
+
+    def test_cached_responses_are_reused(self):
+        av = fake_api(self)
+        av.cache = self.cache
+        self.assertEqual(av.fetch_symbol("AAA"), COMPACT_SIZE)
+        self.assertEqual(av.fetch_symbol("AAA"), COMPACT_SIZE)
+        self.assertEqual(self.requests(av), 1)
+        # stored apart from the compact one
+        av.fetch_symbol("AAA", outputsize="full")
+        self.assertEqual(self.requests(av), 2)
+
+    def test_record_and_replay(self):
+        recorder = fake_api(self)
+        recorder.cache = ResponseCache(self.root.name, ResponseCache.RECORD)
+        recorder.fetch_symbol("AAA")
+        recorder.fetch_symbol("AAA")
+        self.assertEqual(self.requests(recorder), 2)
+
+        # nothing listens there, responses come from the recording
+        player = fake_api(self, api_url="http://127.0.0.1:9/query?")
+        player.cache = ResponseCache(self.root.name, ResponseCache.REPLAY)
+        self.assertEqual(player.fetch_symbol("AAA"), COMPACT_SIZE)
+        with self.assertRaisesMessage(Exception, "request failed"):
+            player.fetch_symbol("BBB")
+        self.assertEqual(self.requests(player), 0)
+
+
+class ImportSymbolsTests(TransactionTestCase):
+    """Symbols are fetched by a worker per key, their prices written by
+    the sink from the workers' own connections
+    """
+
+    symbols = ["AAA", "BBB", "CCC"]
+
+    def test_import(self):
+        av = fake_api(self)
+        run = IngestionRun.start(
+            "test", dict.fromkeys(self.symbols, "compact")
+        )
+        stats = av.import_symbols(self.symbols, run=run)
+
+        self.assertEqual(stats["symbols"], 3)
+        self.assertEqual(stats["inserted"], 3 * COMPACT_SIZE)
+        for symbol in self.symbols:
+            prices = StockPrice.objects.filter(ticker_id=symbol)
+            self.assertEqual(prices.count(), COMPACT_SIZE)
+        self.assertEqual(run.counts(), {"done": 3})
+        requests = sum(h.requests for h in av.keys.health.values())
+        self.assertEqual(requests, 3)
+
+    def test_import_again(self):
+        av = fake_api(self)
+        av.import_symbols(self.symbols)
+        stats = av.import_symbols(self.symbols)
+        self.assertEqual(stats["symbols"], 3)
+        self.assertEqual(stats["inserted"], 0)
+
+    def test_failed_symbols(self):
+        # nothing listens there
+        av = fake_api(self, api_url="http://127.0.0.1:9/query?")
+        run = IngestionRun.start(
+            "test", dict.fromkeys(self.symbols, "compact")
+        )
+        stats = av.import_symbols(self.symbols, run=run)
+
+        self.assertEqual(stats["symbols"], 0)
+        self.assertEqual(stats["failed"], 3)
+        self.assertEqual(run.counts(), {"failed": 3})
+        # every symbol was tried MAX_ATTEMPTS times
+        requests = sum(h.requests for h in av.keys.health.values())
+        self.assertEqual(requests, 6)
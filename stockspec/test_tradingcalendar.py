@@ -0,0 +1,121 @@
+from datetime import date, datetime, time
+
+import pytz
+from django.test import SimpleTestCase
+
+from stockspec.tradingcalendar import (
+    NYSE,
+    TradingCalendar,
+    calendar_for,
+    governing_sessions,
+    no_holidays,
+    us_market_holidays,
+)
+
+NEW_YORK = pytz.timezone("America/New_York")
+# Thanksgiving, on a Thursday
+THANKSGIVING = date(2020, 11, 26)
+
+
+def new_york(*args) -> datetime:
+    return NEW_YORK.localize(datetime(*args))
+
+
+class HolidaysTests(SimpleTestCase):
+    def test_holidays(self):
+        holidays = us_market_holidays(2020)
+        self.assertIn(THANKSGIVING, holidays)
+        self.assertIn(date(2020, 4, 10), holidays)  # Good Friday
+        # Independence Day on a Saturday
+        self.assertIn(date(2020, 7, 3), holidays)
+        self.assertEqual(len(holidays), 9)
+
+    def test_new_year_on_saturday(self):
+        self.assertNotIn(date(2021, 12, 31), us_market_holidays(2022))
+        self.assertNotIn(date(2021, 12, 31), us_market_holidays(2021))
+        self.assertIn(date(2022, 6, 20), us_market_holidays(2022))
+
+
+class SessionsTests(SimpleTestCase):
+    def test_dates(self):
+        # a date stands for its whole day
+        self.assertEqual(
+            NYSE.session_at(date(2020, 11, 25)), date(2020, 11, 25)
+        )
+        self.assertEqual(NYSE.session_at(THANKSGIVING), date(2020, 11, 25))
+        # the weekend, after a session
+        self.assertEqual(
+            NYSE.session_at(date(2020, 11, 29)), date(2020, 11, 27)
+        )
+        # Good Friday and the weekend after it
+        self.assertEqual(NYSE.session_at(date(2020, 4, 12)), date(2020, 4, 9))
+
+    def test_instants(self):
+        # before the close, the previous session still governs
+        friday = date(2020, 11, 27)
+        self.assertEqual(
+            NYSE.session_at(new_york(2020, 11, 27, 12)), date(2020, 11, 25)
+        )
+        self.assertEqual(NYSE.session_at(new_york(2020, 11, 27, 16)), friday)
+        self.assertEqual(NYSE.session_at(new_york(2020, 11, 28, 10)), friday)
+        self.assertEqual(NYSE.session_at(new_york(2020, 11, 30, 9)), friday)
+        # naive instants are in the default timezone, UTC
+        self.assertEqual(NYSE.session_at(datetime(2020, 11, 27, 21)), friday)
+        self.assertEqual(
+            NYSE.session_at(datetime(2020, 11, 27, 20, 59)), date(2020, 11, 25)
+        )
+
+    def test_sessions_between(self):
+        self.assertEqual(
+            NYSE.sessions_between(date(2020, 11, 20), date(2020, 11, 30)), 5
+        )
+        self.assertEqual(
+            NYSE.sessions_between(THANKSGIVING, date(2020, 11, 29)), 1
+        )
+        self.assertEqual(NYSE.sessions_between(THANKSGIVING, THANKSGIVING), 0)
+
+    def test_last_closed_session(self):
+        self.assertEqual(
+            NYSE.last_closed_session(new_york(2020, 11, 26, 17)),
+            date(2020, 11, 25),
+        )
+        self.assertEqual(
+            NYSE.next_close(new_york(2020, 11, 25, 16)),
+            new_york(2020, 11, 27, 16),
+        )
+
+
+class GoverningSessionsTests(SimpleTestCase):
+    def setUp(self):
+        self.tokyo = TradingCalendar(
+            "TSE", "Asia/Tokyo", time(16, 0), no_holidays
+        )
+
+    def test_many_calendars(self):
+        values = [
+            # 17:00 in Tokyo, 03:00 in New York
+            datetime(2020, 11, 26, 8, tzinfo=pytz.utc),
+            THANKSGIVING,
+            date(2020, 11, 28),
+        ]
+        sessions = governing_sessions([NYSE, self.tokyo, NYSE], values)
+        self.assertEqual(sessions.shape, (3, 3))
+        self.assertEqual(
+            [[date.fromordinal(int(s)) for s in row] for row in sessions],
+            [
+                [date(2020, 11, 25), date(2020, 11, 25), date(2020, 11, 27)],
+                [THANKSGIVING, THANKSGIVING, date(2020, 11, 27)],
+                [date(2020, 11, 25), date(2020, 11, 25), date(2020, 11, 27)],
+            ],
+        )
+
+    def test_no_values(self):
+        self.assertEqual(governing_sessions([NYSE], []).shape, (1, 0))
+
+    def test_calendar_for(self):
+        self.assertIs(calendar_for("NASDAQ", "US/Eastern"), NYSE)
+        self.assertIs(calendar_for(None, "UTC"), NYSE)
+        tokyo = calendar_for("TSE", "Asia/Tokyo")
+        self.assertIsNot(tokyo, NYSE)
+        self.assertIs(calendar_for("TSE", "Asia/Tokyo"), tokyo)
+        self.assertEqual(tokyo.session_at(THANKSGIVING), THANKSGIVING)
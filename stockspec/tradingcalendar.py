@@ -0,0 +1,264 @@
+"""Trading sessions calendar, used to know which daily closes to expect."""
+import threading
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import FrozenSet, Sequence, Tuple
+
+import numpy as np
+import pytz
+from django.conf import settings
+from django.utils import timezone
+
+MONDAY, THURSDAY, FRIDAY, SATURDAY, SUNDAY = 0, 3, 4, 5, 6
+
+
+def easter(year: int) -> date:
+    """Gregorian easter sunday (anonymous algorithm)"""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def nth_weekday(year: int, month: int, weekday: int, n: int) -> date:
+    """nth weekday of a month, n=-1 for the last one"""
+    if n > 0:
+        first = date(year, month, 1)
+        offset = (weekday - first.weekday()) % 7
+        return first + timedelta(days=offset + 7 * (n - 1))
+
+    last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def observed(day: date) -> date:
+    """Holidays falling on a weekend are observed on the closest weekday"""
+    if day.weekday() == SATURDAY:
+        return day - timedelta(days=1)
+    if day.weekday() == SUNDAY:
+        return day + timedelta(days=1)
+    return day
+
+
+@lru_cache(maxsize=None)
+def us_market_holidays(year: int) -> FrozenSet[date]:
+    """Regular NYSE/NASDAQ holidays for a year"""
+    holidays = {
+        nth_weekday(year, 1, MONDAY, 3),  # Martin Luther King Jr. Day
+        nth_weekday(year, 2, MONDAY, 3),  # Washington's Birthday
+        easter(year) - timedelta(days=2),  # Good Friday
+        nth_weekday(year, 5, MONDAY, -1),  # Memorial Day
+        observed(date(year, 7, 4)),  # Independence Day
+        nth_weekday(year, 9, MONDAY, 1),  # Labor Day
+        nth_weekday(year, 11, THURSDAY, 4),  # Thanksgiving Day
+        observed(date(year, 12, 25)),  # Christmas
+    }
+    # the exchange stays open on Dec 31st when new year is on a saturday
+    if date(year, 1, 1).weekday() != SATURDAY:
+        holidays.add(observed(date(year, 1, 1)))
+    if year >= 2022:
+        holidays.add(observed(date(year, 6, 19)))  # Juneteenth
+    return frozenset(holidays)
+
+
+def no_holidays(year: int) -> FrozenSet[date]:
+    return frozenset()
+
+
+def to_seconds(instant: datetime) -> int:
+    """Seconds since epoch, naive datetimes are in the default timezone"""
+    if timezone.is_naive(instant):
+        instant = timezone.make_aware(instant)
+    return int(instant.timestamp())
+
+
+class TradingCalendar:
+    """Trading sessions of an exchange, closing at `close` local time.
+
+    Sessions are indexed once as sorted arrays of dates and closes,
+    extended when a lookup falls out of them, so instants and dates are
+    mapped to their session with a binary search, many at once.
+    """
+
+    # years indexed at first
+    FIRST_YEAR = 1990
+    YEARS_AHEAD = 1
+
+    def __init__(
+        self, name: str, tz: str, close: time, holidays=us_market_holidays
+    ):
+        self.name = name
+        self.tz = pytz.timezone(tz)
+        self.close = close
+        self.holidays = holidays
+
+        self.lock = threading.Lock()
+        self.years = None  # (first, last) years indexed
+        self.ordinals = None  # session dates, as ordinals
+        self.closes = None  # session closes, in seconds since epoch
+
+    def __str__(self):
+        return self.name
+
+    def is_session(self, day: date) -> bool:
+        return day.weekday() < SATURDAY and day not in self.holidays(day.year)
+
+    def previous_session(self, day: date) -> date:
+        """The last session strictly before day"""
+        day -= timedelta(days=1)
+        while not self.is_session(day):
+            day -= timedelta(days=1)
+        return day
+
+    def next_session(self, day: date) -> date:
+        """The first session strictly after day"""
+        day += timedelta(days=1)
+        while not self.is_session(day):
+            day += timedelta(days=1)
+        return day
+
+    def session_close(self, day: date) -> datetime:
+        """Aware datetime of a session's close"""
+        return self.tz.localize(datetime.combine(day, self.close))
+
+    def last_closed_session(self, now: datetime = None) -> date:
+        """The most recent session whose close has passed"""
+        local = (now or timezone.now()).astimezone(self.tz)
+        day = local.date()
+        if self.is_session(day) and local.time() >= self.close:
+            return day
+        return self.previous_session(day)
+
+    def next_close(self, after: datetime) -> datetime:
+        """The first session close strictly after a datetime"""
+        day = after.astimezone(self.tz).date()
+        if self.is_session(day) and self.session_close(day) > after:
+            return self.session_close(day)
+        return self.session_close(self.next_session(day))
+
+    def sessions_between(self, start: date, end: date) -> int:
+        """Number of sessions after start, up to and including end"""
+        if end <= start:
+            return 0
+        ordinals, _ = self.index(start.year, end.year)
+        bounds = np.searchsorted(
+            ordinals, [start.toordinal(), end.toordinal()], side="right"
+        )
+        return int(bounds[1] - bounds[0])
+
+    def index(self, first: int, last: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Session dates and closes of years first to last at least"""
+        with self.lock:
+            years = self.years or (
+                self.FIRST_YEAR,
+                timezone.now().year + self.YEARS_AHEAD,
+            )
+            first, last = min(first, years[0]), max(last, years[1])
+            if self.years != (first, last):
+                day, end = date(first, 1, 1), date(last, 12, 31)
+                sessions = [
+                    day + timedelta(days=offset)
+                    for offset in range((end - day).days + 1)
+                    if self.is_session(day + timedelta(days=offset))
+                ]
+                self.ordinals = np.array(
+                    [session.toordinal() for session in sessions],
+                    dtype=np.int64,
+                )
+                self.closes = np.array(
+                    [to_seconds(self.session_close(s)) for s in sessions],
+                    dtype=np.int64,
+                )
+                self.years = (first, last)
+            return self.ordinals, self.closes
+
+    def sessions_at(self, seconds: np.ndarray) -> np.ndarray:
+        """Governing session of instants given in seconds since epoch,
+        the latest one closed at or before each, as date ordinals
+        """
+        seconds = np.asarray(seconds, dtype=np.int64)
+        if seconds.size == 0:
+            return np.empty(0, dtype=np.int64)
+        # a year before the earliest, the session may be in the last one
+        first = datetime.utcfromtimestamp(int(seconds.min())).year - 1
+        last = datetime.utcfromtimestamp(int(seconds.max())).year + 1
+        ordinals, closes = self.index(first, last)
+        return ordinals[np.searchsorted(closes, seconds, side="right") - 1]
+
+    def sessions_on(self, days: np.ndarray) -> np.ndarray:
+        """Latest session on or before dates given as ordinals"""
+        days = np.asarray(days, dtype=np.int64)
+        if days.size == 0:
+            return np.empty(0, dtype=np.int64)
+        first = date.fromordinal(int(days.min())).year - 1
+        last = date.fromordinal(int(days.max())).year
+        ordinals, _ = self.index(first, last)
+        return ordinals[np.searchsorted(ordinals, days, side="right") - 1]
+
+    def session_at(self, value) -> date:
+        """Governing session of an instant, see sessions_at. A date
+        stands for its whole day: the latest session on or before it.
+        """
+        return date.fromordinal(int(governing_sessions([self], [value])[0, 0]))
+
+
+NYSE = TradingCalendar("NYSE", "America/New_York", time(16, 0))
+
+# exchanges (as named by the OVERVIEW endpoint) sharing NYSE sessions
+EXCHANGES = {
+    name: NYSE
+    for name in ("NYSE", "NASDAQ", "AMEX", "NYSE ARCA", "NYSE MKT", "BATS")
+}
+
+
+@lru_cache(maxsize=None)
+def calendar_for(exchange: str = None, tz: str = None) -> TradingCalendar:
+    """Calendar of a ticker from its exchange and timezone. Tickers of
+    other exchanges trade on weekdays until 16:00 in their timezone, the
+    ones without a timezone of their own on NYSE.
+    """
+    if exchange in EXCHANGES:
+        return EXCHANGES[exchange]
+    if tz is None or tz == settings.TIME_ZONE:
+        return NYSE
+    return TradingCalendar(exchange or tz, tz, time(16, 0), no_holidays)
+
+
+def governing_sessions(
+    calendars: Sequence[TradingCalendar], values: Sequence
+) -> np.ndarray:
+    """Governing session of datetimes or dates for many calendars, as a
+    (len(calendars), len(values)) array of date ordinals. Values are
+    converted once, each calendar is searched once for all of them.
+    """
+    instant = np.array([isinstance(value, datetime) for value in values])
+    seconds = np.array(
+        [to_seconds(value) for value in values if isinstance(value, datetime)],
+        dtype=np.int64,
+    )
+    days = np.array(
+        [
+            value.toordinal()
+            for value in values
+            if not isinstance(value, datetime)
+        ],
+        dtype=np.int64,
+    )
+
+    sessions = np.empty((len(calendars), len(values)), dtype=np.int64)
+    found = {}
+    for row, calendar in enumerate(calendars):
+        if calendar not in found:
+            found[calendar] = np.empty(len(values), dtype=np.int64)
+            if len(values) > 0:
+                found[calendar][instant] = calendar.sessions_at(seconds)
+                found[calendar][~instant] = calendar.sessions_on(days)
+        sessions[row] = found[calendar]
+    return sessions